@@ -0,0 +1,386 @@
+"""
+Архив завершенных партий.
+
+Партии записываются в формате PGN в сжатые файлы ARCHIVE_DIR/games-*.pgn.gz
+фоновой задачей: ход партии архив не задерживает. Каждая партия —
+отдельный gzip-член файла, поэтому файл целиком читается как обычный
+PGN (gzip.open, zcat), а одна партия — по смещению из индекса SQLite
+(ARCHIVE_DIR/index.sqlite3) без распаковки соседних. Новый файл
+начинается каждые ARCHIVE_FILE_GAMES партий и каждый день.
+
+Архив включается переменной ARCHIVE_DIR; относительный путь
+переводится в абсолютный при запуске.
+
+Использование из командной строки:
+    python archive.py --game <match_id>          # PGN одной партии
+    python archive.py --date 2026.10.18 --board board1
+    python archive.py --scan                      # сводка по всем файлам
+"""
+import argparse
+import asyncio
+import glob
+import gzip
+import os
+import sqlite3
+import time
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+
+import chess
+import chess.pgn
+from dotenv import load_dotenv
+
+from metrics import ARCHIVED_GAMES, ARCHIVE_WRITE_SECONDS
+
+load_dotenv()
+
+ARCHIVE_DIR = os.getenv("ARCHIVE_DIR", "")  # каталог архива, по умолчанию архив выключен
+ARCHIVE_DIR = os.path.abspath(ARCHIVE_DIR) if ARCHIVE_DIR else ""  # не зависит от смены рабочего каталога
+ARCHIVE_FILE_GAMES = int(os.getenv("ARCHIVE_FILE_GAMES", 1000))  # партий в одном файле
+ARCHIVE_QUEUE_SIZE = int(os.getenv("ARCHIVE_QUEUE_SIZE", 10000))  # партий, ждущих записи
+
+# причина окончания партии → значение заголовка Termination
+TERMINATIONS = {
+    "timeout": "time forfeit",
+    "abandoned": "abandoned",
+    "unterminated": "unterminated"
+}
+
+ArchivedGame = namedtuple(
+    "ArchivedGame",
+    [
+        "match_id", "board", "started", "ended", "white", "black", "result",
+        "termination", "time_control", "moves", "clock_times", "robot_times"
+    ]
+)
+ArchivedGame.__doc__ = """
+Завершенная партия, ожидающая записи в архив.
+
+Поля:
+    match_id (str): идентификатор партии
+    board (str): идентификатор доски
+    started (float | None): time.time() начала партии
+    ended (float): time.time() окончания партии
+    white, black (str): "Player" или "Computer"
+    result (str): "1-0", "0-1", "1/2-1/2" или "*"
+    termination (str): причина окончания (checkmate, timeout, ...)
+    time_control (str): "база+добавка" в секундах или "-"
+    moves (list[str]): ходы в формате UCI от начальной позиции
+    clock_times (dict): номер хода → оставшееся время сходившей стороны
+    robot_times (dict): номер хода → секунды робота на его выполнение
+"""
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS games (
+    match_id TEXT PRIMARY KEY,
+    board TEXT NOT NULL,
+    date TEXT NOT NULL,
+    ended REAL NOT NULL,
+    white TEXT,
+    black TEXT,
+    result TEXT,
+    termination TEXT,
+    plies INTEGER,
+    robot_seconds REAL,
+    file TEXT NOT NULL,
+    offset INTEGER NOT NULL,
+    length INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS games_date ON games (date);
+CREATE INDEX IF NOT EXISTS games_board ON games (board, date);
+"""
+
+COLUMNS = (
+    "match_id", "board", "date", "ended", "white", "black", "result",
+    "termination", "plies", "robot_seconds", "file", "offset", "length"
+)
+
+
+def build_pgn(game):
+    """
+    Собирает PGN партии с временем часов и робота в комментариях ходов.
+
+    Время часов записывается стандартной командой [%clk], время
+    робота — командой [%robot секунды].
+
+    Параметры:
+        game (ArchivedGame): партия
+
+    Возвращает:
+        str: PGN партии, оканчивающийся пустой строкой
+    """
+    pgn = chess.pgn.Game()
+    started = time.gmtime(game.started if game.started is not None else game.ended)
+    pgn.headers["Event"] = "ChessRobot316"
+    pgn.headers["Site"] = game.board
+    pgn.headers["Date"] = time.strftime("%Y.%m.%d", started)
+    pgn.headers["Round"] = "-"
+    pgn.headers["White"] = game.white
+    pgn.headers["Black"] = game.black
+    pgn.headers["Result"] = game.result
+    pgn.headers["UTCDate"] = time.strftime("%Y.%m.%d", started)
+    pgn.headers["UTCTime"] = time.strftime("%H:%M:%S", started)
+    pgn.headers["TimeControl"] = game.time_control
+    pgn.headers["Termination"] = TERMINATIONS.get(game.termination, "normal")
+    pgn.headers["GameId"] = game.match_id
+    pgn.headers["EndReason"] = game.termination
+    pgn.headers["RobotSeconds"] = f"{sum(game.robot_times.values()):.3f}"
+    node = pgn
+    for ply, uci in enumerate(game.moves, 1):
+        node = node.add_variation(chess.Move.from_uci(uci))
+        if ply in game.clock_times:
+            node.set_clock(max(0.0, game.clock_times[ply]))
+        if ply in game.robot_times:
+            node.comment = f"{node.comment} [%robot {game.robot_times[ply]:.3f}]".strip()
+    return str(pgn) + "\n\n"
+
+
+def read_game(directory, file, offset, length):
+    """
+    Читает одну партию из файла архива по смещению из индекса.
+
+    Параметры:
+        directory (str): каталог архива
+        file (str): имя файла
+        offset (int): смещение gzip-члена партии
+        length (int): его длина в байтах
+
+    Возвращает:
+        str: PGN партии
+    """
+    with open(os.path.join(directory, file), "rb") as stream:
+        stream.seek(offset)
+        return gzip.decompress(stream.read(length)).decode("utf-8")
+
+
+def scan(directory=ARCHIVE_DIR):
+    """
+    Последовательно читает все партии архива (для аналитики).
+
+    Параметры:
+        directory (str): каталог архива
+
+    Возвращает:
+        Iterator[chess.pgn.Game]: партии в порядке записи
+    """
+    for path in sorted(glob.glob(os.path.join(directory, "games-*.pgn.gz"))):
+        with gzip.open(path, "rt", encoding="utf-8") as stream:
+            while True:
+                game = chess.pgn.read_game(stream)
+                if game is None:
+                    break
+                yield game
+
+
+class GameArchive:
+    def __init__(self, directory=ARCHIVE_DIR, file_games=ARCHIVE_FILE_GAMES, queue_size=ARCHIVE_QUEUE_SIZE):
+        """
+        Фоновая запись завершенных партий в сжатые PGN-файлы с индексом.
+
+        Файлы и индекс изменяются только в одном потоке архива, поэтому
+        запись не блокирует цикл событий и не требует блокировок.
+        Партии, скопившиеся в очереди, записываются одной пачкой с
+        одной транзакцией индекса.
+
+        Параметры:
+            directory (str): каталог архива (пустая строка — архив выключен)
+            file_games (int): партий в одном файле до начала следующего
+            queue_size (int): наибольшее число партий в очереди записи
+        """
+        self.directory = directory
+        self.file_games = file_games
+        self.queue = asyncio.Queue(queue_size) if directory else None
+        self.thread = ThreadPoolExecutor(max_workers=1, thread_name_prefix="archive")
+        self.writer = None  # задача записи очереди
+        self.index = None  # соединение SQLite (только в потоке архива)
+        self.file = None  # текущий файл архива
+        self.file_name = None
+        self.file_day = None
+        self.file_count = 0  # партий в текущем файле
+
+    def start(self):
+        """Запускает фоновую запись."""
+        if self.queue is not None and self.writer is None:
+            self.writer = asyncio.create_task(self.write_loop())
+
+    async def stop(self):
+        """Дописывает очередь и закрывает файл и индекс."""
+        if self.writer is None:
+            return
+        await self.queue.join()
+        self.writer.cancel()
+        self.writer = None
+        await asyncio.get_running_loop().run_in_executor(self.thread, self.close)
+
+    def submit(self, game):
+        """
+        Ставит партию в очередь записи, не дожидаясь ее.
+
+        Если очередь переполнена, партия не архивируется, чтобы
+        не задерживать сервер.
+
+        Параметры:
+            game (ArchivedGame): партия
+        """
+        if self.queue is None:
+            return
+        self.start()
+        try:
+            self.queue.put_nowait(game)
+        except asyncio.QueueFull:
+            ARCHIVED_GAMES.inc("dropped")
+            print(f"Archive queue is full, game {game.match_id} is not archived")
+
+    async def write_loop(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            games = [await self.queue.get()]
+            while not self.queue.empty():
+                games.append(self.queue.get_nowait())
+            try:
+                with ARCHIVE_WRITE_SECONDS.time():
+                    await loop.run_in_executor(self.thread, self.write, games)
+                ARCHIVED_GAMES.inc("written", value=len(games))
+            except Exception as e:
+                ARCHIVED_GAMES.inc("failed", value=len(games))
+                print(f"Error writing games to archive: {e}")
+            finally:
+                for _ in games:
+                    self.queue.task_done()
+
+    def open_index(self):
+        if self.index is None:
+            os.makedirs(self.directory, exist_ok=True)
+            self.index = sqlite3.connect(os.path.join(self.directory, "index.sqlite3"))
+            self.index.executescript(SCHEMA)
+        return self.index
+
+    def open_file(self, day):
+        """
+        Открывает новый файл архива.
+
+        Параметры:
+            day (str): дата партий файла (ГГГГММДД)
+        """
+        if self.file is not None:
+            self.file.close()
+        stamp = time.strftime("%Y%m%d-%H%M%S")
+        name, number = f"games-{stamp}.pgn.gz", 1
+        while True: # файл создается только один раз, даже если архив пишут несколько процессов
+            try:
+                self.file = open(os.path.join(self.directory, name), "xb")
+                break
+            except FileExistsError:
+                number += 1
+                name = f"games-{stamp}-{number}.pgn.gz"
+        self.file_name = name
+        self.file_day = day
+        self.file_count = 0
+
+    def write(self, games):
+        """
+        Записывает пачку партий и их индекс (выполняется в потоке архива).
+
+        Параметры:
+            games (list[ArchivedGame]): партии
+        """
+        index = self.open_index()
+        rows = []
+        for game in games:
+            day = time.strftime("%Y%m%d", time.gmtime(game.ended))
+            if self.file is None or self.file_count >= self.file_games or day != self.file_day:
+                self.open_file(day)
+            member = gzip.compress(build_pgn(game).encode("utf-8"))
+            offset = self.file.tell()
+            self.file.write(member)
+            self.file_count += 1
+            rows.append((
+                game.match_id,
+                game.board,
+                time.strftime("%Y.%m.%d", time.gmtime(game.ended)),
+                game.ended,
+                game.white,
+                game.black,
+                game.result,
+                game.termination,
+                len(game.moves),
+                round(sum(game.robot_times.values()), 3),
+                self.file_name,
+                offset,
+                len(member)
+            ))
+        self.file.flush()
+        with index:
+            index.executemany(
+                f"INSERT OR REPLACE INTO games ({', '.join(COLUMNS)}) "
+                f"VALUES ({', '.join('?' * len(COLUMNS))})",
+                rows
+            )
+
+    def close(self):
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+        if self.index is not None:
+            self.index.close()
+            self.index = None
+
+    def lookup(self, match_id):
+        index = self.open_index()
+        row = index.execute(
+            "SELECT file, offset, length FROM games WHERE match_id = ?",
+            (match_id,)
+        ).fetchone()
+        if row is None:
+            return None
+        return read_game(self.directory, *row)
+
+    def query(self, date=None, board=None, limit=100):
+        index = self.open_index()
+        conditions, values = [], []
+        if date is not None:
+            conditions.append("date = ?")
+            values.append(date)
+        if board is not None:
+            conditions.append("board = ?")
+            values.append(board)
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+        cursor = index.execute(
+            f"SELECT {', '.join(COLUMNS)} FROM games {where} ORDER BY ended LIMIT ?",
+            (*values, limit)
+        )
+        return [dict(zip(COLUMNS, row)) for row in cursor]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Архив партий")
+    parser.add_argument("--dir", default=ARCHIVE_DIR, help="каталог архива")
+    parser.add_argument("--game", help="вывести PGN партии по идентификатору")
+    parser.add_argument("--date", help="партии за дату ГГГГ.ММ.ДД")
+    parser.add_argument("--board", help="партии доски")
+    parser.add_argument("--scan", action="store_true", help="сводка по всем партиям архива")
+    args = parser.parse_args()
+    if not args.dir:
+        parser.error("archive directory is not set: use --dir or ARCHIVE_DIR")
+    archive = GameArchive(args.dir)
+    if args.game:
+        print(archive.lookup(args.game) or "game not found")
+    elif args.scan:
+        results, plies, total = {}, 0, 0
+        for game in scan(args.dir):
+            total += 1
+            plies += sum(1 for _ in game.mainline_moves())
+            result = game.headers.get("Result", "*")
+            results[result] = results.get(result, 0) + 1
+        print(f"games {total} plies {plies} results {results}")
+    else:
+        for row in archive.query(args.date, args.board, limit=1000):
+            print(
+                f"{row['match_id']} {row['board']} {row['date']} {row['result']} "
+                f"{row['termination']} {row['plies']} plies, robot {row['robot_seconds']} s"
+            )
+    archive.close()
+
+
+if __name__ == "__main__":
+    main()
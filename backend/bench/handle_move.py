@@ -0,0 +1,102 @@
+"""
+Микробенчмарк обработки ходов в WebSocketServer.handle_move.
+
+Робот, Redis и WebSocket-соединения заменены заглушками, поэтому
+измеряется только обработка хода на сервере: проверка, запись в
+журнал, рассылка.
+
+Запуск:
+    python bench/handle_move.py --games 200 --plies 60
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import chess
+
+from game import Session
+from server import WebSocketServer
+
+
+class StubRobot:
+    connected = True
+
+    def submit_batch(self, messages, timeout=None):
+        future = asyncio.get_running_loop().create_future()
+        future.set_result(["OK"] * len(messages))
+        return future
+
+
+class StubStore:
+    async def save_move(self, session, records):
+        session.log_length += len(records)
+
+
+class StubWebSocket:
+    async def send(self, message):
+        pass
+
+
+def random_games(games, plies, seed):
+    """Заранее генерирует партии из случайных легальных ходов."""
+    rnd = random.Random(seed)
+    result = []
+    for _ in range(games):
+        board = chess.Board()
+        moves = []
+        for _ in range(plies):
+            legal = [move for move in board.legal_moves if not move.promotion]
+            if not legal or board.is_game_over():
+                break
+            move = rnd.choice(legal)
+            board.push(move)
+            if board.is_game_over(): # законченная партия закрывала бы сессию заглушек
+                break
+            moves.append(move.uci())
+        result.append(moves)
+    return result
+
+
+async def main(games, plies, seed):
+    server = WebSocketServer(redis_conn=object())
+    server.store = StubStore()
+    scripts = random_games(games, plies, seed)
+
+    total = 0
+    started = time.perf_counter()
+    for moves in scripts:
+        session = Session("bench")
+        session.robot_conn = StubRobot()
+        session.add_player(StubWebSocket())
+        session.add_player(StubWebSocket())
+        for uci in moves:
+            await server.handle_move(
+                {"type": "make_move", "data": {"pos_start": uci[:2], "pos_end": uci[2:4]}},
+                session.players[session.current_player].websocket,
+                session
+            )
+        total += len(moves)
+    elapsed = time.perf_counter() - started
+
+    print(json.dumps({
+        "games": games,
+        "moves": total,
+        "seconds": round(elapsed, 3),
+        "moves_per_second": round(total / elapsed),
+        "us_per_move": round(1e6 * elapsed / total, 1)
+    }))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--games", type=int, default=200)
+    parser.add_argument("--plies", type=int, default=60)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+    asyncio.run(main(args.games, args.plies, args.seed))
@@ -0,0 +1,74 @@
+"""
+Замер процессорного времени сервера на простаивающих соединениях.
+
+Открывает N соединений (по одному игроку на доску, игра не начинается)
+и измеряет процессорное время процесса за интервал простоя. Партии
+загружаются из Redis в памяти (fakeredis).
+
+Запуск:
+    python bench/idle_cpu.py --connections 200 --seconds 10
+
+Требуется пакет fakeredis (pip install fakeredis).
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import websockets
+
+
+async def main(connections, seconds):
+    os.environ["ROBOT_ENDPOINTS"] = ",".join(
+        f"bench{i}=127.0.0.1:1" for i in range(connections)
+    )
+    import fakeredis.aioredis
+    from redis_conn import RedisConnector
+    from server import WebSocketServer
+
+    ws_server = WebSocketServer(
+        redis_conn=RedisConnector(client=fakeredis.aioredis.FakeRedis())
+    )
+    async with websockets.serve(ws_server.handle_client, "127.0.0.1", 0) as server:
+        port = server.sockets[0].getsockname()[1]
+        clients = [
+            await websockets.connect(f"ws://127.0.0.1:{port}/bench{i}")
+            for i in range(connections)
+        ]
+        await asyncio.sleep(0.5)
+
+        cpu_start = time.process_time()
+        wall_start = time.perf_counter()
+        await asyncio.sleep(seconds)
+        cpu = time.process_time() - cpu_start
+        wall = time.perf_counter() - wall_start
+
+        print(json.dumps({
+            "connections": connections,
+            "seconds": round(wall, 3),
+            "cpu_seconds": round(cpu, 4),
+            "cpu_percent": round(100 * cpu / wall, 2),
+            "cpu_ms_per_connection_per_second": round(
+                1000 * cpu / wall / connections, 4
+            )
+        }), flush=True)
+
+        await asyncio.gather(*(client.close() for client in clients))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--connections", type=int, default=200)
+    parser.add_argument("--seconds", type=float, default=10)
+    args = parser.parse_args()
+
+    try:
+        import fakeredis  # noqa: F401
+    except ImportError:
+        sys.exit("bench/idle_cpu.py requires fakeredis: pip install fakeredis")
+
+    asyncio.run(main(args.connections, args.seconds))
@@ -0,0 +1,308 @@
+"""
+Нагрузочный замер сервера от подключения до ответа робота.
+
+В отдельном процессе запускается WebSocketServer.run с Redis в памяти
+(fakeredis) и симуляторами роботов (tcp_server.py), по одному на доску.
+Клиенты играют N партий одновременно через протокол make_move /
+get_board_state и измеряют время от отправки хода до получения
+обновления, время подключения и прирост памяти процесса сервера.
+Результат выводится одной строкой JSON.
+
+Запуск:
+    python bench/load.py --games 50 --plies 40
+    python bench/load.py --games 50 --robot-latency uniform:0,0.01 --output result.json
+    python bench/load.py --games 50 --compare result.json --tolerance 0.2
+
+С --compare процесс завершается с кодом 1, если p99 задержки хода или
+ходы в секунду хуже сохраненного результата больше чем на tolerance.
+
+Требуется пакет fakeredis (pip install fakeredis).
+"""
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import random
+import socket
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import chess
+import websockets
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def percentile(values, fraction):
+    if not values:
+        return None
+    values = sorted(values)
+    return values[min(len(values) - 1, int(fraction * len(values)))]
+
+
+def rss_kb(pid):
+    """Возвращает резидентную память процесса в КБ (Linux) или None."""
+    try:
+        with open(f"/proc/{pid}/status") as status:
+            for line in status:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1])
+    except OSError:
+        return None
+    return None
+
+
+def run_server(port, games, robot_latency, ready):
+    """Процесс сервера: симуляторы роботов, Redis в памяти и WebSocketServer.run."""
+    sys.stdout = open(os.devnull, "w")
+
+    async def main():
+        import fakeredis.aioredis
+        import tcp_server
+        from redis_conn import RedisConnector
+        from server import WebSocketServer
+        from session_registry import SessionRegistry
+
+        robots = await tcp_server.serve([0] * games, robot_latency)
+        ws_server = WebSocketServer(
+            redis_conn=RedisConnector(client=fakeredis.aioredis.FakeRedis()),
+            sessions=SessionRegistry({
+                f"load{index}": ("127.0.0.1", robot.port)
+                for index, robot in enumerate(robots)
+            })
+        )
+        asyncio.get_running_loop().call_soon(ready.set)
+        await ws_server.run("127.0.0.1", port)
+
+    asyncio.run(main())
+
+
+def load_scripts(path):
+    """Читает партии из файла: одна партия в строке, ходы UCI через пробел."""
+    with open(path) as source:
+        return [line.split() for line in source if line.strip()]
+
+
+def random_script(rnd, plies):
+    board = chess.Board()
+    moves = []
+    for _ in range(plies):
+        legal = list(board.legal_moves)
+        if not legal or board.is_game_over():
+            break
+        move = rnd.choice(legal)
+        board.push(move)
+        moves.append(move.uci())
+    return moves
+
+
+class GameStats:
+    def __init__(self):
+        self.connect = []  # секунды на подключение
+        self.move = []  # секунды от make_move до обновления у игрока
+        self.board_state = []  # секунды от get_board_state до ответа
+        self.moves = 0
+        self.errors = 0
+
+
+async def receive(websocket, types):
+    """Ждет сообщение одного из типов, ошибка сервера возвращается как есть."""
+    while True:
+        message = json.loads(await websocket.recv())
+        if message.get("type") in types or message.get("type") == "error":
+            return message
+
+
+async def play(url, script, state_every, stats, connected):
+    players = []
+    try:
+        for _ in range(2):
+            start = time.perf_counter()
+            players.append(await websockets.connect(url, max_queue=None))
+            stats.connect.append(time.perf_counter() - start)
+        for player in players:
+            await receive(player, ("init_game",))
+        connected.set_result(None)
+
+        for ply, uci in enumerate(script):
+            move = chess.Move.from_uci(uci)
+            mover, other = players[ply % 2], players[1 - ply % 2]
+            start = time.perf_counter()
+            await mover.send(json.dumps({
+                "type": "make_move",
+                "data": {
+                    "pos_start": chess.square_name(move.from_square),
+                    "pos_end": chess.square_name(move.to_square),
+                    "promotion": chess.piece_symbol(move.promotion) if move.promotion else None
+                }
+            }))
+            reply = await receive(mover, ("update_game_state", "move"))
+            if reply["type"] == "error":
+                stats.errors += 1
+                return
+            stats.move.append(time.perf_counter() - start)
+            stats.moves += 1
+            await receive(other, ("update_game_state", "move"))
+
+            if state_every and (ply + 1) % state_every == 0:
+                start = time.perf_counter()
+                await other.send(json.dumps({"type": "get_board_state"}))
+                await receive(other, ("board_state",))
+                stats.board_state.append(time.perf_counter() - start)
+    finally:
+        if not connected.done():
+            connected.set_result(None)
+        for player in players:
+            await player.close()
+
+
+async def run_clients(port, server_pid, scripts, state_every, delta):
+    stats = GameStats()
+    query = "?updates=delta" if delta else ""
+    rss_before = rss_kb(server_pid)
+    connected = [asyncio.get_running_loop().create_future() for _ in scripts]
+
+    start = time.perf_counter()
+    games = [
+        asyncio.create_task(play(
+            f"ws://127.0.0.1:{port}/load{index}{query}",
+            script,
+            state_every,
+            stats,
+            connected[index]
+        ))
+        for index, script in enumerate(scripts)
+    ]
+    await asyncio.gather(*connected)
+    rss_sessions = rss_kb(server_pid)
+    await asyncio.gather(*games)
+    seconds = time.perf_counter() - start
+    rss_after = rss_kb(server_pid)
+
+    def ms(value):
+        return None if value is None else round(value * 1000, 3)
+
+    result = {
+        "games": len(scripts),
+        "moves": stats.moves,
+        "errors": stats.errors,
+        "seconds": round(seconds, 3),
+        "moves_per_second": round(stats.moves / seconds, 1),
+        "move_latency_ms": {
+            "p50": ms(percentile(stats.move, 0.5)),
+            "p99": ms(percentile(stats.move, 0.99)),
+            "max": ms(max(stats.move, default=None))
+        },
+        "board_state_latency_ms": {
+            "p50": ms(percentile(stats.board_state, 0.5)),
+            "p99": ms(percentile(stats.board_state, 0.99))
+        },
+        "connect_ms": {
+            "p50": ms(percentile(stats.connect, 0.5)),
+            "p99": ms(percentile(stats.connect, 0.99))
+        },
+        "server_rss_kb": {
+            "idle": rss_before,
+            "sessions": rss_sessions,
+            "after": rss_after
+        },
+        "rss_kb_per_session": (
+            round((rss_sessions - rss_before) / len(scripts), 1)
+            if rss_before is not None and rss_sessions is not None else None
+        )
+    }
+    return result
+
+
+def compare(result, baseline, tolerance):
+    """Возвращает список ухудшений относительно сохраненного результата."""
+    regressions = []
+    p99, base_p99 = result["move_latency_ms"]["p99"], baseline["move_latency_ms"]["p99"]
+    if p99 is not None and base_p99 and p99 > base_p99 * (1 + tolerance):
+        regressions.append(f"move p99 {p99} ms > {base_p99} ms")
+    rate, base_rate = result["moves_per_second"], baseline["moves_per_second"]
+    if rate < base_rate * (1 - tolerance):
+        regressions.append(f"moves/s {rate} < {base_rate}")
+    if result["errors"] > baseline["errors"]:
+        regressions.append(f"errors {result['errors']} > {baseline['errors']}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--games", type=int, default=20)
+    parser.add_argument("--plies", type=int, default=40)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--script", help="файл с партиями: ходы UCI через пробел, партия в строке")
+    parser.add_argument("--state-every", type=int, default=10, help="get_board_state каждые N ходов, 0 — нет")
+    parser.add_argument("--robot-latency", default="const:0")
+    parser.add_argument("--delta", action="store_true", help="клиенты подключаются с updates=delta")
+    parser.add_argument("--output", help="сохранить результат в файл")
+    parser.add_argument("--compare", help="сравнить с сохраненным результатом")
+    parser.add_argument("--tolerance", type=float, default=0.2)
+    args = parser.parse_args()
+
+    try:
+        import fakeredis  # noqa: F401
+    except ImportError:
+        sys.exit("bench/load.py requires fakeredis: pip install fakeredis")
+
+    if args.script:
+        scripts = load_scripts(args.script)
+        scripts = [scripts[index % len(scripts)] for index in range(args.games)]
+    else:
+        rnd = random.Random(args.seed)
+        scripts = [random_script(rnd, args.plies) for _ in range(args.games)]
+
+    port = free_port()
+    ready = multiprocessing.Event()
+    server = multiprocessing.Process(
+        target=run_server,
+        args=(port, len(scripts), args.robot_latency, ready),
+        daemon=True
+    )
+    server.start()
+    try:
+        if not ready.wait(30):
+            sys.exit("server did not start")
+        result = asyncio.run(
+            wait_and_run(port, server.pid, scripts, args.state_every, args.delta)
+        )
+    finally:
+        server.terminate()
+        server.join()
+
+    print(json.dumps(result), flush=True)
+    if args.output:
+        with open(args.output, "w") as output:
+            json.dump(result, output, indent=2)
+    if args.compare:
+        with open(args.compare) as source:
+            regressions = compare(result, json.load(source), args.tolerance)
+        for regression in regressions:
+            print(f"REGRESSION: {regression}", file=sys.stderr)
+        if regressions:
+            sys.exit(1)
+
+
+async def wait_and_run(port, server_pid, scripts, state_every, delta):
+    # сервер начинает слушать порт чуть позже сигнала готовности
+    for _ in range(100):
+        try:
+            await (await websockets.connect(f"ws://127.0.0.1:{port}/load0")).close()
+            break
+        except OSError:
+            await asyncio.sleep(0.05)
+    await asyncio.sleep(0.2)  # сессия проверочного подключения освобождается
+    return await run_clients(port, server_pid, scripts, state_every, delta)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,622 @@
+"""
+Несколько процессов сервера с общими партиями.
+
+Каждой доской и лобби владеет ровно один процесс — тот, кто держит ее
+аренду в Redis (SET NX PX, продлевается каждые LEASE_TTL/3 секунды).
+Только владелец подключается к роботу доски и ведет ее сессию: ходы,
+часы, возврат доски. Процесс, к которому подключился клиент чужой
+доски, пересылает сообщения клиента владельцу через канал доски
+(Redis pub/sub), а владелец отвечает через канал этого процесса. У
+владельца такое соединение представлено RemoteWebSocket и
+обрабатывается тем же кодом, что и локальное, поэтому игроки и
+зрители разных процессов видят ходы друг друга, а процессов WebSocket
+может быть больше, чем роботов.
+
+Партии хранятся в Redis (GameStore): если владелец доски пропал, ее
+аренду берет другой процесс, и игроки возвращаются в партию по токену.
+"""
+import asyncio
+import json
+import os
+import socket
+import uuid
+from types import SimpleNamespace
+from urllib.parse import urlsplit, parse_qsl, urlencode
+
+import websockets
+from dotenv import load_dotenv
+
+from metrics import OWNED_ROUTES, RELAYED_CONNECTIONS
+from redis_conn import KEY_PREFIX
+from session_registry import POOL_GAME_ID
+
+load_dotenv()
+
+CLUSTER = os.getenv("CLUSTER", "0") == "1"  # несколько процессов сервера с общим Redis
+LEASE_TTL = float(os.getenv("LEASE_TTL", 10))  # секунды, через которые аренда без продления истекает
+CLUSTER_CONNECT_TIMEOUT = float(os.getenv("CLUSTER_CONNECT_TIMEOUT", 15))  # секунды ожидания владельца доски
+RELAY_BUFFER_LIMIT = int(os.getenv("RELAY_BUFFER_LIMIT", 1024 * 1024))  # байт неотправленных данных клиента чужой доски
+PUBLISH_BATCH = 100  # публикаций в одном запросе Redis
+LEASE_MARGIN = LEASE_TTL / 5  # секунды до истечения аренды, когда процесс сам отдает доски
+
+CLUSTER_CHANNEL = f"{KEY_PREFIX}:cluster"  # сообщения всем процессам
+
+
+def lease_key(route):
+    return f"{KEY_PREFIX}:lease:{route}"
+
+
+def worker_key(worker_id):
+    return f"{KEY_PREFIX}:worker:{worker_id}"
+
+
+def route_channel(route):
+    """Канал, из которого владелец доски (или лобби) получает сообщения клиентов."""
+    return f"{KEY_PREFIX}:route:{route}"
+
+
+def worker_channel(worker_id):
+    """Канал, из которого процесс получает сообщения для своих клиентов."""
+    return f"{KEY_PREFIX}:inbox:{worker_id}"
+
+
+def route_path(path, route):
+    """
+    Возвращает путь подключения к другой доске с теми же параметрами.
+
+    Пример:
+        ("/board1?color=w", "any") → "/any?color=w"
+
+    Параметры:
+        path (str): путь запроса клиента
+        route (str): доска или POOL_GAME_ID
+
+    Возвращает:
+        str: путь запроса
+    """
+    query = [(name, value) for name, value in parse_qsl(urlsplit(path).query) if name != "game"]
+    return f"/{route}" + (f"?{urlencode(query)}" if query else "")
+
+
+def fan_out(connections, data):
+    """
+    Пишет сообщение в соединения без ожидания отправки, как
+    websockets.broadcast. Клиентам других процессов сообщение уходит
+    одной публикацией на процесс.
+
+    Параметры:
+        connections (Iterable): соединения (WebSocket или RemoteWebSocket)
+        data (str): сообщение в формате JSON
+    """
+    local = []
+    remote = {}  # процесс → (кластер, идентификаторы соединений)
+    for connection in connections:
+        if isinstance(connection, RemoteWebSocket):
+            if connection.state is websockets.protocol.State.OPEN:
+                remote.setdefault(connection.worker, (connection.cluster, []))[1].append(connection.conn_id)
+        else:
+            local.append(connection)
+    websockets.broadcast(local, data)
+    for worker, (cluster, conn_ids) in remote.items():
+        cluster.post(worker_channel(worker), {"type": "send", "conns": conn_ids, "data": data})
+
+
+class RemoteWebSocket:
+    def __init__(self, cluster, worker, conn_id, route, path, seat=None):
+        """
+        Соединение клиента, подключенного к другому процессу сервера.
+
+        Владелец доски обрабатывает его так же, как локальное: сообщения
+        клиента приходят из канала доски, отправленные данные уходят в
+        канал процесса клиента без ожидания доставки (скорость отправки
+        ограничивает процесс клиента, RELAY_BUFFER_LIMIT).
+
+        Параметры:
+            cluster (Cluster): кластер процесса-владельца
+            worker (str): процесс, к которому подключен клиент
+            conn_id (str): идентификатор соединения
+            route (str): доска или POOL_GAME_ID
+            path (str): путь запроса клиента
+            seat (str | None): цвет ("w" или "b"), если место за доской
+                выдано лобби другого процесса
+        """
+        self.cluster = cluster
+        self.worker = worker
+        self.conn_id = conn_id
+        self.route = route
+        self.request = SimpleNamespace(path=path)
+        self.seat = seat
+        self.transport = self  # данные не копятся в буфере владельца
+        self.state = websockets.protocol.State.OPEN
+        self.messages = asyncio.Queue()  # сообщения клиента, None — соединение закрыто
+        self.closed = asyncio.get_running_loop().create_future()
+
+    async def send(self, data):
+        if self.state is not websockets.protocol.State.OPEN:
+            raise websockets.ConnectionClosed(None, None)
+        fan_out([self], data)
+
+    async def close(self, code=1000, reason=""):
+        if self.state is websockets.protocol.State.OPEN:
+            self.cluster.post(
+                worker_channel(self.worker),
+                {"type": "close", "conn": self.conn_id, "code": code, "reason": reason}
+            )
+        self.disconnected()
+
+    def abort(self):
+        asyncio.ensure_future(self.close(1008, "Too slow"))
+
+    def redirect(self, route, path, seat=None):
+        """
+        Передает соединение владельцу другой доски (или лобби) без
+        закрытия: процесс клиента подключает его заново.
+
+        Параметры:
+            route (str): доска или POOL_GAME_ID
+            path (str): путь запроса для нового владельца
+            seat (str | None): цвет места, выданного лобби
+        """
+        if self.state is websockets.protocol.State.OPEN:
+            self.cluster.post(
+                worker_channel(self.worker),
+                {"type": "redirect", "conn": self.conn_id, "route": route, "path": path, "seat": seat}
+            )
+        self.disconnected()
+
+    def disconnected(self):
+        """Отмечает соединение закрытым: обработчик клиента завершается."""
+        if self.state is not websockets.protocol.State.OPEN:
+            return
+        self.state = websockets.protocol.State.CLOSED
+        self.messages.put_nowait(None)
+        self.closed.set_result(None)
+        self.cluster.remotes.pop(self.conn_id, None)
+        RELAYED_CONNECTIONS.set(len(self.cluster.remotes), "in")
+
+    async def wait_closed(self):
+        await asyncio.shield(self.closed)
+
+    def get_write_buffer_size(self):
+        return 0
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        data = await self.messages.get()
+        if data is None:
+            raise StopAsyncIteration
+        return data
+
+
+class Relay:
+    def __init__(self, websocket, route):
+        """
+        Локальный клиент, подключенный к доске другого процесса.
+
+        Параметры:
+            websocket (WebSocket): соединение клиента
+            route (str): доска или POOL_GAME_ID
+        """
+        self.websocket = websocket
+        self.route = route
+        self.owner = None  # процесс, принявший соединение
+        self.ready = asyncio.Event()  # владелец принял соединение
+
+
+class Cluster:
+    def __init__(self, server, worker_id=None):
+        """
+        Связь процесса сервера с остальными процессами через Redis.
+
+        Процесс пытается взять в аренду все доски и лобби; доски,
+        аренда которых занята, обслуживают их владельцы. Сообщения в
+        Redis публикуются одной очередью (outbox) по порядку, пачками.
+
+        Параметры:
+            server (WebSocketServer): сервер процесса
+            worker_id (str | None): имя процесса, по умолчанию хост-pid-случайный суффикс
+        """
+        self.server = server
+        self.redis_conn = server.redis_conn
+        self.sessions = server.sessions
+        self.worker_id = worker_id or f"{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:6]}"
+        self.routes = [*self.sessions.endpoints, POOL_GAME_ID]  # доски и лобби
+        self.owned = set()  # доски и лобби, аренду которых держит процесс
+        self.remotes = {}  # соединение → RemoteWebSocket клиента другого процесса
+        self.relays = {}  # соединение → Relay локального клиента доски другого процесса
+        self.outbox = asyncio.Queue()  # (канал, сообщение JSON) для публикации
+        self.pubsub = None
+        self.tasks = []
+        self.expiry = None  # loop.call_at: аренды истекают, если не продлены
+        self.sessions.pool.owned = set()  # роботами управляет только владелец доски
+        self.sessions.pool.listeners.append(self.announce_boards)
+
+    async def start(self):
+        """Подписывается на каналы процесса и берет свободные аренды."""
+        self.pubsub = await self.redis_conn.pubsub()
+        await self.pubsub.subscribe(worker_channel(self.worker_id), CLUSTER_CHANNEL)
+        self.tasks = [
+            asyncio.create_task(self.publish_loop()),
+            asyncio.create_task(self.listen_loop()),
+            asyncio.create_task(self.lease_loop())
+        ]
+        print(f"Cluster worker {self.worker_id} started")
+
+    async def stop(self):
+        """Отдает аренды (другие процессы берут их сразу) и останавливает задачи."""
+        for route in list(self.owned):
+            await self.lose(route)
+            await self.redis_conn.execute_if_equal(
+                lease_key(route), self.worker_id, "DEL", lease_key(route)
+            )
+        await self.redis_conn.execute("DEL", worker_key(self.worker_id))
+        if self.expiry is not None:
+            self.expiry.cancel()
+            self.expiry = None
+        for task in self.tasks:
+            task.cancel()
+        self.tasks = []
+        pubsub, self.pubsub = self.pubsub, None
+        if pubsub is not None:
+            await pubsub.aclose()
+
+    def post(self, channel, message):
+        """
+        Ставит сообщение в очередь публикации.
+
+        Параметры:
+            channel (str): канал Redis
+            message (dict): сообщение
+        """
+        self.outbox.put_nowait((channel, json.dumps(message)))
+
+    async def publish_loop(self):
+        """Публикует очередь сообщений по порядку, пачками до PUBLISH_BATCH."""
+        while True:
+            batch = [await self.outbox.get()]
+            while not self.outbox.empty() and len(batch) < PUBLISH_BATCH:
+                batch.append(self.outbox.get_nowait())
+            try:
+                await self.redis_conn.execute_batch(
+                    [("PUBLISH", channel, data) for channel, data in batch],
+                    transaction=False
+                )
+            except Exception as e:
+                print(f"Cluster publish failed, {len(batch)} messages lost: {e}")
+
+    async def listen_loop(self):
+        """Разбирает сообщения подписанных каналов по порядку."""
+        while self.pubsub is not None:
+            try:
+                message = await self.pubsub.get_message(ignore_subscribe_messages=True, timeout=1)
+            except Exception as e:
+                if self.pubsub is None: # процесс останавливается
+                    return
+                print(f"Cluster subscription failed: {e}")
+                await asyncio.sleep(1)
+                continue
+            if message is None:
+                continue
+            try:
+                self.handle(message["channel"].decode(), json.loads(message["data"]))
+            except Exception as e:
+                print(f"Cluster message failed: {e}")
+
+    def handle(self, channel, message):
+        """
+        Обрабатывает сообщение другого процесса.
+
+        Параметры:
+            channel (str): канал Redis
+            message (dict): сообщение
+        """
+        action = message["type"]
+        if channel == CLUSTER_CHANNEL:
+            if action == "announce": # лобби сменило владельца
+                self.announce_boards()
+        elif channel == worker_channel(self.worker_id):
+            self.handle_relayed(action, message)
+        else:
+            self.handle_owned(channel[len(route_channel("")):], action, message)
+
+    def handle_owned(self, route, action, message):
+        """
+        Сообщение клиента доски (или лобби), которой владеет процесс.
+
+        Параметры:
+            route (str): доска или POOL_GAME_ID
+            action (str): connect, message, close или boards
+            message (dict): сообщение
+        """
+        if route not in self.owned:
+            return
+        if action == "connect":
+            remote = RemoteWebSocket(
+                self, message["worker"], message["conn"], route, message["path"], message.get("seat")
+            )
+            self.remotes[remote.conn_id] = remote
+            RELAYED_CONNECTIONS.set(len(self.remotes), "in")
+            self.server.spawn(self.server.handle_client(remote))
+        elif action == "message":
+            remote = self.remotes.get(message["conn"])
+            if remote is not None:
+                remote.messages.put_nowait(message["data"])
+        elif action == "close":
+            remote = self.remotes.get(message["conn"])
+            if remote is not None:
+                remote.disconnected()
+        elif action == "boards" and route == POOL_GAME_ID:
+            worker = message["worker"]
+            if worker == self.worker_id: # отправлено, пока лобби было у другого процесса
+                return
+            for game_id in [game_id for game_id, owner in self.sessions.remote_boards.items() if owner == worker]:
+                del self.sessions.remote_boards[game_id]
+            for game_id in message["free"]:
+                self.sessions.remote_boards[game_id] = worker
+            self.server.lobby.assign_boards()
+
+    def handle_relayed(self, action, message):
+        """
+        Сообщение владельца доски для локальных клиентов.
+
+        Параметры:
+            action (str): send, close или redirect
+            message (dict): сообщение
+        """
+        if action == "send":
+            targets = []
+            for conn_id in message["conns"]:
+                relay = self.relays.get(conn_id)
+                if relay is None:
+                    continue
+                if relay.websocket.transport.get_write_buffer_size() > RELAY_BUFFER_LIMIT:
+                    print(f"Dropping slow client of board {relay.route}")
+                    relay.websocket.transport.abort()
+                    continue
+                targets.append(relay.websocket)
+            websockets.broadcast(targets, message["data"])
+            return
+        relay = self.relays.get(message["conn"])
+        if relay is None:
+            return
+        if action == "close":
+            relay.owner = None  # владелец уже забыл соединение
+            self.server.spawn(relay.websocket.close(message["code"], message["reason"]))
+        elif action == "redirect":
+            self.server.spawn(self.reroute(
+                message["conn"], relay, message["route"], message["path"], message["seat"]
+            ))
+
+    def owns(self, route):
+        return route in self.owned
+
+    async def redirect(self, websocket, route, path, seat=None):
+        """
+        Передает клиента владельцу другой доски (или лобби).
+
+        Соединение клиента другого процесса передается этому процессу,
+        локальное соединение пересылается, пока клиент не отключится.
+
+        Параметры:
+            websocket (WebSocket | RemoteWebSocket): соединение клиента
+            route (str): доска или POOL_GAME_ID
+            path (str): путь запроса для нового владельца
+            seat (str | None): цвет места, выданного лобби
+        """
+        if isinstance(websocket, RemoteWebSocket):
+            websocket.redirect(route, path, seat)
+        else:
+            await self.relay(websocket, route, path, seat)
+
+    async def relay(self, websocket, route, path=None, seat=None):
+        """
+        Пересылает сообщения локального клиента владельцу доски, пока
+        соединение открыто.
+
+        Параметры:
+            websocket (WebSocket): соединение клиента
+            route (str): доска или POOL_GAME_ID
+            path (str | None): путь запроса, по умолчанию путь клиента
+            seat (str | None): цвет места, выданного лобби
+        """
+        if isinstance(websocket, RemoteWebSocket): # аренда сменилась, пока соединение шло к владельцу
+            await websocket.close(1012, "Board moved")
+            return
+        conn_id = uuid.uuid4().hex
+        relay = Relay(websocket, route)
+        self.relays[conn_id] = relay
+        RELAYED_CONNECTIONS.set(len(self.relays), "out")
+        try:
+            if not await self.connect(conn_id, relay, path or websocket.request.path, seat):
+                await websocket.send(json.dumps({"message": "board unavailable"}))
+                return
+            async for raw_message in websocket:
+                if isinstance(raw_message, bytes):
+                    # бинарный кадр пересылается текстом: JSON в UTF-8 разберет владелец,
+                    # остальное он отклонит как "Invalid JSON", как и локальное соединение
+                    raw_message = raw_message.decode("utf-8", "replace")
+                await relay.ready.wait()
+                self.post(
+                    route_channel(relay.route),
+                    {"type": "message", "conn": conn_id, "data": raw_message}
+                )
+        except websockets.ConnectionClosed:
+            pass
+        finally:
+            del self.relays[conn_id]
+            RELAYED_CONNECTIONS.set(len(self.relays), "out")
+            if relay.owner is not None:
+                self.post(route_channel(relay.route), {"type": "close", "conn": conn_id})
+
+    async def connect(self, conn_id, relay, path, seat):
+        """
+        Сообщает владельцу доски о новом клиенте.
+
+        Пока аренда доски свободна (владелец перезапускается), попытка
+        повторяется раз в секунду до CLUSTER_CONNECT_TIMEOUT.
+
+        Возвращает:
+            bool: True если владелец получил соединение
+        """
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + CLUSTER_CONNECT_TIMEOUT
+        message = json.dumps({
+            "type": "connect",
+            "conn": conn_id,
+            "worker": self.worker_id,
+            "path": path,
+            "seat": seat
+        })
+        while True:
+            owner = await self.redis_conn.execute("GET", lease_key(relay.route))
+            # число получателей показывает, подписан ли владелец на канал доски
+            if owner is not None and await self.redis_conn.execute(
+                "PUBLISH", route_channel(relay.route), message
+            ):
+                relay.owner = owner.decode()
+                relay.ready.set()
+                return True
+            if loop.time() >= deadline:
+                print(f"Board {relay.route} has no owner")
+                return False
+            await asyncio.sleep(1)
+
+    async def reroute(self, conn_id, relay, route, path, seat):
+        """Подключает пересылаемого клиента к владельцу другой доски."""
+        relay.ready.clear()
+        relay.route, relay.owner = route, None
+        if not await self.connect(conn_id, relay, path, seat):
+            await relay.websocket.close(1013, "Board unavailable")
+
+    def announce_boards(self):
+        """
+        Сообщает владельцу лобби свободные доски процесса
+        (подписчик RobotPool.notify).
+        """
+        if not self.tasks or POOL_GAME_ID in self.owned: # лобби этого процесса видит доски само
+            return
+        self.post(route_channel(POOL_GAME_ID), {
+            "type": "boards",
+            "worker": self.worker_id,
+            "free": [
+                game_id for game_id in self.sessions.endpoints
+                if game_id in self.owned and self.sessions.is_free(game_id)
+            ]
+        })
+
+    async def lease_loop(self):
+        """
+        Продлевает и берет аренды, проверяет соединения с другими процессами.
+
+        После каждого продления ставится локальный таймер на момент за
+        LEASE_MARGIN секунд до истечения аренд: если следующее продление
+        не успело (Redis недоступен или отвечает медленно), процесс сам
+        отдает доски раньше, чем их возьмет другой процесс.
+        """
+        loop = asyncio.get_running_loop()
+        while True:
+            started = loop.time()  # аренды продлены не раньше этого момента
+            try:
+                await self.renew()
+                if self.expiry is not None:
+                    self.expiry.cancel()
+                self.expiry = loop.call_at(started + LEASE_TTL - LEASE_MARGIN, self.expire)
+                await self.check_connections()
+            except Exception as e:
+                print(f"Cluster lease renewal failed: {e}")
+            await asyncio.sleep(LEASE_TTL / 3)
+
+    def expire(self):
+        """Отдает все доски, аренды которых не продлены вовремя (вызывается таймером)."""
+        self.expiry = None
+        if self.owned:
+            print(f"Worker {self.worker_id} could not renew its leases in time")
+        for route in list(self.owned):
+            self.server.spawn(self.lose(route))
+
+    async def renew(self):
+        """Продлевает свои аренды и берет свободные."""
+        ttl = int(LEASE_TTL * 1000)
+        await self.redis_conn.execute("SET", worker_key(self.worker_id), 1, "PX", ttl)
+        for route in self.routes:
+            key = lease_key(route)
+            if route in self.owned:
+                if not await self.redis_conn.execute_if_equal(key, self.worker_id, "PEXPIRE", key, ttl):
+                    await self.lose(route)
+            elif await self.redis_conn.execute("SET", key, self.worker_id, "NX", "PX", ttl):
+                await self.acquire(route)
+
+    async def acquire(self, route):
+        """
+        Начинает обслуживать доску (или лобби), аренда которой получена.
+
+        Параметры:
+            route (str): доска или POOL_GAME_ID
+        """
+        self.owned.add(route)
+        OWNED_ROUTES.set(len(self.owned))
+        await self.pubsub.subscribe(route_channel(route))
+        print(f"Worker {self.worker_id} owns {route}")
+        if route == POOL_GAME_ID: # остальные процессы сообщат свободные доски
+            self.post(CLUSTER_CHANNEL, {"type": "announce"})
+        else:
+            self.sessions.pool.own(route)
+
+    async def lose(self, route):
+        """
+        Перестает обслуживать доску (или лобби), аренда которой потеряна.
+
+        Клиенты закрываются с кодом 1012 и переподключаются к новому
+        владельцу, партия остается в Redis.
+
+        Параметры:
+            route (str): доска или POOL_GAME_ID
+        """
+        if route not in self.owned:
+            return
+        self.owned.discard(route)
+        OWNED_ROUTES.set(len(self.owned))
+        print(f"Worker {self.worker_id} lost {route}")
+        # сначала робот и клиенты: отписка идет через Redis, который может не отвечать
+        for remote in [remote for remote in self.remotes.values() if remote.route == route]:
+            await remote.close(1012, "Board moved")
+        await self.server.release_board(route)
+        try:
+            await self.pubsub.unsubscribe(route_channel(route))
+        except Exception as e:
+            print(f"Cluster unsubscribe failed: {e}")
+
+    async def check_connections(self):
+        """
+        Закрывает соединения, другой конец которых пропал.
+
+        Локальный клиент чужой доски закрывается с кодом 1012, если
+        аренда доски перешла к другому процессу; клиент другого
+        процесса отключается, если этот процесс перестал продлевать
+        свою запись. Свободные доски пропавших процессов забываются.
+        """
+        relays = [relay for relay in self.relays.values() if relay.owner is not None]
+        if relays:
+            owners = await self.redis_conn.execute("MGET", *[lease_key(relay.route) for relay in relays])
+            for relay, owner in zip(relays, owners):
+                if owner is None or owner.decode() != relay.owner:
+                    relay.owner = None
+                    self.server.spawn(relay.websocket.close(1012, "Board moved"))
+        workers = (
+            {remote.worker for remote in self.remotes.values()}
+            | set(self.sessions.remote_boards.values())
+        ) - {self.worker_id}
+        if not workers:
+            return
+        workers = sorted(workers)
+        alive = await self.redis_conn.execute("MGET", *[worker_key(worker) for worker in workers])
+        for worker, value in zip(workers, alive):
+            if value is not None:
+                continue
+            print(f"Worker {worker} is gone")
+            for remote in [remote for remote in self.remotes.values() if remote.worker == worker]:
+                remote.disconnected()
+            for game_id in [game_id for game_id, owner in self.sessions.remote_boards.items() if owner == worker]:
+                del self.sessions.remote_boards[game_id]
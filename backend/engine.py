@@ -0,0 +1,210 @@
+"""
+Соперник-компьютер.
+
+Ход выбирается в отдельном процессе (ProcessPoolExecutor), поэтому
+расчет не задерживает цикл событий и ходы других партий. Если задан
+ENGINE_PATH, используется установленный UCI-движок (например,
+Stockfish) через chess.engine, иначе — встроенный перебор альфа-бета.
+"""
+import asyncio
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import chess
+import chess.engine
+from dotenv import load_dotenv
+
+load_dotenv()
+
+ENGINE_PATH = os.getenv("ENGINE_PATH", "")  # путь к UCI-движку, пусто — встроенный перебор
+ENGINE_TIME = float(os.getenv("ENGINE_TIME", 1))  # секунды на ход
+ENGINE_DEPTH = int(os.getenv("ENGINE_DEPTH", 4))  # наибольшая глубина перебора в полуходах
+ENGINE_WORKERS = int(os.getenv("ENGINE_WORKERS", 2))  # процессы для расчета ходов
+ENGINE_TOKEN = "engine"  # токен места компьютера в сохраненной партии
+
+PIECE_VALUES = {
+    chess.PAWN: 100,
+    chess.KNIGHT: 320,
+    chess.BISHOP: 330,
+    chess.ROOK: 500,
+    chess.QUEEN: 900,
+    chess.KING: 0
+}
+MATE_SCORE = 100000
+
+# бонус за близость к центру (0-3) для коней, слонов и ферзя
+CENTER_BONUS = [
+    3 - int(max(abs(chess.square_file(square) - 3.5), abs(chess.square_rank(square) - 3.5)))
+    for square in chess.SQUARES
+]
+
+executor = None  # общий пул процессов, создается при первом ходе компьютера
+uci_engine = None  # UCI-движок процесса пула
+
+
+class SearchTimeout(Exception):
+    pass
+
+
+def evaluate(board):
+    """
+    Оценивает позицию с точки зрения стороны, которая ходит.
+
+    Учитываются материал, продвижение пешек и близость легких фигур
+    и ферзя к центру.
+
+    Параметры:
+        board (chess.Board): позиция
+
+    Возвращает:
+        int: оценка в сотых долях пешки
+    """
+    score = 0
+    for square, piece in board.piece_map().items():
+        value = PIECE_VALUES[piece.piece_type]
+        if piece.piece_type == chess.PAWN:
+            rank = chess.square_rank(square)
+            value += 5 * (rank - 1 if piece.color == chess.WHITE else 6 - rank)
+        elif piece.piece_type in (chess.KNIGHT, chess.BISHOP, chess.QUEEN):
+            value += 5 * CENTER_BONUS[square]
+        score += value if piece.color == chess.WHITE else -value
+    return score if board.turn == chess.WHITE else -score
+
+
+def order_moves(board, moves):
+    """Сначала превращения и взятия ценных фигур дешевыми (MVV-LVA)."""
+    def priority(move):
+        score = PIECE_VALUES[move.promotion] if move.promotion else 0
+        if board.is_capture(move):
+            victim = board.piece_at(move.to_square)
+            attacker = board.piece_at(move.from_square)
+            score += 10 * (PIECE_VALUES[victim.piece_type] if victim else 100)
+            score -= PIECE_VALUES[attacker.piece_type] // 10
+        return -score
+    return sorted(moves, key=priority)
+
+
+def alpha_beta(board, depth, alpha, beta, ply, deadline):
+    """
+    Перебор negamax с отсечением альфа-бета.
+
+    Параметры:
+        board (chess.Board): позиция (изменяется и восстанавливается)
+        depth (int): оставшаяся глубина в полуходах
+        alpha (int): нижняя граница оценки
+        beta (int): верхняя граница оценки
+        ply (int): расстояние от корня (мат ближе оценивается выше)
+        deadline (float): time.monotonic(), после которого перебор прерывается
+
+    Возвращает:
+        int: оценка позиции для стороны, которая ходит
+    """
+    if time.monotonic() > deadline:
+        raise SearchTimeout()
+    moves = list(board.generate_legal_moves())
+    if not moves:
+        return -MATE_SCORE + ply if board.is_check() else 0
+    if board.is_insufficient_material() or board.halfmove_clock >= 100:
+        return 0
+    if depth == 0:
+        return evaluate(board)
+    for move in order_moves(board, moves):
+        board.push(move)
+        score = -alpha_beta(board, depth - 1, -beta, -alpha, ply + 1, deadline)
+        board.pop()
+        if score >= beta:
+            return beta
+        alpha = max(alpha, score)
+    return alpha
+
+
+def builtin_search(board, time_limit, max_depth):
+    """
+    Итеративное углубление до max_depth, пока не истекло время.
+
+    Параметры:
+        board (chess.Board): позиция
+        time_limit (float): секунды на ход
+        max_depth (int): наибольшая глубина в полуходах
+
+    Возвращает:
+        chess.Move: лучший ход последней завершенной глубины
+    """
+    deadline = time.monotonic() + time_limit
+    moves = order_moves(board, list(board.generate_legal_moves()))
+    best = moves[0]
+    for depth in range(1, max_depth + 1):
+        try:
+            alpha, depth_best = -MATE_SCORE - 1, moves[0]
+            for move in moves:
+                board.push(move)
+                score = -alpha_beta(board, depth - 1, -MATE_SCORE - 1, -alpha, 1, deadline)
+                board.pop()
+                if score > alpha:
+                    alpha, depth_best = score, move
+        except SearchTimeout:
+            break
+        best = depth_best
+        moves.remove(best)  # лучший ход проверяется первым на следующей глубине
+        moves.insert(0, best)
+    return best
+
+
+def choose_move(fen, time_limit=ENGINE_TIME, max_depth=ENGINE_DEPTH, engine_path=ENGINE_PATH):
+    """
+    Выбирает ход компьютера (выполняется в процессе пула).
+
+    Параметры:
+        fen (str): позиция
+        time_limit (float): секунды на ход
+        max_depth (int): наибольшая глубина
+        engine_path (str): путь к UCI-движку или пустая строка
+
+    Возвращает:
+        str: ход в формате UCI
+    """
+    global uci_engine
+    board = chess.Board(fen)
+    if engine_path:
+        if uci_engine is None: # движок запускается один раз на процесс пула
+            uci_engine = chess.engine.SimpleEngine.popen_uci(engine_path)
+        result = uci_engine.play(board, chess.engine.Limit(time=time_limit, depth=max_depth))
+        return result.move.uci()
+    return builtin_search(board, time_limit, max_depth).uci()
+
+
+def get_executor():
+    """
+    Возвращает общий пул процессов расчета ходов.
+
+    Процессы запускаются методом spawn: они не наследуют соединения и
+    цикл событий сервера.
+
+    Возвращает:
+        ProcessPoolExecutor: пул из ENGINE_WORKERS процессов
+    """
+    global executor
+    if executor is None:
+        executor = ProcessPoolExecutor(
+            max_workers=ENGINE_WORKERS,
+            mp_context=multiprocessing.get_context("spawn")
+        )
+    return executor
+
+
+async def think(board):
+    """
+    Выбирает ход компьютера, не блокируя цикл событий.
+
+    Параметры:
+        board (chess.Board): позиция
+
+    Возвращает:
+        chess.Move: ход
+    """
+    uci = await asyncio.get_running_loop().run_in_executor(
+        get_executor(), choose_move, board.fen()
+    )
+    return chess.Move.from_uci(uci)
@@ -1,7 +1,19 @@
+import asyncio
+import os
 import uuid
 from enum import Enum
 import chess
 
+from graveyard import Graveyard
+from move_record import FLAG_CAPTURE, record_symbol, record_uci
+from squares import SQUARE_BY_NAME, DEFAULT_CALIBRATION
+from engine import ENGINE_TOKEN
+from reconcile import BoardShadow
+
+
+CLOCK_BASE = float(os.getenv("CLOCK_BASE", 0))  # секунды на партию каждому игроку, 0 — без часов
+CLOCK_INCREMENT = float(os.getenv("CLOCK_INCREMENT", 0))  # секунды, добавляемые за ход
+
 
 class Colors(Enum):
     WHITE = 0
@@ -9,45 +21,71 @@ class Colors(Enum):
 
 
 class Player:
-    def __init__(self, websocket, figures_color):
+    def __init__(self, websocket, figures_color, token=None, engine=False):
         """
         Инициализирует объект игрока.
         
         Параметры:
             websocket (WebSocket): соединение с клиентом
             figures_color (Colors): цвет фигур игрока
+            token (str | None): токен для переподключения к партии
+            engine (bool): за игрока ходит компьютер (соединения нет)
         """
         self.websocket = websocket
         self.figures_color = figures_color
+        self.engine = engine
+        self.token = ENGINE_TOKEN if engine else token or uuid.uuid4().hex
+        self.missed = []  # сообщения, пришедшие пока игрок был отключен
 
 
 class Session:
-    def __init__(self):
-        """Инициализирует новую игровую сессию со сброшенными параметрами."""
+    def __init__(self, game_id=None):
+        """
+        Инициализирует новую игровую сессию со сброшенными параметрами.
+
+        Параметры:
+            game_id (str | None): идентификатор игры (доски)
+        """
+        self.game_id = game_id
+        self.robot_conn = None
+        self.calibration = DEFAULT_CALIBRATION  # расположение досок робота
+        self.shadow = BoardShadow()  # фактическое положение фигур, задается SessionRegistry
+        self.restoring = None  # загрузка сохраненной партии доски из Redis
+        self.inbox = asyncio.Queue()  # входящие сообщения игроков
+        self.dispatcher = None  # задача обработки self.inbox
+        self.reconnect_timers = {}  # токен игрока → ожидание его переподключения
+        self.spectators = set()  # соединения зрителей, остаются между партиями доски
+        self.delta_clients = set()  # соединения, получающие ходы вместо FEN (updates=delta)
+        self.engine_task = None  # расчет хода компьютера
         self.reset()
 
-    def add_player(self, websocket=None):
+    def add_player(self, websocket=None, figures_color=None, engine=False):
         """
         Добавляет игрока в сессию.
         
         Параметры:
             websocket (WebSocket): соединение с клиентом
+            figures_color (Colors | None): цвет, выбранный лобби; если он
+                занят или не задан, игрок получает свободный цвет
+            engine (bool): добавить компьютер вместо человека
         """
-        if not self.active_players:
-            new_client = Player(
-                websocket=websocket,
-                figures_color=Colors.WHITE
-            )
-            self.current_player = 0
-        else:
-            new_client = Player(
-                websocket=websocket,
-                figures_color=Colors.BLACK
-            )
-            self.is_active = True
-
-        self.players.append(new_client)
+        # место могло освободиться после delete_player: игрок получает
+        # свободный цвет, players упорядочен по цвету (индекс = Colors.value)
+        players = [player for player in self.players if player is not None]
+        taken = {player.figures_color for player in players}
+        if figures_color is None or figures_color in taken:
+            figures_color = Colors.WHITE if Colors.WHITE not in taken else Colors.BLACK
+        new_client = Player(
+            websocket=websocket,
+            figures_color=figures_color,
+            engine=engine
+        )
+        players.append(new_client)
+        self.players = sorted(players, key=lambda player: player.figures_color.value)
         self.active_players += 1
+        self.current_player = 0
+        if self.active_players == 2:
+            self.is_active = True
 
     def delete_player(self, websocket):
         """
@@ -67,14 +105,207 @@ class Session:
         self.active_players -= 1
         self.is_active = False
 
+    def add_spectator(self, websocket):
+        """
+        Добавляет зрителя в сессию.
+
+        Параметры:
+            websocket (WebSocket): соединение зрителя
+        """
+        self.spectators.add(websocket)
+
+    def remove_spectator(self, websocket):
+        """
+        Удаляет зрителя из сессии.
+
+        Параметры:
+            websocket (WebSocket): соединение зрителя
+
+        Возвращает:
+            bool: True если соединение было зрителем
+        """
+        if websocket not in self.spectators:
+            return False
+        self.spectators.discard(websocket)
+        return True
+
+    def find_player(self, token=None, websocket=None):
+        """
+        Ищет игрока по токену или соединению.
+
+        Параметры:
+            token (str | None): токен игрока
+            websocket (WebSocket | None): соединение игрока
+
+        Возвращает:
+            Player | None: игрок или None
+        """
+        return next(
+            (player
+             for player in self.players
+             if player is not None
+             and (token is None or player.token == token)
+             and (websocket is None or player.websocket is websocket)),
+            None
+        )
+
+    def detach_player(self, websocket):
+        """
+        Отвязывает соединение от игрока, сохраняя его место в партии.
+
+        Параметры:
+            websocket (WebSocket): отключившееся соединение
+
+        Возвращает:
+            Player | None: игрок или None, если соединение не найдено
+        """
+        player = self.find_player(websocket=websocket)
+        if player is not None:
+            player.websocket = None
+        return player
+
+    def attach_player(self, token, websocket):
+        """
+        Привязывает новое соединение к игроку по токену.
+
+        Параметры:
+            token (str): токен игрока
+            websocket (WebSocket): новое соединение
+
+        Возвращает:
+            Player | None: игрок или None, если токен неизвестен
+        """
+        player = self.find_player(token=token)
+        if player is not None:
+            player.websocket = websocket
+        return player
+
+    def restore_players(self, tokens):
+        """
+        Восстанавливает места игроков сохраненной партии без соединений.
+
+        Параметры:
+            tokens (dict): цвет (Colors) → токен игрока
+        """
+        self.players = [
+            Player(None, color, token, engine=token == ENGINE_TOKEN)
+            for color, token in sorted(tokens.items(), key=lambda item: item[0].value)
+        ]
+        self.active_players = 2
+        self.is_active = True
+        self.current_player = 0 if self.board.turn == chess.WHITE else 1
+
     def reset(self):
         """Сбрасывает состояние сессии к начальным значениям."""
+        self.match_id = uuid.uuid4().hex  # идентификатор партии в Redis
         self.active_players = 0
         self.players = []
         self.is_active = False
         self.current_player = None
         self.chess = chess
         self.board = self.chess.Board()
+        self.seq = 0  # количество сделанных ходов
+        self.log_length = 0  # количество записей в журнале партии
+        self.graveyard = Graveyard()  # съеденные фигуры на 2 доске
+        self.stand_ins = set()  # клетки (0-63), где вместо фигуры превращения стоит пешка
+        self.arm_position = None  # (доска, клетка), где остановился захват робота
+        self.robot_task = None  # выполнение роботом последнего хода
+        self.desynced = False  # игрокам сообщено, что фигуры на доске не совпадают с партией
+        self.clock = None  # оставшиеся секунды [белые, черные] или None без часов
+        self.increment = CLOCK_INCREMENT
+        self.turn_started = None  # время цикла событий начала текущего хода, None — часы стоят
+        self.flag_timer = None  # таймер падения флажка стороны, которая ходит
+        self.idle_timer = None  # таймер брошенной партии
+        self.seat_timer = None  # таймер ожидания соперника, выбранного лобби
+        self.clock_base = 0  # секунды на партию, 0 — без часов
+        self.clock_times = {}  # номер хода → оставшееся время сходившей стороны
+        self.robot_times = {}  # номер хода → секунды робота на его выполнение
+        self.started = None  # time.time() начала партии
+        self.result = "*"  # результат для архива: "1-0", "0-1", "1/2-1/2" или "*"
+        self.termination = "unterminated"  # причина окончания партии
+        self.update_legal_moves()
+
+    def start_clock(self, now, base=CLOCK_BASE, increment=CLOCK_INCREMENT):
+        """
+        Запускает шахматные часы партии.
+
+        Параметры:
+            now (float): текущее время цикла событий
+            base (float): секунды на партию каждому игроку (0 — без часов)
+            increment (float): секунды, добавляемые после каждого хода
+        """
+        if base <= 0:
+            return
+        self.clock_base = base
+        self.clock = [base, base]
+        self.increment = increment
+        self.turn_started = now
+
+    def time_left(self, now, color=None):
+        """
+        Возвращает оставшееся время игрока.
+
+        Параметры:
+            now (float): текущее время цикла событий
+            color (chess.Color | None): цвет, по умолчанию сторона, которая ходит
+
+        Возвращает:
+            float | None: секунды или None без часов
+        """
+        if self.clock is None:
+            return None
+        if color is None:
+            color = self.board.turn
+        index = 0 if color == chess.WHITE else 1
+        if color == self.board.turn and self.turn_started is not None:
+            return self.clock[index] - (now - self.turn_started)
+        return self.clock[index]
+
+    def press_clock(self, now):
+        """
+        Останавливает часы сделавшего ход.
+
+        Вызывается после make_move: время списывается со стороны,
+        которая только что сходила, и ей добавляется increment. Часы
+        соперника стоят, пока робот переставляет фигуры, их запускает
+        start_turn.
+
+        Параметры:
+            now (float): время цикла событий, когда пришел ход
+        """
+        if self.clock is None:
+            return
+        index = 1 if self.board.turn == chess.WHITE else 0
+        self.clock[index] += self.increment - (now - self.turn_started)
+        self.clock_times[self.seq] = self.clock[index]
+        self.turn_started = None
+
+    def start_turn(self, now):
+        """
+        Запускает часы стороны, которая ходит (робот закончил ход соперника).
+
+        Параметры:
+            now (float): текущее время цикла событий
+        """
+        if self.clock is not None and self.turn_started is None:
+            self.turn_started = now
+
+    def clock_state(self, now):
+        """
+        Возвращает часы для сообщений клиентам.
+
+        Параметры:
+            now (float): текущее время цикла событий
+
+        Возвращает:
+            dict | None: {"w": секунды, "b": секунды} или None без часов
+        """
+        if self.clock is None:
+            return None
+        return {
+            "w": round(max(0.0, self.time_left(now, chess.WHITE)), 3),
+            "b": round(max(0.0, self.time_left(now, chess.BLACK)), 3)
+        }
 
     def return_board(self):
         """
@@ -90,39 +321,124 @@ class Session:
         Выполняет ход на доске.
         
         Параметры:
-            move (str): ход в UCI-формате (например, "e2e4")
+            move (str | chess.Move): ход (например, "e2e4")
         
         Возвращает:
             bool: True если ход валиден, False в противном случае
         """
-        try:
-            self.board.push_uci(move)
-            return True
-        except ValueError:
+        if isinstance(move, str):
+            try:
+                move = chess.Move.from_uci(move)
+            except ValueError:
+                return False
+        if move not in self.legal_moves:
             return False
+        self.board.push(move)
+        self.seq += 1
+        self.update_legal_moves()
+        return True
 
-    def check_gameover(self):
+    def update_legal_moves(self):
         """
-        Проверяет завершение игры.
-        
+        Обновляет множество легальных ходов текущей позиции.
+
+        Ходы вычисляются один раз после каждого хода, проверки хода и
+        подсказки игрокам ищут в готовом множестве.
+        """
+        self.legal_moves = frozenset(self.board.generate_legal_moves())
+
+    def find_move(self, pos_start, pos_end, promotion=None):
+        """
+        Ищет легальный ход по начальной и конечной клеткам.
+
+        Если фигура превращения не указана, пешка превращается в ферзя.
+
+        Параметры:
+            pos_start (str): начальная клетка (например, "e7")
+            pos_end (str): конечная клетка (например, "e8")
+            promotion (str | None): фигура превращения ("q", "r", "b", "n")
+
         Возвращает:
-            bool: True если игра завершена
+            chess.Move | None: ход или None, если ход нелегален
         """
+        try:
+            move = chess.Move(
+                SQUARE_BY_NAME[pos_start],
+                SQUARE_BY_NAME[pos_end],
+                chess.Piece.from_symbol(promotion).piece_type if promotion else None
+            )
+        except (KeyError, ValueError, TypeError):
+            return None
+        if move in self.legal_moves:
+            return move
+        if promotion is None:
+            move = chess.Move(move.from_square, move.to_square, chess.QUEEN)
+            if move in self.legal_moves:
+                return move
+        return None
 
-        return self.board.is_game_over()
-    
-    def check_square(self,pos):
+    def replay(self, records):
         """
-        Проверяет наличие фигуры на указанной клетке.
-        
+        Применяет к доске записи журнала партии.
+
         Параметры:
-            pos (str): координаты клетки (например, "e4")
+            records (list[MoveRecord]): записи в порядке выполнения
+        """
+        for record in records:
+            self.update_graveyard(record)
+            if not record.flags & FLAG_CAPTURE:
+                self.board.push_uci(record_uci(record))
+                self.seq += 1
+            self.log_length += 1
+        self.update_legal_moves()
+
+    def update_graveyard(self, record):
+        """
+        Учитывает запись журнала в содержимом 2 доски и в stand_ins.
+
+        Взятая фигура занимает клетку 2 доски, фигура превращения
+        освобождает клетку, с которой ее взяли. Превращение без фигуры
+        на 2 доске оставляет на клетке пешку (stand_ins), она переходит
+        вместе с ходами фигуры и уходит со взятием.
+
+        Параметры:
+            record (MoveRecord): запись журнала
+        """
+        if record.flags & FLAG_CAPTURE:
+            self.graveyard.place(record.slot, record_symbol(record))
+            self.stand_ins.discard(record.from_square)
+            return
+        if record.slot:
+            self.graveyard.take(record.slot)
+        if record.from_square in self.stand_ins:
+            self.stand_ins.discard(record.from_square)
+            self.stand_ins.add(record.to_square)
+        elif record.promotion and not record.slot:
+            self.stand_ins.add(record.to_square)
+
+    def physical_board(self):
+        """
+        Возвращает игровую доску такой, какой она стоит у робота.
+
+        Отличается от партии только пешками, стоящими вместо фигур
+        превращения (stand_ins).
+
+        Возвращает:
+            chess.Board: позиция без истории ходов
+        """
+        board = self.board.copy(stack=False)
+        for square in self.stand_ins:
+            board.set_piece_at(square, chess.Piece(chess.PAWN, board.color_at(square)))
+        return board
+
+    def check_gameover(self):
+        """
+        Проверяет завершение игры.
         
         Возвращает:
-            chess.Piece | None: объект фигуры или None
+            chess.Outcome | None: результат завершенной игры (мат, пат,
+                недостаток материала, пятикратное повторение, правило
+                75 ходов) или None
         """
-        if self.board.piece_at(chess.parse_square(pos)) != None:
-            return  self.board.piece_at(chess.parse_square(pos))
-        else:
-            return None
-        
\ No newline at end of file
+
+        return self.board.outcome()
@@ -0,0 +1,225 @@
+import json
+import os
+import uuid
+
+import chess
+from dotenv import load_dotenv
+
+from game import Colors
+from graveyard import Graveyard
+from move_record import encode_record, decode_records, record_uci, migrate_legacy, FLAG_CAPTURE
+from redis_conn import game_key, board_key, GAME_KEY_NAMES, GAME_TTL
+
+load_dotenv()
+
+SNAPSHOT_INTERVAL = int(os.getenv("SNAPSHOT_INTERVAL", 10))  # ходов между снимками
+LEGACY_BOARD = os.getenv("LEGACY_BOARD", "default")  # доска партии из старых списков WHITE/BLACK
+
+
+class GameStore:
+    def __init__(self, redis_conn, snapshot_interval=SNAPSHOT_INTERVAL):
+        """
+        Хранит партии в Redis: журнал ходов и периодические снимки позиции.
+
+        Снимок (FEN, содержимое 2 доски, длина журнала) пишется каждые
+        snapshot_interval ходов, поэтому для восстановления партии нужно
+        применить не больше snapshot_interval записей журнала.
+
+        Параметры:
+            redis_conn (RedisConnector): подключение к Redis
+            snapshot_interval (int): количество ходов между снимками
+        """
+        self.redis_conn = redis_conn
+        self.snapshot_interval = snapshot_interval
+
+    def snapshot_commands(self, session):
+        """
+        Возвращает команды Redis для записи снимка текущей позиции.
+
+        Параметры:
+            session (Session): игровая сессия
+
+        Возвращает:
+            list[tuple]: команды для execute_batch
+        """
+        key = game_key(session.match_id, "snapshot")
+        return [
+            (
+                "HSET", key,
+                "fen", session.board.fen(),
+                "seq", session.seq,
+                "log_length", session.log_length,
+                "graveyard", json.dumps(session.graveyard.pieces()),
+                "stand_ins", json.dumps(sorted(session.stand_ins))
+            ),
+            ("EXPIRE", key, GAME_TTL)
+        ]
+
+    async def start_game(self, session):
+        """
+        Регистрирует новую партию на доске, пишет начальный снимок и
+        токены игроков для переподключения.
+
+        Параметры:
+            session (Session): игровая сессия
+        """
+        players_key = game_key(session.match_id, "players")
+        await self.redis_conn.execute_batch([
+            ("SET", board_key(session.game_id), session.match_id, "EX", GAME_TTL),
+            *self.snapshot_commands(session),
+            (
+                "HSET", players_key,
+                *[
+                    value
+                    for player in session.players
+                    for value in (player.figures_color.name, player.token)
+                ]
+            ),
+            ("EXPIRE", players_key, GAME_TTL)
+        ])
+
+    async def save_move(self, session, records):
+        """
+        Дописывает записи хода в журнал партии одной транзакцией.
+
+        Параметры:
+            session (Session): игровая сессия (ход уже применен к доске)
+            records (list[MoveRecord]): записи хода (взятие и ход)
+        """
+        key = game_key(session.match_id, "moves")
+        session.log_length += len(records)
+        commands = [
+            ("RPUSH", key, *map(encode_record, records)),
+            ("EXPIRE", key, GAME_TTL),
+            ("EXPIRE", board_key(session.game_id), GAME_TTL)
+        ]
+        if session.seq % self.snapshot_interval == 0:
+            commands += self.snapshot_commands(session)
+        await self.redis_conn.execute_batch(commands)
+
+    async def restore(self, session):
+        """
+        Восстанавливает незавершенную партию доски после перезапуска сервера.
+
+        Берется последний снимок и применяются только записи журнала,
+        сделанные после него. Места игроков восстанавливаются без
+        соединений, игроки возвращаются в партию по своим токенам.
+
+        Параметры:
+            session (Session): новая сессия доски
+
+        Возвращает:
+            bool: True если партия найдена и восстановлена
+        """
+        match_id = await self.redis_conn.execute("GET", board_key(session.game_id))
+        if match_id is None and session.game_id == LEGACY_BOARD:
+            match_id = await self.import_legacy(session)
+        if match_id is None:
+            return False
+        if isinstance(match_id, bytes):
+            match_id = match_id.decode()
+        snapshot = await self.redis_conn.execute(
+            "HGETALL", game_key(match_id, "snapshot")
+        )
+        if not snapshot:
+            return False
+        snapshot = {
+            field.decode(): value.decode()
+            for field, value in snapshot.items()
+        }
+        log_length = int(snapshot["log_length"])
+        records = decode_records(await self.redis_conn.execute(
+            "LRANGE", game_key(match_id, "moves"), log_length, -1
+        ))
+
+        session.match_id = match_id
+        session.board = chess.Board(snapshot["fen"])
+        session.graveyard = Graveyard({
+            int(slot): symbol
+            for slot, symbol in json.loads(snapshot["graveyard"]).items()
+        })
+        session.stand_ins = set(json.loads(snapshot.get("stand_ins", "[]")))
+        session.seq = int(snapshot["seq"])
+        session.log_length = log_length
+        session.replay(records)
+        tokens = await self.redis_conn.execute(
+            "HGETALL", game_key(match_id, "players")
+        )
+        if len(tokens) == 2:
+            session.restore_players({
+                Colors[color.decode()]: token.decode()
+                for color, token in tokens.items()
+            })
+        print(
+            f"Restored game {match_id} on board {session.game_id}: "
+            f"{session.seq} moves, {len(records)} after snapshot"
+        )
+        return True
+
+    async def import_legacy(self, session):
+        """
+        Переносит партию из старых глобальных списков WHITE/BLACK (до
+        журнала MoveRecord) в новую партию доски.
+
+        Журнал применяется с начальной позиции, игрокам выдаются новые
+        токены (выводятся в лог): по ним игроки возвращаются в партию,
+        иначе по истечении RECONNECT_TIMEOUT доска возвращается в
+        исходное состояние.
+
+        Параметры:
+            session (Session): новая сессия доски LEGACY_BOARD
+
+        Возвращает:
+            str | None: идентификатор партии или None, если старых списков нет
+        """
+        count = await migrate_legacy(self.redis_conn, session.match_id)
+        if not count:
+            return None
+        tokens = {color: uuid.uuid4().hex for color in (Colors.WHITE.name, Colors.BLACK.name)}
+        players_key = game_key(session.match_id, "players")
+        await self.redis_conn.execute_batch([
+            ("SET", board_key(session.game_id), session.match_id, "EX", GAME_TTL),
+            *self.snapshot_commands(session),  # начальная позиция, журнал с первой записи
+            ("HSET", players_key, *[value for item in tokens.items() for value in item]),
+            ("EXPIRE", players_key, GAME_TTL)
+        ])
+        print(
+            f"Imported legacy game on board {session.game_id}: {count} records, "
+            f"tokens {tokens}"
+        )
+        return session.match_id
+
+    async def load_moves(self, session):
+        """
+        Возвращает все ходы партии из журнала.
+
+        Нужен для архива партий, восстановленных после перезапуска: их
+        доска содержит только ходы после последнего снимка.
+
+        Параметры:
+            session (Session): игровая сессия
+
+        Возвращает:
+            list[str]: ходы в формате UCI от начальной позиции
+        """
+        records = decode_records(await self.redis_conn.execute(
+            "LRANGE", game_key(session.match_id, "moves"), 0, -1
+        ))
+        return [
+            record_uci(record)
+            for record in records
+            if not record.flags & FLAG_CAPTURE
+        ]
+
+    async def delete(self, session):
+        """
+        Удаляет данные завершенной партии и ссылку доски на нее.
+
+        Параметры:
+            session (Session): игровая сессия
+        """
+        await self.redis_conn.execute(
+            "UNLINK",
+            *[game_key(session.match_id, name) for name in GAME_KEY_NAMES],
+            board_key(session.game_id)
+        )
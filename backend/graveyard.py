@@ -0,0 +1,133 @@
+from reset_planner import HOME_SQUARES
+from squares import MAIN_BOARD, GRAVEYARD_BOARD, CELLS, CELL_BY_SQUARE, DEFAULT_CALIBRATION
+
+PREFERRED_CELLS = {}  # Calibration → символ фигуры → порядок клеток 2 доски
+
+
+def preferred_cells(calibration):
+    """
+    Возвращает порядок выбора клеток 2 доски для фигур каждого типа.
+
+    Сначала идут клетки, совпадающие с начальными клетками фигуры на
+    игровой доске, затем остальные по расстоянию до ближайшей из них.
+    Таблица вычисляется один раз на калибровку.
+
+    Параметры:
+        calibration (Calibration): расположение досок робота
+
+    Возвращает:
+        dict: символ фигуры → list[int] клеток 2 доски
+    """
+    cells = PREFERRED_CELLS.get(calibration)
+    if cells is None:
+        cells = PREFERRED_CELLS[calibration] = {
+            symbol: sorted(
+                CELLS,
+                key=lambda slot, squares=squares: (
+                    min(
+                        calibration.distance(GRAVEYARD_BOARD, slot, GRAVEYARD_BOARD, CELL_BY_SQUARE[square])
+                        for square in squares
+                    ),
+                    slot
+                )
+            )
+            for symbol, squares in HOME_SQUARES.items()
+        }
+    return cells
+
+
+class Graveyard:
+    def __init__(self, slots=None):
+        """
+        Клетки 2 доски для съеденных фигур одной партии.
+
+        Фигура ставится на клетку 2 доски, соответствующую ее начальной
+        клетке на игровой доске, а если та занята — на ближайшую к ней
+        свободную. Поэтому при возврате доски и превращении пешки фигура
+        переносится на короткое расстояние. Освободившиеся клетки
+        используются повторно.
+
+        Параметры:
+            slots (dict | None): клетка 2 доски (1-64) → символ фигуры
+        """
+        self.slots = dict(slots or {})  # клетка → символ фигуры
+        self.free = set(CELLS) - set(self.slots)  # свободные клетки
+
+    def allocate(self, symbol, exclude=(), calibration=DEFAULT_CALIBRATION):
+        """
+        Выбирает свободную клетку для фигуры, не занимая ее.
+
+        Параметры:
+            symbol (str): символ фигуры (например, "q")
+            exclude (Iterable[int]): клетки, уже выбранные для других фигур
+            calibration (Calibration): расположение досок робота
+
+        Возвращает:
+            int: клетка 2 доски (1-64)
+        """
+        for slot in preferred_cells(calibration)[symbol]:
+            if slot in self.free and slot not in exclude:
+                return slot
+        raise Exception("No free cells left on board 2")
+
+    def place(self, slot, symbol):
+        """
+        Ставит фигуру на клетку.
+
+        Параметры:
+            slot (int): клетка 2 доски (1-64)
+            symbol (str): символ фигуры
+        """
+        self.slots[slot] = symbol
+        self.free.discard(slot)
+
+    def take(self, slot):
+        """
+        Убирает фигуру с клетки.
+
+        Параметры:
+            slot (int): клетка 2 доски (1-64)
+
+        Возвращает:
+            str | None: символ фигуры или None, если клетка была пуста
+        """
+        symbol = self.slots.pop(slot, None)
+        if symbol is not None:
+            self.free.add(slot)
+        return symbol
+
+    def find(self, symbol, cell, calibration=DEFAULT_CALIBRATION):
+        """
+        Ищет фигуру, ближайшую к клетке игровой доски.
+
+        Параметры:
+            symbol (str): символ фигуры (например, "Q")
+            cell (int): клетка игровой доски (1-64), куда ставится фигура
+            calibration (Calibration): расположение досок робота
+
+        Возвращает:
+            int | None: клетка 2 доски или None, если такой фигуры нет
+        """
+        slots = [slot for slot, piece in self.slots.items() if piece == symbol]
+        if not slots:
+            return None
+        return min(
+            slots,
+            key=lambda slot: (calibration.distance(GRAVEYARD_BOARD, slot, MAIN_BOARD, cell), slot)
+        )
+
+    def pieces(self):
+        """
+        Возвращает копию содержимого 2 доски.
+
+        Возвращает:
+            dict: клетка 2 доски (1-64) → символ фигуры
+        """
+        return dict(self.slots)
+
+    def __len__(self):
+        return len(self.slots)
+
+    def __contains__(self, slot):
+        return slot in self.slots
+
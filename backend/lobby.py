@@ -0,0 +1,294 @@
+import asyncio
+import json
+import os
+import time
+from collections import deque
+
+from dotenv import load_dotenv
+
+from cluster import fan_out
+from game import Colors
+from metrics import LOBBY_WAIT_SECONDS, LOBBY_WAITING
+
+load_dotenv()
+
+LOBBY_RATING_WINDOW = float(os.getenv("LOBBY_RATING_WINDOW", 200))  # допустимая разница рейтингов
+LOBBY_WINDOW_GROWTH = float(os.getenv("LOBBY_WINDOW_GROWTH", 50))  # расширение окна за секунду ожидания
+LOBBY_MATCH_INTERVAL = float(os.getenv("LOBBY_MATCH_INTERVAL", 1))  # секунды между пересмотрами пар
+
+
+def parse_rating(value):
+    """
+    Разбирает рейтинг из параметра подключения.
+
+    Параметры:
+        value (str | None): значение параметра rating
+
+    Возвращает:
+        float | None: рейтинг или None, если он не указан или неверен
+    """
+    try:
+        return float(value) if value is not None else None
+    except ValueError:
+        return None
+
+
+class LobbyEntry:
+    def __init__(self, websocket, color=None, rating=None, engine=False):
+        """
+        Игрок, ожидающий соперника и доску.
+
+        Параметры:
+            websocket (WebSocket): соединение игрока
+            color (str | None): желаемый цвет ("w" или "b")
+            rating (float | None): рейтинг игрока
+            engine (bool): игрок играет с компьютером и ждет только доску
+        """
+        self.websocket = websocket
+        self.color = color if color in ("w", "b") else None
+        self.rating = rating
+        self.engine = engine
+        self.joined = time.monotonic()
+        self.assigned = asyncio.get_running_loop().create_future()  # → (доска, Colors)
+        self.position = None  # последнее отправленное место в очереди
+        self.partner = None
+
+    def accepts(self, other, now):
+        """
+        Проверяет, подходит ли соперник по цвету и рейтингу.
+
+        Окно рейтинга расширяется на LOBBY_WINDOW_GROWTH за каждую
+        секунду ожидания дольше ждавшего игрока.
+
+        Параметры:
+            other (LobbyEntry): возможный соперник
+            now (float): текущее время time.monotonic()
+
+        Возвращает:
+            bool: True если пару можно составить
+        """
+        if self.color is not None and self.color == other.color:
+            return False
+        if self.rating is None or other.rating is None:
+            return True
+        waited = now - min(self.joined, other.joined)
+        return abs(self.rating - other.rating) <= LOBBY_RATING_WINDOW + LOBBY_WINDOW_GROWTH * waited
+
+
+class Lobby:
+    def __init__(self, sessions):
+        """
+        Очередь игроков, подключившихся без указания доски.
+
+        Игроки составляют пары по желаемому цвету и рейтингу, пара
+        получает свободную доску с исправным роботом. Пары и игроки
+        ждут в порядке прихода; места в очереди рассылаются одним
+        проходом после каждого изменения очереди, без опроса соединений.
+
+        Параметры:
+            sessions (SessionRegistry): реестр сессий и пул роботов
+        """
+        self.sessions = sessions
+        self.waiting = []  # LobbyEntry без пары в порядке прихода
+        self.pairs = deque()  # (белые, черные), ожидающие свободную доску; None — компьютер
+        self.reserved = set()  # доски, выданные парам, пока на них никто не сел
+        self.positions_scheduled = False
+        self.matcher = None  # задача пересмотра пар с расширенным окном рейтинга
+        sessions.pool.listeners.append(self.assign_boards)
+
+    def start(self):
+        """Запускает периодический пересмотр пар."""
+        if self.matcher is None:
+            self.matcher = asyncio.create_task(self.rematch_loop())
+
+    async def join(self, websocket, color=None, rating=None, engine=False):
+        """
+        Ставит игрока в очередь и ждет соперника и свободную доску.
+
+        Параметры:
+            websocket (WebSocket): соединение игрока
+            color (str | None): желаемый цвет ("w" или "b")
+            rating (float | None): рейтинг игрока
+            engine (bool): игрок играет с компьютером
+
+        Возвращает:
+            tuple[str, Colors] | None: доска и цвет игрока или None,
+                если игрок отключился, не дождавшись
+        """
+        entry = LobbyEntry(websocket, color, rating, engine)
+        self.add(entry)
+        self.assign_boards()
+        closed = asyncio.ensure_future(websocket.wait_closed())
+        await asyncio.wait({entry.assigned, closed}, return_when=asyncio.FIRST_COMPLETED)
+        if entry.assigned.done():
+            closed.cancel()
+            return entry.assigned.result()
+        self.leave(entry)
+        return None
+
+    def add(self, entry):
+        """
+        Составляет пару с лучшим подходящим соперником или ставит игрока в очередь.
+
+        Среди подходящих выбирается соперник с ближайшим рейтингом,
+        при равенстве — дольше ждущий. Игрок против компьютера сразу
+        встает в очередь пар.
+
+        Параметры:
+            entry (LobbyEntry): новый игрок
+        """
+        if entry.engine:
+            self.pairs.append((None, entry) if entry.color == "b" else (entry, None))
+            self.schedule_positions()
+            return
+        now = time.monotonic()
+        best = None
+        for other in self.waiting:
+            if not entry.accepts(other, now):
+                continue
+            if best is None or self.rating_gap(entry, other) < self.rating_gap(entry, best):
+                best = other
+        if best is None:
+            self.waiting.append(entry)
+        else:
+            self.waiting.remove(best)
+            self.pair(best, entry)
+        self.schedule_positions()
+
+    def rating_gap(self, entry, other):
+        if entry.rating is None or other.rating is None:
+            return 0
+        return abs(entry.rating - other.rating)
+
+    def pair(self, first, second):
+        """
+        Ставит пару в очередь за доской и распределяет цвета.
+
+        Желаемый цвет соблюдается; если его не указал никто, белыми
+        играет дольше ждавший.
+
+        Параметры:
+            first (LobbyEntry): дольше ждавший игрок
+            second (LobbyEntry): второй игрок
+        """
+        if first.color == "b" or second.color == "w":
+            first, second = second, first
+        first.partner, second.partner = second, first
+        self.pairs.append((first, second))
+
+    def leave(self, entry):
+        """
+        Убирает отключившегося игрока из очереди; его соперник
+        возвращается в очередь на свое место.
+
+        Параметры:
+            entry (LobbyEntry): игрок
+        """
+        if entry in self.waiting:
+            self.waiting.remove(entry)
+        else:
+            pair = next(
+                (pair for pair in self.pairs if entry in pair),
+                None
+            )
+            if pair is not None:
+                self.pairs.remove(pair)
+            partner = entry.partner
+            if pair is not None and partner is not None:
+                partner.partner = None
+                index = sum(1 for other in self.waiting if other.joined < partner.joined)
+                self.waiting.insert(index, partner)
+                self.rematch()
+        self.schedule_positions()
+
+    def rematch(self):
+        """Составляет пары заново: окна рейтинга ждущих игроков расширились."""
+        now = time.monotonic()
+        index = 0
+        while index < len(self.waiting):
+            entry = self.waiting[index]
+            partner = next(
+                (
+                    other for other in self.waiting[index + 1:]
+                    if entry.accepts(other, now)
+                ),
+                None
+            )
+            if partner is None:
+                index += 1
+                continue
+            self.waiting.remove(partner)
+            self.waiting.pop(index)
+            self.pair(entry, partner)
+        self.assign_boards()
+
+    async def rematch_loop(self):
+        while True:
+            await asyncio.sleep(LOBBY_MATCH_INTERVAL)
+            if len(self.waiting) >= 2:
+                self.rematch()
+
+    def assign_boards(self):
+        """Отдает свободные доски парам в порядке очереди (вызывается пулом роботов)."""
+        now = time.monotonic()
+        while self.pairs:
+            game_id = self.sessions.pick_board(exclude=self.reserved)
+            if game_id is None:
+                break
+            white, black = self.pairs.popleft()
+            self.reserved.add(game_id)
+            for entry, color in ((white, Colors.WHITE), (black, Colors.BLACK)):
+                if entry is None: # место компьютера
+                    continue
+                LOBBY_WAIT_SECONDS.observe(now - entry.joined)
+                entry.assigned.set_result((game_id, color))
+        self.schedule_positions()
+
+    def seated(self, game_id):
+        """
+        Снимает бронь доски, когда на нее сел игрок пары.
+
+        Параметры:
+            game_id (str): идентификатор доски
+        """
+        self.reserved.discard(game_id)
+
+    def schedule_positions(self):
+        """Планирует одну рассылку мест в очереди на ближайший шаг цикла событий."""
+        if not self.positions_scheduled:
+            self.positions_scheduled = True
+            asyncio.get_running_loop().call_soon(self.send_positions)
+
+    def send_positions(self):
+        """
+        Сообщает игрокам их место в очереди, если оно изменилось.
+
+        Первыми доску получают пары, затем игроки без пары. Сообщения
+        пишутся в буферы соединений без ожидания отправки.
+        """
+        self.positions_scheduled = False
+        paired = [
+            (entry, index + 1, True)
+            for index, pair in enumerate(self.pairs)
+            for entry in pair
+            if entry is not None
+        ]
+        LOBBY_WAITING.set(len(self.waiting) + len(paired))
+        positions = paired + [
+            (entry, len(self.pairs) + index + 1, False)
+            for index, entry in enumerate(self.waiting)
+        ]
+        for entry, position, has_partner in positions:
+            if entry.position == position:
+                continue
+            entry.position = position
+            fan_out(
+                [entry.websocket],
+                json.dumps({
+                    "type": "queued",
+                    "data": {
+                        "position": position,
+                        "paired": has_partner
+                    }
+                })
+            )
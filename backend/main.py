@@ -1,8 +1,45 @@
 import asyncio
+import multiprocessing
+import os
 
-from server import WebSocketServer
+from dotenv import load_dotenv
+
+load_dotenv()
+
+WORKERS = int(os.getenv("WORKERS", 1))  # процессы сервера на этой машине, больше 1 — кластер через Redis
+
+
+def run_worker(index):
+    """
+    Запускает процесс сервера кластера.
+
+    Переменные окружения задаются до импорта сервера: модули читают
+    их при импорте. Процессы слушают общий порт, метрики каждого
+    процесса — на своем порту METRICS_PORT + index.
+
+    Параметры:
+        index (int): номер процесса
+    """
+    os.environ["CLUSTER"] = "1"
+    metrics_port = int(os.getenv("METRICS_PORT", 9108))
+    if metrics_port:
+        os.environ["METRICS_PORT"] = str(metrics_port + index)
+    from server import WebSocketServer
+    asyncio.run(WebSocketServer().run())
 
 
 if __name__ == "__main__":
-    ws_server = WebSocketServer()
-    asyncio.run(ws_server.run())
+    if WORKERS <= 1:
+        from server import WebSocketServer
+        ws_server = WebSocketServer()
+        asyncio.run(ws_server.run())
+    else:
+        context = multiprocessing.get_context("spawn")
+        workers = [
+            context.Process(target=run_worker, args=(index,), name=f"chess-worker-{index}")
+            for index in range(WORKERS)
+        ]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
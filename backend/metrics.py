@@ -0,0 +1,336 @@
+"""
+Метрики сервера в формате Prometheus.
+
+Гистограммы и счетчики обновляются на горячих путях (ход, команды
+робота, запросы Redis, возврат доски) без блокировок: все вызовы
+выполняются в потоке цикла событий. Метрики отдаются по HTTP
+(GET /metrics на METRICS_HOST:METRICS_PORT) и раз в
+METRICS_LOG_INTERVAL секунд печатаются одной строкой JSON.
+"""
+import asyncio
+import json
+import os
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+
+from dotenv import load_dotenv
+load_dotenv()
+
+METRICS_HOST = os.getenv("METRICS_HOST", "127.0.0.1")
+METRICS_PORT = int(os.getenv("METRICS_PORT", 9108))  # 0 — без HTTP
+METRICS_LOG_INTERVAL = float(os.getenv("METRICS_LOG_INTERVAL", 60))  # секунды, 0 — без логов
+
+# границы корзин гистограмм времени, секунды
+LATENCY_BUCKETS = (
+    0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1,
+    0.25, 0.5, 1, 2.5, 5, 10, 30, 60
+)
+# границы корзин числа перемещений робота
+COUNT_BUCKETS = (1, 2, 4, 8, 16, 24, 32, 48, 64)
+
+metrics = []  # все метрики в порядке создания
+
+
+def format_labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{value}"' for name, value in pairs) + "}"
+
+
+class Counter:
+    def __init__(self, name, description, labels=()):
+        """
+        Счетчик, который только увеличивается.
+
+        Параметры:
+            name (str): имя метрики
+            description (str): описание для /metrics
+            labels (tuple[str]): имена меток
+        """
+        self.name = name
+        self.description = description
+        self.labels = labels
+        self.series = {}  # значения меток → значение
+        metrics.append(self)
+
+    def inc(self, *labels, value=1):
+        self.series[labels] = self.series.get(labels, 0) + value
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.description}", f"# TYPE {self.name} counter"]
+        for labels, value in self.series.items():
+            lines.append(f"{self.name}{format_labels(self.labels, labels)} {value}")
+        return lines
+
+    def snapshot(self):
+        return {",".join(labels) or "all": value for labels, value in self.series.items()}
+
+
+class Gauge(Counter):
+    def __init__(self, name, description, labels=()):
+        """
+        Значение, которое может увеличиваться и уменьшаться.
+
+        Параметры:
+            name (str): имя метрики
+            description (str): описание для /metrics
+            labels (tuple[str]): имена меток
+        """
+        super().__init__(name, description, labels)
+
+    def set(self, value, *labels):
+        self.series[labels] = value
+
+    def dec(self, *labels, value=1):
+        self.series[labels] = self.series.get(labels, 0) - value
+
+    def render(self):
+        lines = super().render()
+        lines[1] = f"# TYPE {self.name} gauge"
+        return lines
+
+
+class Histogram:
+    def __init__(self, name, description, labels=(), buckets=LATENCY_BUCKETS):
+        """
+        Распределение значений по корзинам.
+
+        Параметры:
+            name (str): имя метрики
+            description (str): описание для /metrics
+            labels (tuple[str]): имена меток
+            buckets (tuple[float]): верхние границы корзин по возрастанию
+        """
+        self.name = name
+        self.description = description
+        self.labels = labels
+        self.buckets = buckets
+        self.series = {}  # значения меток → [счетчики корзин (+Inf последней), сумма, количество]
+        metrics.append(self)
+
+    def observe(self, value, *labels):
+        """
+        Добавляет значение.
+
+        Параметры:
+            value (float): наблюдаемое значение
+            *labels (str): значения меток в порядке self.labels
+        """
+        series = self.series.get(labels)
+        if series is None:
+            series = self.series[labels] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+        series[0][bisect_left(self.buckets, value)] += 1
+        series[1] += value
+        series[2] += 1
+
+    @contextmanager
+    def time(self, *labels):
+        """Измеряет время выполнения блока with."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, *labels)
+
+    def quantile(self, labels, fraction):
+        """
+        Оценивает квантиль по корзинам (верхняя граница корзины).
+
+        Параметры:
+            labels (tuple[str]): значения меток
+            fraction (float): доля от 0 до 1
+
+        Возвращает:
+            float | None: оценка или None, если значений нет
+        """
+        counts, _, total = self.series.get(labels, (None, 0, 0))
+        if not total:
+            return None
+        rank, seen = fraction * total, 0
+        for bound, count in zip(self.buckets + (float("inf"),), counts):
+            seen += count
+            if seen >= rank:
+                return bound
+        return float("inf")
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.description}", f"# TYPE {self.name} histogram"]
+        for labels, (counts, total, count) in self.series.items():
+            seen = 0
+            for bound, bucket in zip(self.buckets + ("+Inf",), counts):
+                seen += bucket
+                extra = (("le", bound),)
+                lines.append(f"{self.name}_bucket{format_labels(self.labels, labels, extra)} {seen}")
+            lines.append(f"{self.name}_sum{format_labels(self.labels, labels)} {total}")
+            lines.append(f"{self.name}_count{format_labels(self.labels, labels)} {count}")
+        return lines
+
+    def snapshot(self):
+        return {
+            ",".join(labels) or "all": {
+                "count": count,
+                "sum": round(total, 6),
+                "p50": self.quantile(labels, 0.5),
+                "p99": self.quantile(labels, 0.99)
+            }
+            for labels, (_, total, count) in self.series.items()
+        }
+
+
+MOVE_SECONDS = Histogram(
+    "chess_move_handle_seconds",
+    "Time from make_move to the update broadcast, robot excluded"
+)
+ROBOT_COMMAND_SECONDS = Histogram(
+    "chess_robot_command_seconds",
+    "Robot command round trip from queueing to response",
+    labels=("command",)
+)
+ROBOT_COMMAND_ERRORS = Counter(
+    "chess_robot_command_errors_total",
+    "Robot commands without a response (timeout or connection error)",
+    labels=("command",)
+)
+ROBOT_STEP_RECOVERIES = Counter(
+    "chess_robot_step_recoveries_total",
+    "Failed robot moves by recovery: retried, sensed or inferred as done, unresolved",
+    labels=("outcome",)
+)
+REDIS_SECONDS = Histogram(
+    "chess_redis_call_seconds",
+    "Redis call latency, pipelines are labelled as PIPELINE",
+    labels=("command",)
+)
+RESET_SECONDS = Histogram(
+    "chess_board_reset_seconds",
+    "Time to return the board to the starting position"
+)
+RESET_MOVES = Histogram(
+    "chess_board_reset_robot_moves",
+    "Robot moves needed to return the board",
+    buckets=COUNT_BUCKETS
+)
+LOBBY_WAIT_SECONDS = Histogram(
+    "chess_lobby_wait_seconds",
+    "Time from joining the lobby to getting a board"
+)
+LOBBY_WAITING = Gauge(
+    "chess_lobby_waiting",
+    "Players waiting in the lobby for an opponent or a board"
+)
+ACTIVE_SESSIONS = Gauge(
+    "chess_active_sessions",
+    "Game sessions held in the registry"
+)
+ARCHIVED_GAMES = Counter(
+    "chess_archived_games_total",
+    "Finished games passed to the archive by outcome: written, dropped or failed",
+    labels=("status",)
+)
+ARCHIVE_WRITE_SECONDS = Histogram(
+    "chess_archive_write_seconds",
+    "Time to compress and index one batch of archived games"
+)
+CONNECTIONS = Gauge(
+    "chess_connections",
+    "Open WebSocket connections",
+    labels=("role",)
+)
+OWNED_ROUTES = Gauge(
+    "chess_owned_routes",
+    "Boards and the lobby leased by this worker"
+)
+RELAYED_CONNECTIONS = Gauge(
+    "chess_relayed_connections",
+    "Connections relayed through Redis: local clients of other workers' boards (out) and other workers' clients served here (in)",
+    labels=("direction",)
+)
+
+
+def render():
+    """
+    Возвращает все метрики в текстовом формате Prometheus.
+
+    Возвращает:
+        str: текст для ответа на GET /metrics
+    """
+    lines = []
+    for metric in metrics:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+def snapshot():
+    """
+    Возвращает значения всех метрик для структурированного лога.
+
+    Возвращает:
+        dict: имя метрики → значения по меткам
+    """
+    return {metric.name: metric.snapshot() for metric in metrics if metric.series}
+
+
+async def handle_http(reader, writer):
+    """
+    Отвечает на HTTP-запрос к серверу метрик.
+
+    Параметры:
+        reader (asyncio.StreamReader): поток чтения
+        writer (asyncio.StreamWriter): поток записи
+    """
+    try:
+        request = await reader.readuntil(b"\r\n\r\n")
+        path = request.split(b" ", 2)[1] if request.count(b" ") >= 2 else b""
+        if path.split(b"?")[0] == b"/metrics":
+            status, body = "200 OK", render().encode()
+        else:
+            status, body = "404 Not Found", b"not found\n"
+        writer.write(
+            f"HTTP/1.1 {status}\r\n"
+            f"Content-Type: text/plain; version=0.0.4; charset=utf-8\r\n"
+            f"Content-Length: {len(body)}\r\n"
+            f"Connection: close\r\n\r\n".encode() + body
+        )
+        await writer.drain()
+    except (asyncio.IncompleteReadError, asyncio.LimitOverrunError, ConnectionError):
+        pass
+    finally:
+        writer.close()
+
+
+async def start_metrics_server(host=METRICS_HOST, port=METRICS_PORT):
+    """
+    Запускает HTTP-сервер метрик.
+
+    Параметры:
+        host (str): адрес
+        port (int): порт (0 — сервер не запускается)
+
+    Возвращает:
+        asyncio.Server | None: сервер или None, если он не запущен
+    """
+    if not port:
+        return None
+    try:
+        server = await asyncio.start_server(handle_http, host, port)
+    except OSError as e:
+        print(f"Metrics server on {host}:{port} not started: {e}")
+        return None
+    print(f"Метрики доступны на http://{host}:{port}/metrics")
+    return server
+
+
+async def log_metrics(interval=METRICS_LOG_INTERVAL):
+    """
+    Периодически печатает метрики одной строкой JSON.
+
+    Параметры:
+        interval (float): период в секундах (0 — не печатать)
+    """
+    if interval <= 0:
+        return
+    while True:
+        await asyncio.sleep(interval)
+        print(json.dumps({"event": "metrics", "time": time.time(), "metrics": snapshot()}))
@@ -0,0 +1,157 @@
+from collections import namedtuple
+from itertools import permutations
+
+import chess
+
+from move_record import (
+    MoveRecord,
+    FLAG_CAPTURE,
+    FLAG_EN_PASSANT,
+    FLAG_CASTLING,
+    NO_SQUARE
+)
+from squares import (
+    MAIN_BOARD,
+    GRAVEYARD_BOARD,
+    CELL_BY_SQUARE,
+    DEFAULT_CALIBRATION
+)
+
+MovePlan = namedtuple("MovePlan", ["steps", "records"])
+MovePlan.__doc__ = """
+Физическое выполнение одного шахматного хода.
+
+Поля:
+    steps (list[tuple[int, int, int, int]]): перемещения робота
+        (доска_откуда, клетка_откуда, доска_куда, клетка_куда), клетки 1-64,
+        в порядке выполнения
+    records (list[MoveRecord]): записи журнала партии (взятия и ход)
+"""
+
+
+def order_steps(steps, arm=None, distance=DEFAULT_CALIBRATION.distance):
+    """
+    Упорядочивает перемещения так, чтобы холостой путь захвата был
+    наименьшим.
+
+    Перемещение на клетку выполняется только после того, как стоящая на
+    ней фигура убрана. Перемещений в одном ходе не больше четырех,
+    поэтому перебираются все допустимые порядки.
+
+    Параметры:
+        steps (list[tuple]): перемещения (доска, клетка, доска, клетка)
+        arm (tuple[int, int] | None): (доска, клетка), где стоит захват
+        distance (Callable): путь захвата между клетками (Calibration.distance)
+
+    Возвращает:
+        list[tuple]: перемещения в порядке выполнения
+    """
+    best, best_cost = steps, None
+    for order in permutations(steps):
+        vacated = set()
+        occupied_targets = {step[:2] for step in steps}
+        cost, position, valid = 0, arm, True
+        for step in order:
+            if step[2:] in occupied_targets and step[2:] not in vacated:
+                valid = False
+                break
+            if position is not None:
+                cost += distance(*position, *step[:2])
+            vacated.add(step[:2])
+            position = step[2:]
+        if valid and (best_cost is None or cost < best_cost):
+            best, best_cost = list(order), cost
+    return best
+
+
+def plan_move(board: chess.Board, move: chess.Move, graveyard, arm=None,
+              calibration=DEFAULT_CALIBRATION, stand_ins=frozenset()):
+    """
+    Раскладывает шахматный ход на перемещения робота и записи журнала.
+
+    Взятая фигура (в том числе пешка, взятая на проходе) уходит на
+    2 доску, при рокировке переставляется и ладья. При превращении
+    пешка уходит на 2 доску, а на ее место ставится фигура того же цвета
+    с 2 доски; если такой фигуры нет, пешка остается на доске вместо нее
+    (клетка попадает в stand_ins партии). Записи журнала описывают
+    физические фигуры: взятая пешка, стоявшая вместо фигуры превращения,
+    уходит на 2 доску как пешка.
+
+    Параметры:
+        board (chess.Board): позиция до хода
+        move (chess.Move): легальный ход
+        graveyard (Graveyard): 2 доска партии, клетки для взятых фигур
+            выбираются ею, но занимаются только записями журнала
+        arm (tuple[int, int] | None): (доска, клетка), где стоит захват
+        calibration (Calibration): расположение досок робота
+        stand_ins (Container[int]): клетки (0-63), на которых вместо фигуры
+            превращения стоит пешка
+
+    Возвращает:
+        MovePlan: перемещения в порядке выполнения и записи журнала
+    """
+    color = 0 if board.turn == chess.WHITE else 1
+    cell_from = CELL_BY_SQUARE[move.from_square]
+    cell_to = CELL_BY_SQUARE[move.to_square]
+    piece = board.piece_at(move.from_square)
+    steps = []
+    records = []
+    reserved = []  # клетки 2 доски, выбранные для фигур этого хода
+
+    if board.is_en_passant(move):
+        victim_square = chess.square(
+            chess.square_file(move.to_square),
+            chess.square_rank(move.from_square)
+        )
+        flags = FLAG_CAPTURE | FLAG_EN_PASSANT
+    else:
+        victim_square = move.to_square
+        flags = FLAG_CAPTURE
+    victim = board.piece_at(victim_square) if board.is_capture(move) else None
+    if victim is not None and victim_square in stand_ins:
+        victim = chess.Piece(chess.PAWN, victim.color)
+    if victim is not None:
+        slot = graveyard.allocate(victim.symbol(), calibration=calibration)
+        reserved.append(slot)
+        steps.append((MAIN_BOARD, CELL_BY_SQUARE[victim_square], GRAVEYARD_BOARD, slot))
+        records.append(MoveRecord(
+            flags, 1 - color, victim_square, NO_SQUARE, victim.piece_type, slot, 0
+        ))
+
+    promotion_slot = 0
+    if move.promotion:
+        promotion_slot = graveyard.find(
+            chess.Piece(move.promotion, board.turn).symbol(),
+            cell_to,
+            calibration
+        ) or 0
+    if promotion_slot:
+        slot = graveyard.allocate(piece.symbol(), exclude=reserved, calibration=calibration)
+        steps.append((MAIN_BOARD, cell_from, GRAVEYARD_BOARD, slot))
+        records.append(MoveRecord(
+            FLAG_CAPTURE, color, move.from_square, NO_SQUARE, chess.PAWN, slot, 0
+        ))
+        steps.append((GRAVEYARD_BOARD, promotion_slot, MAIN_BOARD, cell_to))
+    else:
+        steps.append((MAIN_BOARD, cell_from, MAIN_BOARD, cell_to))
+
+    move_flags = 0
+    if board.is_castling(move):
+        move_flags = FLAG_CASTLING
+        rank = chess.square_rank(move.from_square)
+        if board.is_kingside_castling(move):
+            rook_from, rook_to = chess.square(7, rank), chess.square(5, rank)
+        else:
+            rook_from, rook_to = chess.square(0, rank), chess.square(3, rank)
+        steps.append((MAIN_BOARD, CELL_BY_SQUARE[rook_from], MAIN_BOARD, CELL_BY_SQUARE[rook_to]))
+
+    records.append(MoveRecord(
+        move_flags,
+        color,
+        move.from_square,
+        move.to_square,
+        piece.piece_type,
+        promotion_slot,
+        move.promotion or 0
+    ))
+    return MovePlan(order_steps(steps, arm, calibration.distance), records)
@@ -0,0 +1,224 @@
+import struct
+from collections import namedtuple
+
+import chess
+
+from squares import SQUARE_BY_NAME, CELL_BY_NAME
+from redis_conn import game_key, GAME_TTL
+
+VERSION = 1
+
+FLAG_CAPTURE = 0x01  # запись о съеденной фигуре, убранной на 2 доску
+FLAG_EN_PASSANT = 0x02  # взятие на проходе (вместе с FLAG_CAPTURE)
+FLAG_CASTLING = 0x04  # рокировка, ладья переставлена вместе с королем
+
+NO_SQUARE = 0xFF
+
+# версия, флаги, цвет, откуда, куда, тип фигуры, клетка 2 доски, превращение
+RECORD = struct.Struct("<8B")
+
+MoveRecord = namedtuple(
+    "MoveRecord",
+    ["flags", "color", "from_square", "to_square", "piece", "slot", "promotion"]
+)
+MoveRecord.__doc__ = """
+Запись о перемещении фигуры.
+
+Поля:
+    flags (int): FLAG_CAPTURE, FLAG_EN_PASSANT, FLAG_CASTLING
+    color (int): цвет фигуры (Colors.value: 0 — белые, 1 — черные)
+    from_square (int): клетка игровой доски 0-63 (как в chess)
+    to_square (int): клетка игровой доски 0-63 или NO_SQUARE для съеденной фигуры
+    piece (int): тип фигуры (chess.PAWN ... chess.KING)
+    slot (int): клетка 2 доски 1-64 или 0; у взятия — куда убрана фигура,
+        у хода с превращением — откуда взята фигура превращения
+    promotion (int): тип фигуры превращения или 0
+"""
+
+
+def record_symbol(record):
+    """
+    Возвращает символ фигуры записи.
+
+    Параметры:
+        record (MoveRecord): запись
+
+    Возвращает:
+        str: символ фигуры (например, "P" или "q")
+    """
+    return chess.Piece(record.piece, record.color == 0).symbol()
+
+
+def record_uci(record):
+    """
+    Возвращает ход записи в UCI-формате.
+
+    Параметры:
+        record (MoveRecord): запись хода (без FLAG_CAPTURE)
+
+    Возвращает:
+        str: ход (например, "e7e8q")
+    """
+    return chess.Move(
+        record.from_square,
+        record.to_square,
+        record.promotion or None
+    ).uci()
+
+
+def encode_record(record):
+    """
+    Упаковывает запись в 8 байт.
+
+    Параметры:
+        record (MoveRecord): запись
+
+    Возвращает:
+        bytes: запись в двоичном формате
+    """
+    return RECORD.pack(VERSION, *record)
+
+
+def decode_legacy(data):
+    """
+    Разбирает запись старого формата "e2-e4-WHITE-P-0".
+
+    Для съеденной фигуры второе поле — клетка 2 доски
+    ("d5-a1-BLACK-p-1", a1 — клетка 1).
+
+    Параметры:
+        data (bytes | str): запись старого формата
+
+    Возвращает:
+        MoveRecord: запись
+    """
+    if isinstance(data, bytes):
+        data = data.decode("utf-8")
+    pos_from, pos_to, color, symbol, captured = data.split("-")
+    piece = chess.Piece.from_symbol(symbol)
+    if captured == "1":
+        return MoveRecord(
+            FLAG_CAPTURE,
+            0 if color == "WHITE" else 1,
+            SQUARE_BY_NAME[pos_from],
+            NO_SQUARE,
+            piece.piece_type,
+            CELL_BY_NAME[pos_to],
+            0
+        )
+    return MoveRecord(
+        0,
+        0 if color == "WHITE" else 1,
+        SQUARE_BY_NAME[pos_from],
+        SQUARE_BY_NAME[pos_to],
+        piece.piece_type,
+        0,
+        0
+    )
+
+
+def decode_record(data):
+    """
+    Распаковывает одну запись любого поддерживаемого формата.
+
+    Параметры:
+        data (bytes): запись из Redis
+
+    Возвращает:
+        MoveRecord: запись
+    """
+    if len(data) == RECORD.size and data[0] == VERSION:
+        return MoveRecord(*RECORD.unpack(data)[1:])
+    if data[:1].isalpha():
+        return decode_legacy(data)
+    raise ValueError(f"Unknown move record format: {data!r}")
+
+
+def decode_records(items):
+    """
+    Распаковывает список записей.
+
+    Если все записи текущего формата, они распаковываются одним
+    вызовом struct.iter_unpack по склеенному буферу.
+
+    Параметры:
+        items (list[bytes]): записи из Redis (например, результат LRANGE)
+
+    Возвращает:
+        list[MoveRecord]: записи
+    """
+    if all(len(data) == RECORD.size and data[0] == VERSION for data in items):
+        return [
+            MoveRecord(*fields[1:])
+            for fields in RECORD.iter_unpack(b"".join(items))
+        ]
+    return [decode_record(data) for data in items]
+
+
+def merge_legacy_lists(white, black):
+    """
+    Собирает единый журнал партии из старых списков WHITE и BLACK.
+
+    Ходы в старом формате хранились по цветам, а запись о съеденной
+    фигуре — в списке ее цвета. Ходы чередуются начиная с белых, запись
+    о взятии ставится перед ходом, пришедшим на клетку съеденной фигуры.
+
+    Параметры:
+        white (list[bytes]): содержимое старого списка WHITE
+        black (list[bytes]): содержимое старого списка BLACK
+
+    Возвращает:
+        list[MoveRecord]: записи в порядке выполнения
+    """
+    moves = {0: [], 1: []}
+    captures = {0: [], 1: []}
+    for record in map(decode_legacy, white + black):
+        if record.flags & FLAG_CAPTURE:
+            captures[record.color].append(record)
+        else:
+            moves[record.color].append(record)
+
+    journal = []
+    for index in range(max(len(moves[0]), len(moves[1]))):
+        for color in (0, 1):
+            if index >= len(moves[color]):
+                continue
+            move = moves[color][index]
+            taken = captures[1 - color]
+            for position, capture in enumerate(taken):
+                if capture.from_square == move.to_square:
+                    journal.append(taken.pop(position))
+                    break
+            journal.append(move)
+    return journal
+
+
+async def migrate_legacy(redis_conn, match_id, white_key="WHITE", black_key="BLACK"):
+    """
+    Переносит историю партии из старых глобальных списков WHITE/BLACK
+    в журнал партии match_id в текущем формате и удаляет старые списки.
+
+    Параметры:
+        redis_conn (RedisConnector): подключение к Redis
+        match_id (str): идентификатор партии, в которую переносятся ходы
+        white_key (str): старый список ходов белых
+        black_key (str): старый список ходов черных
+
+    Возвращает:
+        int: количество перенесенных записей
+    """
+    white, black = await redis_conn.execute_batch([
+        ("LRANGE", white_key, 0, -1),
+        ("LRANGE", black_key, 0, -1)
+    ])
+    journal = merge_legacy_lists(white, black)
+    if not journal:
+        return 0
+    key = game_key(match_id, "moves")
+    await redis_conn.execute_batch([
+        ("DEL", key),
+        ("RPUSH", key, *map(encode_record, journal)),
+        ("EXPIRE", key, GAME_TTL),
+        ("UNLINK", white_key, black_key)
+    ])
+    return len(journal)
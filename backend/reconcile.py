@@ -0,0 +1,282 @@
+"""
+Сверка физических досок робота с логическим состоянием партии.
+
+Ответ робота на каждое перемещение разбирается (OK или ERROR,код), и
+теневая модель (BoardShadow) обеих досок обновляется только по
+подтвержденным перемещениям. Неудачное перемещение повторяется само
+по себе, без возврата всей доски; если робот сообщает занятость клеток
+(Occupancy), по ней проверяется, выполнено ли перемещение, ответ на
+которое потерян. Перемещения, которые не удалось выполнить,
+повторяются перед следующим ходом партии, а возврат доски строится
+от теневой модели, то есть от фактического положения фигур.
+"""
+import asyncio
+import os
+
+import chess
+from dotenv import load_dotenv
+
+from metrics import ROBOT_STEP_RECOVERIES
+from robot_conn import robot_request, parse_reply, ERROR_FORMAT, ERROR_CELL, ERROR_EMPTY
+from squares import MAIN_BOARD, GRAVEYARD_BOARD, BOARDS, CELL_BY_SQUARE, SQUARE_BY_CELL
+
+load_dotenv()
+
+ROBOT_STEP_RETRIES = int(os.getenv("ROBOT_STEP_RETRIES", 2))  # повторы одного неудачного перемещения
+ROBOT_RETRY_DELAY = float(os.getenv("ROBOT_RETRY_DELAY", 0.5))  # секунды перед первым повтором
+
+UNKNOWN = "?"  # фигура, которую датчики нашли там, где модель ее не ждала
+NOT_RETRIED = (ERROR_FORMAT, ERROR_CELL)  # ошибки в самой команде, повтор не поможет
+
+
+def expected_cells(board, graveyard):
+    """
+    Возвращает положение фигур обеих досок для логического состояния партии.
+
+    Параметры:
+        board (chess.Board): игровая доска
+        graveyard (dict): клетка 2 доски (1-64) → символ фигуры
+
+    Возвращает:
+        dict: (доска, клетка 1-64) → символ фигуры
+    """
+    cells = {
+        (MAIN_BOARD, CELL_BY_SQUARE[square]): piece.symbol()
+        for square, piece in board.piece_map().items()
+    }
+    cells.update({(GRAVEYARD_BOARD, cell): symbol for cell, symbol in graveyard.items()})
+    return cells
+
+
+class BoardShadow:
+    def __init__(self):
+        """
+        Фактическое положение фигур на обеих досках робота.
+
+        Модель принадлежит роботу (доске), а не партии: она сохраняется
+        между партиями и показывает, где фигуры стоят на самом деле,
+        если перемещение не удалось.
+        """
+        self.cells = {}  # (доска, клетка 1-64) → символ фигуры или UNKNOWN
+        self.unresolved = []  # перемещения партии, которые робот не выполнил
+        self.load(chess.Board(), {})
+
+    def load(self, board, graveyard):
+        """
+        Считает, что фигуры стоят по логическому состоянию партии.
+
+        Параметры:
+            board (chess.Board): игровая доска
+            graveyard (dict): клетка 2 доски (1-64) → символ фигуры
+        """
+        self.cells = expected_cells(board, graveyard)
+        self.unresolved = []
+
+    def apply(self, step):
+        """
+        Учитывает выполненное перемещение.
+
+        Параметры:
+            step (tuple[int, int, int, int]): (доска, клетка, доска, клетка)
+        """
+        self.cells[step[2:]] = self.cells.pop(step[:2], UNKNOWN)
+
+    def sync(self, board, occupied):
+        """
+        Сверяет модель доски с занятостью, сообщенной роботом.
+
+        Пропавшие фигуры удаляются из модели, на неожиданно занятых
+        клетках появляются неизвестные фигуры.
+
+        Параметры:
+            board (int): номер доски
+            occupied (set[int]): занятые клетки 1-64
+        """
+        for key in [key for key in self.cells if key[0] == board and key[1] not in occupied]:
+            del self.cells[key]
+        for cell in occupied:
+            self.cells.setdefault((board, cell), UNKNOWN)
+
+    def differences(self, board, graveyard):
+        """
+        Возвращает клетки, на которых фактическое положение расходится с партией.
+
+        Параметры:
+            board (chess.Board): игровая доска
+            graveyard (dict): клетка 2 доски (1-64) → символ фигуры
+
+        Возвращает:
+            list[tuple[int, int]]: (доска, клетка 1-64) по возрастанию
+        """
+        expected = expected_cells(board, graveyard)
+        return sorted(
+            key for key in expected.keys() | self.cells.keys()
+            if expected.get(key) != self.cells.get(key)
+        )
+
+    def position(self):
+        """
+        Возвращает фактическое положение фигур для планирования возврата доски.
+
+        Возвращает:
+            tuple[chess.Board, dict] | None: игровая доска и содержимое 2 доски
+                или None, если на досках есть неизвестные фигуры
+        """
+        if UNKNOWN in self.cells.values():
+            return None
+        board = chess.Board(None)
+        board.set_piece_map({
+            SQUARE_BY_CELL[cell]: chess.Piece.from_symbol(symbol)
+            for (board_id, cell), symbol in self.cells.items()
+            if board_id == MAIN_BOARD
+        })
+        graveyard = {
+            cell: symbol
+            for (board_id, cell), symbol in self.cells.items()
+            if board_id == GRAVEYARD_BOARD
+        }
+        return board, graveyard
+
+
+async def sense_boards(robot, calibration):
+    """
+    Запрашивает занятость обеих досок, если робот ее сообщает.
+
+    Параметры:
+        robot (RobotConnector): робот
+        calibration (Calibration): нумерация клеток робота
+
+    Возвращает:
+        dict | None: доска → занятые клетки 1-64 или None без датчиков
+    """
+    sensed = {}
+    for board in sorted(BOARDS):
+        cells = await robot.sense(board)
+        if cells is None:
+            return None
+        sensed[board] = {
+            calibration.logical_cells[board][cell]
+            for cell in cells
+            if cell in calibration.logical_cells[board]
+        }
+    return sensed
+
+
+async def sync_boards(robot, shadow, calibration):
+    """
+    Сверяет модель досок с датчиками робота, если они есть.
+
+    Параметры:
+        robot (RobotConnector): робот
+        shadow (BoardShadow): модель досок
+        calibration (Calibration): нумерация клеток робота
+
+    Возвращает:
+        bool: True если робот сообщил занятость клеток
+    """
+    sensed = await sense_boards(robot, calibration)
+    if sensed is None:
+        return False
+    for board, occupied in sensed.items():
+        shadow.sync(board, occupied)
+    return True
+
+
+async def retry_step(robot, shadow, calibration, step, reply):
+    """
+    Повторяет одно неудачное перемещение.
+
+    Если ответ был потерян (таймаут), а повтор отвечает, что клетка
+    откуда пуста, перемещение считается выполненным с первого раза.
+
+    Параметры:
+        robot (RobotConnector): робот
+        shadow (BoardShadow): модель досок
+        calibration (Calibration): нумерация клеток робота
+        step (tuple[int, int, int, int]): перемещение
+        reply (RobotReply): первый ответ на него
+
+    Возвращает:
+        bool: True если перемещение выполнено
+    """
+    lost = reply.code is None
+    for attempt in range(ROBOT_STEP_RETRIES):
+        if reply.code in NOT_RETRIED or not robot.connected:
+            break
+        await asyncio.sleep(ROBOT_RETRY_DELAY * 2 ** attempt)
+        reply = parse_reply(await robot.send_and_receive(
+            robot_request(*calibration.robot_step(*step))
+        ))
+        if reply.ok:
+            shadow.apply(step)
+            ROBOT_STEP_RECOVERIES.inc("retried")
+            return True
+        if lost and reply.code == ERROR_EMPTY:
+            shadow.apply(step)
+            ROBOT_STEP_RECOVERIES.inc("inferred")
+            return True
+        lost = lost or reply.code is None
+    return False
+
+
+async def execute_steps(robot, shadow, calibration, steps):
+    """
+    Выполняет перемещения и восстанавливает только неудачные.
+
+    Все перемещения отправляются роботу одной серией. Если часть из
+    них не удалась, занятость досок (если робот ее сообщает) показывает,
+    какие из них на самом деле выполнены; остальные повторяются по
+    одному в исходном порядке. Перемещение, фигуру для которого должно
+    было принести невыполненное, не повторяется.
+
+    Параметры:
+        robot (RobotConnector): робот
+        shadow (BoardShadow): модель досок
+        calibration (Calibration): нумерация клеток робота
+        steps (list[tuple[int, int, int, int]]): перемещения
+
+    Возвращает:
+        list[tuple[int, int, int, int]]: перемещения, которые выполнить не удалось
+    """
+    if not robot.connected: # перемещения повторятся, когда робот подключится
+        return list(steps)
+    replies = await robot.submit_batch([
+        robot_request(*calibration.robot_step(*step)) for step in steps
+    ])
+    failed = []
+    for step, response in zip(steps, replies):
+        reply = parse_reply(response)
+        if reply.ok:
+            shadow.apply(step)
+        else:
+            print(f"Robot step {step} failed: {response}")
+            failed.append((step, reply))
+    if not failed:
+        return []
+
+    sensed = await sense_boards(robot, calibration)
+    if sensed is not None:
+        remaining = []
+        for step, reply in failed:
+            source, target = step[:2], step[2:]
+            if (
+                source in shadow.cells and target not in shadow.cells
+                and source[1] not in sensed[source[0]] and target[1] in sensed[target[0]]
+            ): # перемещение выполнено, потерян только ответ
+                shadow.apply(step)
+                ROBOT_STEP_RECOVERIES.inc("sensed")
+            else:
+                remaining.append((step, reply))
+        failed = remaining
+        for board, occupied in sensed.items():
+            shadow.sync(board, occupied)
+
+    unresolved = []
+    for step, reply in failed:
+        if any(previous[2:] == step[:2] for previous in unresolved):
+            unresolved.append(step) # фигуру сюда не принесли
+            continue
+        if not await retry_step(robot, shadow, calibration, step, reply):
+            ROBOT_STEP_RECOVERIES.inc("unresolved")
+            unresolved.append(step)
+    return unresolved
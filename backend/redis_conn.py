@@ -1,48 +1,191 @@
-import redis
+import redis.asyncio as redis
 import os
 
 from dotenv import load_dotenv
+
+from metrics import REDIS_SECONDS
+
 load_dotenv()
 
+KEY_PREFIX = os.getenv("REDIS_KEY_PREFIX", "chess")
+GAME_TTL = int(os.getenv("GAME_TTL", 24 * 60 * 60))  # секунды хранения партии
+GAME_KEY_NAMES = ("moves", "snapshot", "players")  # ключи, которые хранит одна партия
+REDIS_SOCKET_TIMEOUT = float(os.getenv("REDIS_SOCKET_TIMEOUT", 5))  # секунды ожидания ответа Redis
+REDIS_CONNECT_TIMEOUT = float(os.getenv("REDIS_CONNECT_TIMEOUT", 5))  # секунды ожидания подключения к Redis
+
+pools = {}  # (host, port, db) → общий пул соединений
+
+
+def game_key(match_id, name):
+    """
+    Возвращает ключ Redis для данных партии.
+
+    Пример:
+        ("3f2a...", "moves") → "chess:game:3f2a...:moves"
+
+    Параметры:
+        match_id (str): идентификатор партии
+        name (str): название данных (одно из GAME_KEY_NAMES)
+
+    Возвращает:
+        str: ключ Redis
+    """
+    return f"{KEY_PREFIX}:game:{match_id}:{name}"
+
+
+def board_key(game_id):
+    """
+    Возвращает ключ Redis, в котором доска хранит идентификатор текущей партии.
+
+    Параметры:
+        game_id (str): идентификатор доски
+
+    Возвращает:
+        str: ключ Redis
+    """
+    return f"{KEY_PREFIX}:board:{game_id}"
+
+
+def get_pool(host, port, db):
+    """
+    Возвращает общий пул соединений для адреса Redis.
+
+    Команды и подключения ограничены по времени: зависший Redis
+    приводит к ошибке, а не останавливает продление аренд и ходы.
+
+    Параметры:
+        host (str): адрес Redis
+        port (int): порт Redis
+        db (int): номер базы данных
+
+    Возвращает:
+        redis.ConnectionPool: пул соединений
+    """
+    key = (host, port, db)
+    if key not in pools:
+        pools[key] = redis.ConnectionPool(
+            host=host,
+            port=port,
+            db=db,
+            max_connections=int(os.getenv("REDIS_MAX_CONNECTIONS", 50)),
+            socket_timeout=REDIS_SOCKET_TIMEOUT,
+            socket_connect_timeout=REDIS_CONNECT_TIMEOUT
+        )
+    return pools[key]
+
+
 class RedisConnector:
-    def __init__(self, db=0):
+    def __init__(self, db=0, client=None):
+        """
+        Параметры:
+            db (int): номер базы данных
+            client (redis.Redis | None): готовый асинхронный клиент
+                (например, fakeredis.aioredis.FakeRedis для тестов)
+        """
         self.host = os.getenv("REDIS_HOST", "localhost")
         self.port = int(os.getenv("REDIS_PORT", 6379))
         self.db = db
-        self.client = None
+        self.client = client
 
-    def connect(self):
-        """Устанавливает соединение с Redis-сервером."""
+    async def connect(self):
+        """
+        Устанавливает соединение с Redis-сервером.
+
+        Если сервер недоступен, бросает исключение: его обрабатывает
+        вызывающий код, остальные партии процесса продолжаются.
+        """
         if not self.client:
             try:
                 self.client = redis.Redis(
-                    host=self.host,
-                    port=self.port,
-                    db=self.db
+                    connection_pool=get_pool(self.host, self.port, self.db)
                 )
-                self.client.ping()
+                await self.client.ping()
                 print(f"Connected to Redis db at {self.host}:{self.port}")
             except Exception as e:
+                self.client = None # следующий вызов повторит подключение
                 print(f"Ошибка подключения к базе данных: {e}")
-                exit(1)
+                raise Exception(f"Redis at {self.host}:{self.port} is unavailable") from e
 
-    def disconnect(self):
-        """Закрывает соединение с Redis."""
+    async def disconnect(self):
+        """Закрывает клиент Redis, общий пул соединений остается открытым."""
         if self.client:
-            self.client.close()
+            await self.client.aclose()
             self.client = None
 
-    def execute(self, command, *args):
+    async def execute(self, command, *args):
         """
         Выполняет команду Redis.
-        
+
         Параметры:
             command (str): название команды (например, "SET")
             *args: аргументы команды
-        
+
         Возвращает:
             Any: результат выполнения команды
         """
         if not self.client:
-            self.connect()
-        return self.client.execute_command(command, *args)
+            await self.connect()
+        with REDIS_SECONDS.time(command):
+            return await self.client.execute_command(command, *args)
+
+    async def execute_batch(self, commands, transaction=True):
+        """
+        Выполняет несколько команд Redis за один сетевой запрос.
+
+        Параметры:
+            commands (list[tuple]): команды вида ("RPUSH", key, value)
+            transaction (bool): выполнить команды атомарно (MULTI/EXEC)
+
+        Возвращает:
+            list: результаты команд в том же порядке
+        """
+        if not self.client:
+            await self.connect()
+        with REDIS_SECONDS.time("PIPELINE"):
+            async with self.client.pipeline(transaction=transaction) as pipe:
+                for command in commands:
+                    pipe.execute_command(*command)
+                return await pipe.execute()
+
+    async def execute_if_equal(self, key, value, *command):
+        """
+        Выполняет команду, только если в ключе записано value.
+
+        Проверка и команда выполняются атомарно (WATCH/MULTI): если
+        ключ изменился между ними, команда не выполняется. Так
+        продлевается и снимается аренда доски без риска задеть чужую.
+
+        Параметры:
+            key (str): проверяемый ключ
+            value (str): ожидаемое значение
+            *command: команда и ее аргументы (например, "PEXPIRE", key, 10000)
+
+        Возвращает:
+            bool: True если команда выполнена
+        """
+        if not self.client:
+            await self.connect()
+        with REDIS_SECONDS.time("WATCH"):
+            async with self.client.pipeline(transaction=True) as pipe:
+                try:
+                    await pipe.watch(key)
+                    current = await pipe.get(key)
+                    if current is None or current.decode() != value:
+                        return False
+                    pipe.multi()
+                    pipe.execute_command(*command)
+                    await pipe.execute()
+                    return True
+                except redis.WatchError:
+                    return False
+
+    async def pubsub(self):
+        """
+        Возвращает подписку на каналы Redis (отдельное соединение из пула).
+
+        Возвращает:
+            redis.client.PubSub: подписка
+        """
+        if not self.client:
+            await self.connect()
+        return self.client.pubsub()
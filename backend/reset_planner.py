@@ -0,0 +1,129 @@
+import chess
+
+from squares import MAIN_BOARD, GRAVEYARD_BOARD, CELL_BY_SQUARE, SQUARE_BY_CELL, DEFAULT_CALIBRATION
+
+HOME_SQUARES = {  # клетки, на которых фигуры стоят в начальной позиции
+    symbol: [
+        square
+        for square, piece in chess.Board().piece_map().items()
+        if piece.symbol() == symbol
+    ]
+    for symbol in "PNBRQKpnbrqk"
+}
+
+HOME_SYMBOL = {
+    square: symbol
+    for symbol, squares in HOME_SQUARES.items()
+    for square in squares
+}
+
+
+def match_nearest(sources, targets, calibration=DEFAULT_CALIBRATION):
+    """
+    Жадно сопоставляет фигуры свободным клеткам по расстоянию.
+
+    Параметры:
+        sources (list[int]): клетки, с которых нужно убрать фигуры
+        targets (list[int]): свободные клетки назначения
+        calibration (Calibration): расположение досок робота
+
+    Возвращает:
+        tuple[list, list, list]: пары (откуда, куда), несопоставленные
+        источники и несопоставленные клетки назначения
+    """
+    pairs = sorted(
+        (
+            calibration.distance(MAIN_BOARD, CELL_BY_SQUARE[source], MAIN_BOARD, CELL_BY_SQUARE[target]),
+            source,
+            target
+        )
+        for source in sources
+        for target in targets
+    )
+    used_sources, used_targets, matched = set(), set(), []
+    for _, source, target in pairs:
+        if source in used_sources or target in used_targets:
+            continue
+        used_sources.add(source)
+        used_targets.add(target)
+        matched.append((source, target))
+    return (
+        matched,
+        [source for source in sources if source not in used_sources],
+        [target for target in targets if target not in used_targets]
+    )
+
+
+def plan_reset(board: chess.Board, graveyard, calibration=DEFAULT_CALIBRATION):
+    """
+    Строит последовательность ходов робота для возврата доски в начальную позицию.
+
+    Каждая фигура не на своем месте переставляется ровно один раз,
+    фигуры на своих начальных клетках не трогаются. Циклы (например,
+    два коня на клетках друг друга) разрываются через свободную клетку
+    2 доски — по одному дополнительному ходу на цикл. Лишние фигуры
+    (после превращения пешек) уходят на 2 доску.
+
+    Параметры:
+        board (chess.Board): текущее логическое состояние игровой доски
+        graveyard (dict): клетка 2 доски (1-64) → символ фигуры
+        calibration (Calibration): расположение досок робота
+
+    Возвращает:
+        list[tuple[int, int, int, int]]: ходы робота
+        (доска_откуда, клетка_откуда, доска_куда, клетка_куда), клетки 1-64
+    """
+    # внутри клетки обеих досок нумеруются 0-63, как в chess
+    on_board = {square: piece.symbol() for square, piece in board.piece_map().items()}
+    dead = {SQUARE_BY_CELL[cell]: symbol for cell, symbol in graveyard.items()}
+    free_graveyard = [square for square in reversed(chess.SQUARES) if square not in dead]
+
+    moves = {}  # (доска, клетка) откуда → (доска, клетка) куда
+    for symbol, homes in HOME_SQUARES.items():
+        misplaced = [
+            square for square, piece in on_board.items()
+            if piece == symbol and HOME_SYMBOL.get(square) != symbol
+        ]
+        empty_homes = [square for square in homes if on_board.get(square) != symbol]
+        matched, extra, empty_homes = match_nearest(misplaced, empty_homes, calibration)
+        for source, target in matched:
+            moves[(MAIN_BOARD, source)] = (MAIN_BOARD, target)
+        for source in extra:
+            moves[(MAIN_BOARD, source)] = (GRAVEYARD_BOARD, free_graveyard.pop())
+        captured = [square for square, piece in dead.items() if piece == symbol]
+        for source, target in zip(captured, empty_homes):
+            moves[(GRAVEYARD_BOARD, source)] = (MAIN_BOARD, target)
+
+    # занятая клетка назначения освобождается ходом стоящей на ней фигуры,
+    # waiting: клетка → ход, ожидающий ее освобождения
+    waiting = {
+        target: source
+        for source, target in moves.items()
+        if target[0] == MAIN_BOARD and target[1] in on_board
+    }
+    blocked = set(waiting.values())
+
+    plan = []
+
+    def run_chain(source):
+        while source is not None:
+            target = moves.pop(source)
+            plan.append((*source, *target))
+            source = waiting.pop(source, None)
+
+    for source in [source for source in moves if source not in blocked]:
+        run_chain(source)
+
+    while moves:  # остались только циклы
+        source = next(iter(moves))
+        target = moves.pop(source)
+        waiting.pop(target)
+        buffer = (GRAVEYARD_BOARD, free_graveyard.pop())
+        plan.append((*source, *buffer))
+        run_chain(waiting.pop(source))
+        plan.append((*buffer, *target))
+
+    return [
+        (board_from, CELL_BY_SQUARE[pos_from], board_to, CELL_BY_SQUARE[pos_to])
+        for board_from, pos_from, board_to, pos_to in plan
+    ]
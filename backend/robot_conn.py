@@ -1,44 +1,382 @@
-import socket
+import asyncio
 import os
+import time
+from collections import deque, namedtuple
 
 from dotenv import load_dotenv
+
+from metrics import ROBOT_COMMAND_SECONDS, ROBOT_COMMAND_ERRORS
+
 load_dotenv()
 
+DELIMITER = b"\r\n"
+
+# коды ответа "ERROR,код"
+ERROR_UNKNOWN = 0  # ответ не разобран
+ERROR_FORMAT = 1  # команда не разобрана (или не поддерживается роботом)
+ERROR_CELL = 2  # неизвестная доска или клетка вне 1-64
+ERROR_EMPTY = 3  # на клетке откуда нет фигуры
+ERROR_OCCUPIED = 4  # клетка куда занята
+ERROR_PICKUP = 5  # захват не взял фигуру, фигура осталась на месте
+
+RobotReply = namedtuple("RobotReply", ["ok", "code", "data"])
+RobotReply.__doc__ = """
+Разобранный ответ робота.
+
+Поля:
+    ok (bool): команда выполнена ("OK")
+    code (int | None): код ошибки, None — ответа нет (таймаут или обрыв связи)
+    data (str | None): данные после "OK," или текст ошибки
+"""
+
+
+def parse_reply(response):
+    """
+    Разбирает ответ робота.
+
+    Пример:
+        "OK" → RobotReply(True, None, None)
+        "ERROR,3" → RobotReply(False, 3, "3")
+        None → RobotReply(False, None, None)
+
+    Параметры:
+        response (str | None): ответ send_and_receive
+
+    Возвращает:
+        RobotReply: результат команды
+    """
+    if response is None:
+        return RobotReply(False, None, None)
+    status, _, data = response.strip().partition(",")
+    if status == "OK":
+        return RobotReply(True, None, data or None)
+    if status == "ERROR":
+        code = data.split(",", 1)[0]
+        return RobotReply(False, int(code) if code.isdigit() else ERROR_UNKNOWN, data)
+    return RobotReply(False, ERROR_UNKNOWN, response)
+
+
+def command_name(message):
+    """
+    Возвращает название команды робота.
+
+    Пример:
+        "Move,2,12,2,28\r\n" → "Move"
+
+    Параметры:
+        message (str): команда
+
+    Возвращает:
+        str: название команды
+    """
+    return message.split(",", 1)[0].strip()
+
+
+def robot_request(board_from, pos_from, board_to, pos_to):
+    return f"Move,{board_from},{pos_from},{board_to},{pos_to}\r\n"
+
+
+def parse_timeouts(value):
+    """
+    Разбирает таймауты команд из строки окружения.
+
+    Пример:
+        "Move=60,Ping=5" → {"Move": 60.0, "Ping": 5.0}
+
+    Параметры:
+        value (str): строка вида "Команда=секунды,..."
+
+    Возвращает:
+        dict: название команды → таймаут в секундах
+    """
+    timeouts = {}
+    for item in value.split(","):
+        item = item.strip()
+        if item:
+            command, seconds = item.split("=", 1)
+            timeouts[command.strip()] = float(seconds)
+    return timeouts
+
+
 class RobotConnector:
-    def __init__(self):
-        self.host = os.getenv("ROBOT_HOST", "localhost")
-        self.port = int(os.getenv("ROBOT_PORT", 12345))
-        self.socket = None
+    def __init__(self, host=None, port=None, timeouts=None):
+        self.host = host or os.getenv("ROBOT_HOST", "localhost")
+        self.port = int(port or os.getenv("ROBOT_PORT", 12345))
+        self.default_timeout = float(os.getenv("ROBOT_TIMEOUT", 30))
+        self.timeouts = timeouts if timeouts is not None else parse_timeouts(
+            os.getenv("ROBOT_TIMEOUTS", "")
+        )
+        self.pipeline_depth = int(os.getenv("ROBOT_PIPELINE_DEPTH", 4))
+        self.reader = None
+        self.writer = None
+        self.loop = None
+        self.queue = None  # команды, ожидающие отправки
+        self.in_flight = None  # ограничение числа команд без ответа
+        self.pending = deque()  # (команда, future, таймаут) отправленных команд без ответа
+        self.deadline = None  # loop.call_at: истекает ожидание ответа на первую из pending
+        self.connect_lock = asyncio.Lock()  # одно подключение за раз
+        self.reconnecting = None  # переподключение после таймаута
+        self.tasks = []
+        self.sensing = None  # робот отвечает на Occupancy; None — еще не известно
+        self.last_reply = None  # время цикла событий последнего ответа (или подключения)
+        self.timed_out = False  # команда осталась без ответа, после нее ответов не было
 
-    def connect(self):
-        """Устанавливает TCP-соединение с роботом."""
-        try:
-            self.socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-            self.socket.connect((self.host, self.port))
-            print(f"Connected to robot at {self.host}:{self.port}")
-        except ConnectionRefusedError:
-            print(f"Connection to robot at {self.host}:{self.port} refused.")
+    @property
+    def connected(self):
+        return self.writer is not None and not self.writer.is_closing()
+
+    @property
+    def idle(self):
+        """Нет команд, ожидающих отправки или ответа."""
+        return not self.pending and (self.queue is None or self.queue.empty())
+
+    async def connect(self):
+        """
+        Устанавливает TCP-соединение с роботом.
+
+        Вызовы выполняются по одному: если соединение уже открыл другой
+        вызов, новое не открывается. Закрытое соединение закрывается
+        перед заменой вместе с его задачами.
+        """
+        async with self.connect_lock:
+            if self.connected:
+                return
+            if self.writer is not None: # соединение закрыто другой стороной
+                self.fail_pending(ConnectionError("Robot connection lost"))
+            try:
+                reader, writer = await asyncio.open_connection(self.host, self.port)
+            except OSError:
+                print(f"Connection to robot at {self.host}:{self.port} refused.")
+                return
+            self.start(reader, writer)
+
+    def start(self, reader, writer):
+        """
+        Начинает обмен командами по новому соединению.
+
+        Параметры:
+            reader (asyncio.StreamReader): чтение ответов
+            writer (asyncio.StreamWriter): запись команд
+        """
+        for task in self.tasks: # задачи прошлого соединения после его потери
+            task.cancel()
+        self.reader, self.writer = reader, writer
+        self.loop = asyncio.get_running_loop()
+        self.last_reply = self.loop.time()
+        self.queue = asyncio.Queue()
+        self.in_flight = asyncio.Semaphore(self.pipeline_depth)
+        self.tasks = [
+            asyncio.create_task(self.write_loop()),
+            asyncio.create_task(self.read_loop())
+        ]
+        print(f"Connected to robot at {self.host}:{self.port}")
+
+    def get_timeout(self, message):
+        """
+        Возвращает таймаут ответа для команды.
+
+        Параметры:
+            message (str): команда (например, "Move,2,12,2,28\r\n")
+
+        Возвращает:
+            float: таймаут в секундах
+        """
+        return self.timeouts.get(command_name(message), self.default_timeout)
 
-    def send_and_receive(self, message):
+    async def write_loop(self):
+        """
+        Отправляет команды из очереди, не дожидаясь ответов на предыдущие.
+
+        Одновременно без ответа остается не более pipeline_depth команд.
+        """
+        while True:
+            message, future, timeout = await self.queue.get()
+            if future.done():
+                continue
+            await self.in_flight.acquire()
+            self.pending.append((message, future, timeout))
+            if len(self.pending) == 1: # робот свободен и начинает эту команду сразу
+                self.watch_reply()
+            self.writer.write(message.encode())
+            if not self.queue.empty(): # команды пакета пишутся подряд, drain один раз
+                continue
+            try:
+                await self.writer.drain()
+            except OSError as e:
+                self.fail_pending(e)
+                return
+
+    def watch_reply(self):
+        """
+        Ставит таймер ответа на первую команду из pending.
+
+        Робот выполняет команды по очереди, поэтому таймаут команды
+        отсчитывается с момента, когда робот к ней приступил: с ответа
+        на предыдущую или с отправки, если робот был свободен. Команды,
+        ждущие своей очереди в пакете, не истекают раньше времени.
+        """
+        if self.deadline is not None:
+            self.deadline.cancel()
+            self.deadline = None
+        if self.pending:
+            _, _, timeout = self.pending[0]
+            self.deadline = self.loop.call_later(timeout, self.reply_timed_out)
+
+    def reply_timed_out(self):
+        """
+        Обрабатывает истекший таймаут первой команды (вызывается таймером).
+
+        Ответы сопоставляются командам по порядку: после потерянного
+        ответа все следующие сдвинулись бы, поэтому все команды без
+        ответа завершаются ошибкой, а соединение открывается заново —
+        один раз на таймаут.
+        """
+        self.deadline = None
+        message, _, timeout = self.pending[0]
+        self.timed_out = True
+        print(f"Robot did not respond to {message.strip()!r} in {timeout} s, reconnecting")
+        self.fail_pending(ConnectionError("Robot reply timed out"))
+        self.reconnecting = asyncio.ensure_future(self.connect())
+
+    async def read_loop(self):
+        """Читает ответы робота, разделенные \\r\\n, и сопоставляет их командам по порядку."""
+        while True:
+            try:
+                line = await self.reader.readuntil(DELIMITER)
+            except (asyncio.IncompleteReadError, OSError) as e:
+                self.fail_pending(ConnectionError(f"Robot connection lost: {e}"))
+                return
+            if not self.pending:
+                print(f"Unexpected robot response: {line!r}")
+                continue
+            _, future, _ = self.pending.popleft()
+            self.in_flight.release()
+            self.watch_reply()
+            self.last_reply = self.loop.time()
+            self.timed_out = False
+            if not future.done():
+                future.set_result(line[:-len(DELIMITER)].decode())
+
+    def fail_pending(self, error):
+        """
+        Завершает ошибкой все команды, ожидающие ответа, и закрывает
+        соединение. Задачи чтения и записи закрытого соединения
+        останавливаются, чтобы не тронуть команды следующего.
+
+        Параметры:
+            error (Exception): причина ошибки
+        """
+        for task in self.tasks:
+            if task is not asyncio.current_task():
+                task.cancel()
+        self.tasks = []
+        if self.deadline is not None:
+            self.deadline.cancel()
+            self.deadline = None
+        while self.pending:
+            _, future, _ = self.pending.popleft()
+            if not future.done():
+                future.set_exception(error)
+        while self.queue is not None and not self.queue.empty():
+            _, future, _ = self.queue.get_nowait()
+            if not future.done():
+                future.set_exception(error)
+        if self.writer is not None:
+            self.writer.close()
+        self.reader = None
+        self.writer = None
+
+    def submit_batch(self, messages, timeout=None):
+        """
+        Ставит в очередь робота несколько команд подряд.
+
+        Команды отправляются одной серией без ожидания ответов (в пределах
+        pipeline_depth) и выполняются роботом в переданном порядке.
+
+        Параметры:
+            messages (list[str]): команды для отправки
+            timeout (float | None): таймаут ответа на каждую команду
+
+        Возвращает:
+            asyncio.Future: результат — список ответов робота (None при ошибке)
+        """
+        return asyncio.gather(*[
+            self.send_and_receive(message, timeout) for message in messages
+        ])
+
+    async def send_and_receive(self, message, timeout=None):
         """
         Отправляет команду роботу и получает ответ.
-        
+
+        Таймаут отсчитывается с момента, когда робот приступил к
+        команде (см. watch_reply), а не с постановки в очередь.
+
         Параметры:
             message (str): команда для отправки
-        
+            timeout (float | None): таймаут ответа, по умолчанию по типу команды
+
         Возвращает:
-            str | None: ответ робота или None при ошибке
+            str | None: ответ робота или None при ошибке (в том числе таймауте)
         """
+        if self.reconnecting is not None and not self.reconnecting.done():
+            await asyncio.shield(self.reconnecting)  # соединение открывается после таймаута
+        if not self.connected:
+            print("Error communicating with robot: not connected")
+            return None
+        if timeout is None:
+            timeout = self.get_timeout(message)
+        command = command_name(message)
+        start = time.perf_counter()
+        future = self.loop.create_future()
+        self.queue.put_nowait((message, future, timeout))
         try:
-            self.socket.sendall(message.encode())
-            response = self.socket.recv(1024).decode()
-            return response
+            response = await future
         except Exception as e:
+            ROBOT_COMMAND_ERRORS.inc(command)
             print(f"Error communicating with robot: {e}")
             return None
+        ROBOT_COMMAND_SECONDS.observe(time.perf_counter() - start, command)
+        return response
+
+    async def sense(self, board):
+        """
+        Запрашивает у робота занятые клетки доски.
+
+        Команда "Occupancy,доска\r\n", ответ "OK,маска" — 16
+        шестнадцатеричных цифр, бит клетки n (1-64) — 1 << (n - 1).
+        Робот без датчиков отвечает ошибкой, после этого запрос больше
+        не отправляется.
+
+        Параметры:
+            board (int): номер доски
+
+        Возвращает:
+            set[int] | None: занятые клетки в нумерации робота или None,
+                если робот не сообщает занятость
+        """
+        if self.sensing is False:
+            return None
+        reply = parse_reply(await self.send_and_receive(f"Occupancy,{board}\r\n"))
+        if not reply.ok:
+            if reply.code in (ERROR_FORMAT, ERROR_UNKNOWN):
+                self.sensing = False
+            return None
+        try:
+            mask = int(reply.data or "", 16)
+        except ValueError:
+            self.sensing = False
+            return None
+        self.sensing = True
+        return {cell for cell in range(1, 65) if mask >> (cell - 1) & 1}
 
-    def close(self):
+    async def close(self):
         """Закрывает соединение с роботом."""
-        if self.socket:
-            self.socket.close()
+        if self.reconnecting is not None:
+            self.reconnecting.cancel()
+            self.reconnecting = None
+        for task in self.tasks:
+            task.cancel()
+        self.tasks = []
+        if self.writer is not None:
+            self.fail_pending(ConnectionError("Robot connection closed"))
             print("Connection to robot closed")
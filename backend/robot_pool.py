@@ -0,0 +1,172 @@
+import asyncio
+import os
+import random
+
+from dotenv import load_dotenv
+
+from reconcile import BoardShadow
+from robot_conn import RobotConnector
+
+load_dotenv()
+
+ROBOT_PING_INTERVAL = float(os.getenv("ROBOT_PING_INTERVAL", 10))  # секунды между проверками робота
+ROBOT_PING_TIMEOUT = float(os.getenv("ROBOT_PING_TIMEOUT", 5))  # секунды ожидания ответа на проверку
+ROBOT_PING_COMMAND = os.getenv("ROBOT_PING_COMMAND", "Ping")  # команда проверки, пусто — робот не проверяется командой
+ROBOT_BACKOFF_MIN = float(os.getenv("ROBOT_BACKOFF_MIN", 1))  # первая пауза перед переподключением
+ROBOT_BACKOFF_MAX = float(os.getenv("ROBOT_BACKOFF_MAX", 60))  # наибольшая пауза перед переподключением
+
+
+class RobotPool:
+    def __init__(self, endpoints):
+        """
+        Соединения со всеми роботами (досками) сервера.
+
+        Соединение с роботом держится постоянно и не закрывается между
+        партиями. Исправность робота определяется по ответам на команды;
+        простаивающему роботу периодически отправляется команда проверки.
+        Робот, который не ответил или к которому нет подключения,
+        считается неисправным, и к нему выполняется переподключение с
+        растущей паузой. Об освободившихся досках и роботах пул сообщает
+        подписчикам listeners. Для каждого робота пул хранит фактическое
+        положение фигур (BoardShadow) между партиями. Если процессов
+        сервера несколько, пул подключается только к роботам досок,
+        которыми владеет процесс (owned).
+
+        Параметры:
+            endpoints (dict): идентификатор доски → (host, port)
+        """
+        self.robots = {
+            game_id: RobotConnector(host, port)
+            for game_id, (host, port) in endpoints.items()
+        }
+        self.shadows = {game_id: BoardShadow() for game_id in self.robots}  # фигуры на досках роботов
+        self.healthy = set(self.robots)  # до первой проверки роботы считаются исправными
+        self.listeners = []  # функции без аргументов, вызываемые notify()
+        self.monitors = {}  # идентификатор доски → задача проверки робота
+        self.owned = set(self.robots)  # доски, роботами которых управляет этот процесс
+        self.started = False
+
+    def start(self):
+        """Запускает проверку роботов своих досок."""
+        self.started = True
+        for game_id in self.owned:
+            if game_id not in self.monitors:
+                self.monitors[game_id] = asyncio.create_task(self.monitor(game_id))
+
+    def own(self, game_id):
+        """
+        Берет робота доски под управление процесса (доска получена в аренду).
+
+        Параметры:
+            game_id (str): идентификатор доски
+        """
+        self.owned.add(game_id)
+        self.healthy.add(game_id)  # до первой проверки робот считается исправным
+        if self.started:
+            self.start()
+        self.notify()
+
+    async def disown(self, game_id):
+        """
+        Отдает робота доски другому процессу: проверка останавливается,
+        соединение закрывается, модель фигур сбрасывается (новый владелец
+        сверит ее с партией).
+
+        Параметры:
+            game_id (str): идентификатор доски
+        """
+        self.owned.discard(game_id)
+        self.healthy.discard(game_id)
+        task = self.monitors.pop(game_id, None)
+        if task is not None:
+            task.cancel()
+        await self.robots[game_id].close()
+        self.shadows[game_id] = BoardShadow()
+
+    async def stop(self):
+        """Останавливает проверку и закрывает соединения с роботами."""
+        self.started = False
+        for task in self.monitors.values():
+            task.cancel()
+        self.monitors = {}
+        for robot in self.robots.values():
+            await robot.close()
+
+    def get(self, game_id):
+        """
+        Возвращает соединение с роботом доски.
+
+        Параметры:
+            game_id (str): идентификатор доски
+
+        Возвращает:
+            RobotConnector | None: соединение или None для неизвестной доски
+        """
+        return self.robots.get(game_id)
+
+    def is_healthy(self, game_id):
+        return game_id in self.healthy and game_id in self.owned
+
+    def set_health(self, game_id, healthy):
+        """
+        Отмечает исправность робота; исправный робот будит очередь.
+
+        Параметры:
+            game_id (str): идентификатор доски
+            healthy (bool): робот отвечает
+        """
+        if healthy and game_id not in self.healthy:
+            print(f"Robot of board {game_id} is available")
+            self.healthy.add(game_id)
+            self.notify()
+        elif not healthy and game_id in self.healthy:
+            print(f"Robot of board {game_id} is unavailable")
+            self.healthy.discard(game_id)
+
+    async def monitor(self, game_id):
+        """
+        Следит за роботом доски.
+
+        Без подключения робот переподключается с паузой от
+        ROBOT_BACKOFF_MIN до ROBOT_BACKOFF_MAX секунд (удваивается после
+        каждой неудачи). Исправность определяется по ответам: робот,
+        команда которому осталась без ответа, неисправен, пока не
+        ответит снова. Роботу, который простаивает и не отвечал дольше
+        ROBOT_PING_INTERVAL, отправляется ROBOT_PING_COMMAND; любой ответ
+        (в том числе ошибка неизвестной команды) показывает, что робот
+        работает. Без команды проверки простаивающий робот с открытым
+        соединением считается исправным.
+
+        Параметры:
+            game_id (str): идентификатор доски
+        """
+        robot = self.robots[game_id]
+        backoff = ROBOT_BACKOFF_MIN
+        while True:
+            await robot.connect()
+            if not robot.connected:
+                self.set_health(game_id, False)
+                await asyncio.sleep(backoff * random.uniform(0.8, 1.2))
+                backoff = min(backoff * 2, ROBOT_BACKOFF_MAX)
+                continue
+            backoff = ROBOT_BACKOFF_MIN
+            quiet = asyncio.get_running_loop().time() - robot.last_reply  # секунды без ответов
+            if ROBOT_PING_COMMAND and robot.idle and (robot.timed_out or quiet >= ROBOT_PING_INTERVAL):
+                response = await robot.send_and_receive(f"{ROBOT_PING_COMMAND}\r\n", ROBOT_PING_TIMEOUT)
+                if response is None:
+                    self.set_health(game_id, False)
+                    await robot.close()  # переподключение на следующем шаге
+                    continue
+                self.set_health(game_id, True)
+            elif robot.timed_out:
+                self.set_health(game_id, False)
+                if not ROBOT_PING_COMMAND:  # без проверки робот получает следующую партию
+                    robot.timed_out = False
+            else:
+                self.set_health(game_id, True)
+            await asyncio.sleep(ROBOT_PING_INTERVAL)
+
+    def notify(self):
+        """Сообщает подписчикам (лобби), что доска или робот освободились."""
+        for listener in self.listeners:
+            listener()
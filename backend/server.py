@@ -1,237 +1,169 @@
 import asyncio
 import websockets
 import json
+import os
+import time
 
 import chess
-from itertools import chain, zip_longest
+from dotenv import load_dotenv
+
+from urllib.parse import urlsplit, parse_qs
 from redis_conn import RedisConnector
-from robot_conn import RobotConnector
-from game import (
-    Session,
-    Colors
+from game_store import GameStore
+from reset_planner import plan_reset
+from motion_planner import plan_move
+from squares import SQUARE_BY_NAME, NAME_BY_CELL, MAIN_BOARD, GRAVEYARD_BOARD
+from game import Colors
+from session_registry import SessionRegistry, DEFAULT_GAME_ID, POOL_GAME_ID
+from lobby import Lobby, parse_rating
+from engine import think
+from timer_wheel import TimerWheel
+from archive import GameArchive, ArchivedGame
+from reconcile import execute_steps, sync_boards
+from cluster import Cluster, CLUSTER, fan_out, route_path
+from metrics import (
+    MOVE_SECONDS,
+    RESET_SECONDS,
+    RESET_MOVES,
+    CONNECTIONS,
+    start_metrics_server,
+    log_metrics
 )
 
-LETTERS = "abcdefgh"
+load_dotenv()
 
-pos_board_2 = 0
+RECONNECT_TIMEOUT = float(os.getenv("RECONNECT_TIMEOUT", 60))  # секунды ожидания переподключения
+IDLE_TIMEOUT = float(os.getenv("IDLE_TIMEOUT", 600))  # секунды без ходов до завершения брошенной партии, 0 — без ограничения
+LOBBY_SEAT_TIMEOUT = float(os.getenv("LOBBY_SEAT_TIMEOUT", 10))  # секунды ожидания за доской соперника из пары лобби
+SPECTATOR_BUFFER_LIMIT = int(os.getenv("SPECTATOR_BUFFER_LIMIT", 256 * 1024))  # байт неотправленных данных зрителя
+WS_COMPRESSION = os.getenv("WS_COMPRESSION", "deflate")  # permessage-deflate, "none" — без сжатия
 
-def change_format_cell(cell):
+def get_query_param(path, name):
     """
-    Конвертирует шахматные координаты в числовой индекс.
-    
-    Пример:
-        "e4" → 28
-    
+    Возвращает параметр строки запроса WebSocket-подключения.
+
     Параметры:
-        cell (str): координаты клетки (например, "e4")
-    
+        path (str): путь запроса (например, "/board1?token=...")
+        name (str): имя параметра
+
     Возвращает:
-        int: числовой индекс (1-64)
+        str | None: значение параметра или None
     """
-    return int(cell[1]) * 8 - (8 - (int(LETTERS.index(cell[0])) + 1))
-
-def change_format_cell_original(pos):
-      if 1 <= pos <= 64:  # Проверяем, что число в допустимом диапазоне
-            column = LETTERS[(pos - 1) % 8]  # Находим столбец
-            row = (pos - 1) // 8 + 1  # Находим строку
-            return f"{column}{row}"
-      
-def robot_request(board_from, pos_from, board_to, pos_to):
-    return f"Move,{board_from},{pos_from},{board_to},{pos_to}\r\n"
-
-def decode_redis(data):
-    return data.decode("utf-8")
-
-def return_piece(square,board: chess.Board,robot,piece_positions): #возврат фигуры на свое место
-
-    current_square = square[0]
-    figure = square[1]
-    Board = 2
-
-    if square[0][0:7] == "Board_2":#проверка на то что клетка со 2 доски
-        current_square = None
-        square_board_2 = square[0][7:len(square[0])]
-        Board = 1
-
-    flag = False
-
-    for square in piece_positions[figure]:#если фугура стоит на каком либо месте из своих возможных
-        if current_square == square:
-            flag = True
-
-        if flag == True:
-            break
-
-        
-        
-    
-    if flag == False:#идем сюда в том случае если фигура не стоит ни на каком-либо своем месте
-        for square in piece_positions[figure]:
-            flag = False
-            piece = board.piece_at(change_format_cell(square)-1) # проверка клетки на наличие какой либо фигуры
-        #проверяем можем ли мы поставить фигуру на клетку начинающуюю с начала списка
-
-            #если там другая фигура и не того же типа убираем ее на свое место
-            if piece != None and piece.symbol() != figure:
-                square = (square,piece.symbol())
-                return_piece(square,board,robot,piece_positions)
-
-            
-            #если там никого нет, ставим
-            if piece == None:
-                if current_square != None:#если клетка не находиться на 2 доске
-                    board.remove_piece_at(change_format_cell(current_square)-1) #удаляем фигуру в логике в доске 2
-                else:
-                    current_square = square_board_2
-
-
-                board.set_piece_at(change_format_cell(square)-1,chess.Piece.from_symbol(figure)) # и добавляем ее
-
-                robot_response = robot.send_and_receive( #переставляем фигуру на 1 доске
-                robot_request(
-                    Board,
-                    change_format_cell(current_square),
-                    2,
-                    change_format_cell(square)
-                    )
-                )
-
-                
-
-                flag = True
+    return parse_qs(urlsplit(path).query).get(name, [None])[0]
 
-            if flag == True:#установили фигуру на свое место
-                break
-
-def get_remaining_pieces_with_squares(board: chess.Board):#расположение фигур на доске
-    
-        remaining_pieces = []
-    
-        for square in chess.SQUARES:
-            piece = board.piece_at(square)
-            if piece is not None:
-                square_name = chess.square_name(square)  # например, "e4"
-                piece_symbol = piece.symbol()    # например, "P"
-                remaining_pieces.append((square_name, piece_symbol))
-    
-        return remaining_pieces
-
-def return_all_pieces_on_them_places(board,robot,piece_positions):#возврат фигур на свои места 
-    remaining_piece = get_remaining_pieces_with_squares(board)
-    
-    for square in remaining_piece:
-        return_piece(square,board,robot,piece_positions)
-        remaining_piece = get_remaining_pieces_with_squares(board)
-    
-def return_to_current_board(Move_w,Move_b,board : chess.Board):# приход к текущему состоянию доски
-
-    Move_w = list(reversed([move for move in Move_w if int(move[-1]) == 0]))
-    Move_b = list(reversed([move for move in Move_b if int(move[-1]) == 0]))
-
-
-    for w,b in zip_longest(Move_w,Move_b): #все ходы, чтобы прийти к текущему состоянию доски
-        if w != None:
-            board.push_uci(w[0:2]+w[3:5])
-
-        if b!= None:
-            board.push_uci(b[0:2]+b[3:5])
-    
-def return_piece_from_2_to_1(board: chess.Board,robot,piece_positions,dataBase): #возврат фигуры со 2 доски на 1 доску на свои места
-    dead_pieces_white = [piece for piece in list(map(decode_redis,dataBase.lrange("WHITE",0,-1))) if int(piece[-1]) == 1]
-    dead_pieces_black = [piece for piece in list(map(decode_redis,dataBase.lrange("BLACK",0,-1))) if int(piece[-1]) == 1]
-
-    for piece in dead_pieces_white:
-        square = [f"Board_2{piece[3:5]}",piece[len(piece)-3]]
-        return_piece(square,board,robot,piece_positions)
-    
-    for piece in dead_pieces_black:
-        square = [f"Board_2{piece[3:5]}",piece[len(piece)-3]]
-        return_piece(square,board,robot,piece_positions)
-
-def return_board_to_original(robot):
+def get_game_id(path):
     """
-    Восстанавливает исходное состояние доски используя данные из Redis.
-    
-    Параметры:
-        robot (RobotConnector): подключение к роботу
-    """
-    redis = RedisConnector()# подкл к БД
-    redis.connect()
-    dataBase = redis.client
-
-    #robot = RobotConnector()# подкл к роботу
-    #robot.connect()
-
-    itemsWhite = list(reversed(list(map(decode_redis,dataBase.lrange("WHITE",0,-1)))))
-    itemsBlack = list(reversed(list(map(decode_redis,dataBase.lrange("BLACK",0,-1)))))
-
-    
-    piece_positions = { # клетки на которых стоят фигуры
-    # Белые фигуры
-    "P": ["a2", "b2", "c2", "d2", "e2", "f2", "g2", "h2"],  # Пешки
-    "N": ["b1", "g1"],  # Кони
-    "B": ["c1", "f1"],  # Слоны
-    "R": ["a1", "h1"],  # Ладьи
-    "Q": ["d1"],  # Ферзь
-    "K": ["e1"],  # Король
-    
-    # Черные фигуры (строчные)
-    "p": ["a7", "b7", "c7", "d7", "e7", "f7", "g7", "h7"],  # Пешки
-    "n": ["b8", "g8"],  # Кони
-    "b": ["c8", "f8"],  # Слоны
-    "r": ["a8", "h8"],  # Ладьи
-    "q": ["d8"],  # Ферзь
-    "k": ["e8"],  # Король
-    }
-
-    board = chess.Board()
-
-    return_to_current_board(itemsWhite,itemsBlack,board) 
+    Определяет идентификатор игры по пути WebSocket-запроса.
 
-    return_all_pieces_on_them_places(board,robot,piece_positions)
+    Пример:
+        "/board1" → "board1", "/?game=board1" → "board1", "/" → "default"
 
-    return_piece_from_2_to_1(board,robot,piece_positions,dataBase)
+    Параметры:
+        path (str): путь запроса
 
+    Возвращает:
+        str: идентификатор игры
+    """
+    game_id = get_query_param(path, "game")
+    if game_id is None:
+        game_id = urlsplit(path).path.strip("/")
+    return game_id or DEFAULT_GAME_ID
 
 class WebSocketServer:
-    def __init__(self):
-        self.robot_conn = RobotConnector()
-        self.redis_conn = RedisConnector()
-        self.session = Session()
+    def __init__(self, redis_conn=None, sessions=None):
+        self.redis_conn = redis_conn if redis_conn is not None else RedisConnector()
+        self.sessions = sessions if sessions is not None else SessionRegistry()
+        self.store = GameStore(self.redis_conn)
+        self.lobby = Lobby(self.sessions)
+        self.timers = TimerWheel()  # часы, переподключения и простои всех партий
+        self.tasks = set()  # задачи, запущенные таймерами
+        self.archive = GameArchive()  # PGN завершенных партий
+        self.cluster = Cluster(self) if CLUSTER else None  # аренда досок и пересылка между процессами
+        self.metrics_server = None  # HTTP-сервер метрик
+        self.metrics_log = None  # задача печати метрик в лог
 
     async def send_message(self, message, websocket):
         await websocket.send(json.dumps(message))
 
-    async def broadcast(self, message):
+    async def broadcast(self, message, session, exclude=None, delta=None):
         """
-        Рассылает сообщение всем подключенным клиентам.
+        Рассылает сообщение всем подключенным клиентам сессии.
+
+        Сообщение сериализуется один раз. Игрокам оно отправляется
+        одновременно, зрителям — без ожидания (broadcast_spectators).
         
         Параметры:
             message (dict): сообщение для рассылки
+            session (Session): игровая сессия
+            exclude (Player | None): игрок, которому сообщение не отправляется
+            delta (dict | None): короткая версия сообщения для session.delta_clients
+        """
+        data = json.dumps(message)
+        delta_data = json.dumps(delta) if delta is not None else data
+        sends = []
+        for connection in session.players:
+            if connection is None or connection is exclude or connection.engine:
+                continue
+            if connection.websocket is None: # игрок переподключится и получит сообщение позже
+                connection.missed.append(data)
+            elif connection.websocket in session.delta_clients:
+                sends.append(connection.websocket.send(delta_data))
+            else:
+                sends.append(connection.websocket.send(data))
+        self.broadcast_spectators(data, session, delta_data)
+        for result in await asyncio.gather(*sends, return_exceptions=True):
+            if isinstance(result, Exception) and not isinstance(result, websockets.ConnectionClosed):
+                print(f"Error sending message to player: {result}")
+
+    def broadcast_spectators(self, data, session, delta_data=None):
+        """
+        Рассылает сериализованное сообщение зрителям сессии.
+
+        Данные пишутся в буферы соединений без ожидания отправки, поэтому
+        зрители не задерживают ходы игроков. Зритель, у которого скопилось
+        больше SPECTATOR_BUFFER_LIMIT байт неотправленных данных, отключается.
+
+        Параметры:
+            data (str): сообщение в формате JSON
+            session (Session): игровая сессия
+            delta_data (str | None): короткая версия сообщения для session.delta_clients
         """
-        for connection in self.session.players:
-            await self.send_message(message, connection.websocket)
+        for websocket in list(session.spectators):
+            if websocket.transport.get_write_buffer_size() > SPECTATOR_BUFFER_LIMIT:
+                print(f"Dropping slow spectator of board {session.game_id}")
+                session.remove_spectator(websocket)
+                websocket.transport.abort()
+        if delta_data is None or not session.delta_clients:
+            fan_out(session.spectators, data)
+            return
+        delta_spectators = session.spectators & session.delta_clients
+        fan_out(session.spectators - delta_spectators, data)
+        fan_out(delta_spectators, delta_data)
 
-    async def handle_message(self, message, websocket):
+    async def handle_message(self, message, websocket, session):
         """
         Обрабатывает входящие сообщения от клиента.
         
         Параметры:
             message (dict): декодированное JSON-сообщение
             websocket (WebSocket): соединение-источник
+            session (Session): игровая сессия клиента
         """
         action = message.get('type')
         if action is None:
             raise Exception("The required field action is missing")
 
         if action == 'make_move':
-            await self.handle_move(message, websocket)
+            await self.handle_move(message, websocket, session)
         elif action == 'get_board_state':
-            await self.handle_board_state(websocket)
+            await self.handle_board_state(websocket, session)
+        elif action == 'get_legal_moves':
+            await self.handle_legal_moves(message, websocket, session)
         else:
             raise Exception('Invalid type')
 
-    async def handle_move(self, message, websocket):
+    async def handle_move(self, message, websocket, session):
+        start = time.perf_counter()
         data = message.get('data')
         if data is None:
             raise Exception("The required field action is missing")
@@ -242,199 +174,1002 @@ class WebSocketServer:
                 "Mandatory fields pos_start and pos_end are missing"
             )
         
-        piece_simbol_start = self.session.board.piece_at(change_format_cell(pos_start)-1).symbol()
-        print(piece_simbol_start)
-        
-
-        if  self.session.check_square(pos_end) != None: #проверка на занятость клетки фигурой
-            cell_occupied = True
-            piece_simbol_end = self.session.board.piece_at(change_format_cell(pos_end)-1).symbol()
-        else:
-            cell_occupied = False
-        
-    
-        if not self.session.make_move(pos_start+pos_end):
+        move = session.find_move(pos_start, pos_end, data.get('promotion'))
+        if move is None: # проверка по множеству легальных ходов позиции
             raise Exception(
                 "Invalid fields pos_start and pos_end. Please try again."
             )
-       
-        if cell_occupied: 
-            global pos_board_2 
-            pos_board_2 = pos_board_2+1
-            robot_response = self.robot_conn.send_and_receive( #убираем фигуру на 1 доску
-                robot_request(
-                    2,
-                    change_format_cell(pos_end),
-                    1,
-                    pos_board_2
-                )
-            )
-             
-            #await self.broadcast_success_move()
-        
-            color = self.session.players[
-                1 - self.session.current_player
-            ].figures_color.name
-            self.redis_conn.execute( # данные, которые хранятся в БД, что фигура была убрана с доски
-                'RPUSH',
-                self.session.players[
-                    1 - self.session.current_player
-                ].figures_color.name,
-                f"{pos_end}-{change_format_cell_original(pos_board_2)}-{color}-{piece_simbol_end}-1"
-            )
-        
-        robot_response = self.robot_conn.send_and_receive(
-            robot_request(
-                2,
-                change_format_cell(pos_start),
-                2,
-                change_format_cell(pos_end)
-            )
-        )
-        print(robot_response)
-
-        color = self.session.players[
-                self.session.current_player
-            ].figures_color.name
-        self.redis_conn.execute(
-            'RPUSH',
-            self.session.players[
-                self.session.current_player
-            ].figures_color.name,
-            f"{pos_start}-{pos_end}-{color}-{piece_simbol_start}-0"
+        now = asyncio.get_running_loop().time()
+        time_left = session.time_left(now)
+        if time_left is not None and time_left <= 0: # ход пришел раньше срабатывания таймера
+            self.flag_fall(session, session.board.turn)
+            raise Exception("Time is over")
+        # взятая фигура, ладья при рокировке и фигура превращения
+        # переставляются вместе с ходом одной серией команд робота
+        plan = plan_move(
+            session.board,
+            move,
+            session.graveyard,
+            session.arm_position,
+            session.calibration,
+            session.stand_ins
         )
-        await self.broadcast_success_move()
-        self.session.current_player = 1 - self.session.current_player
-
-    async def handle_board_state(self, websocket):
-        curr_player_color = self.session.players[
-                self.session.current_player
-            ].figures_color
-        player_color = 'b' if curr_player_color == Colors.BLACK else 'w'
+        session.make_move(move)
+        session.press_clock(now)
+        self.schedule_timeouts(session)
+        for record in plan.records:
+            session.update_graveyard(record)
+        session.arm_position = plan.steps[-1][2:]
+        ply = session.seq
+        robot_start = time.perf_counter()
+        # сначала повторяются перемещения, которые робот не выполнил раньше
+        steps, session.shadow.unresolved = session.shadow.unresolved + plan.steps, []
+        session.robot_task = asyncio.ensure_future(execute_steps(
+            session.robot_conn, session.shadow, session.calibration, steps
+        ))
+
+        await self.store.save_move(session, plan.records) # взятие и ход одной транзакцией
+        await self.broadcast_success_move(session, move)
+        session.current_player = 1 - session.current_player
+        MOVE_SECONDS.observe(time.perf_counter() - start)
+        self.engine_turn(session) # компьютер думает, пока робот переставляет фигуры
+
+        # ход уже разослан игрокам, ждем только робота этой доски;
+        # завершение партии не прерывает перемещения, начатые роботом
+        unresolved = await asyncio.shield(session.robot_task)
+        session.robot_times[ply] = time.perf_counter() - robot_start
+        # время робота не списывается с соперника: его часы идут с этого момента
+        session.start_turn(asyncio.get_running_loop().time())
+        self.schedule_timeouts(session)
+        if unresolved or session.desynced:
+            session.shadow.unresolved = unresolved
+            await self.report_desync(session)
+
+        outcome = session.check_gameover()
+        if outcome is not None: # партия заканчивается, когда робот закончил последний ход
+            self.spawn(self.end_game(
+                session,
+                outcome.result(),
+                outcome.termination.name.lower()
+            ))
+
+    def engine_turn(self, session):
+        """
+        Запускает расчет хода компьютера, если сейчас его очередь.
+
+        Параметры:
+            session (Session): игровая сессия
+        """
+        player = session.players[session.current_player] if session.is_active else None
+        if player is None or not player.engine or session.board.is_game_over():
+            return
+        session.engine_task = asyncio.create_task(self.engine_move(session))
+
+    async def engine_move(self, session):
+        """
+        Выбирает ход компьютера в пуле процессов и ставит его в очередь
+        сессии как make_move без соединения.
+
+        Параметры:
+            session (Session): игровая сессия
+        """
+        try:
+            move = await think(session.board)
+        except Exception as e:
+            print(f"Engine failed on board {session.game_id}: {e}")
+            return
+        session.inbox.put_nowait((
+            None,
+            {
+                "type": "make_move",
+                "data": {
+                    "pos_start": chess.SQUARE_NAMES[move.from_square],
+                    "pos_end": chess.SQUARE_NAMES[move.to_square],
+                    "promotion": chess.piece_symbol(move.promotion) if move.promotion else None
+                }
+            }
+        ))
+
+    def board_message(self, session, message_type):
+        """
+        Возвращает сообщение с состоянием доски.
+
+        Параметры:
+            session (Session): игровая сессия
+            message_type (str): тип сообщения ("board_state" или "update_game_state")
+
+        Возвращает:
+            dict: сообщение с FEN, номером хода и цветом стороны, которая ходит
+        """
         message = {
-            "type": "board_state",
+            "type": message_type,
             "data": {
                 "board_state": {
-                    "fen": self.session.return_board()
+                    "fen": session.return_board()
                 },
-                "player_color": player_color
+                "seq": session.seq,
+                "player_color": 'w' if session.board.turn == chess.WHITE else 'b'
             }
         }
-        await self.send_message(message, websocket)
+        clock = session.clock_state(asyncio.get_running_loop().time())
+        if clock is not None:
+            message["data"]["clock"] = clock
+        return message
 
-    async def broadcast_success_move(self):
-        curr_player_color = self.session.players[
-                self.session.current_player
-            ].figures_color
-        player_color = 'w' if curr_player_color == Colors.BLACK else 'b'
-        message = {
-            "type": "update_game_state",
+    async def handle_board_state(self, websocket, session):
+        await self.send_message(self.board_message(session, "board_state"), websocket)
+
+    async def handle_legal_moves(self, message, websocket, session):
+        """
+        Отправляет клиенту легальные ходы текущей позиции (подсказки).
+
+        Параметры:
+            message (dict): сообщение; data.pos_start ограничивает ходы одной фигурой
+            websocket (WebSocket): соединение-источник
+            session (Session): игровая сессия
+        """
+        pos_start = (message.get('data') or {}).get('pos_start')
+        moves = sorted(
+            move.uci() for move in session.legal_moves
+            if pos_start is None or move.from_square == SQUARE_BY_NAME.get(pos_start)
+        )
+        await self.send_message(
+            {
+                "type": "legal_moves",
+                "data": {
+                    "moves": moves,
+                    "player_color": 'w' if session.board.turn == chess.WHITE else 'b'
+                }
+            },
+            websocket
+        )
+
+    async def broadcast_success_move(self, session, move):
+        """
+        Рассылает состояние игры после хода.
+
+        Клиенты, подключенные с updates=delta, получают только ход и его
+        номер; остальные — полный FEN.
+
+        Параметры:
+            session (Session): игровая сессия
+            move (chess.Move): сделанный ход
+        """
+        message = self.board_message(session, "update_game_state")
+        delta = {
+            "type": "move",
             "data": {
-                "board_state": {
-                    "fen": self.session.return_board()
-                },
-                "player_color": player_color
+                "seq": session.seq,
+                "move": move.uci()
             }
         }
-        await self.broadcast(message)
+        if "clock" in message["data"]:
+            delta["data"]["clock"] = message["data"]["clock"]
+        await self.broadcast(message, session, delta=delta)
+
+    async def init_game(self, session):
+        for connection in session.players:
+            if not connection.engine:
+                await self.send_init(connection)
+
+    async def send_init(self, player):
+        """
+        Отправляет игроку цвет его фигур и токен для переподключения.
 
-    async def init_game(self):
-        def get_init_message(color):
-            return {
+        Параметры:
+            player (Player): игрок
+        """
+        await self.send_message(
+            {
                 "type": "init_game",
                 "data": {
-                    "color": color
+                    "color": 'w' if player.figures_color == Colors.WHITE else 'b',
+                    "token": player.token
                 }
-            }
-        for connection in self.session.players:
-            if connection.figures_color == Colors.WHITE:
-                await self.send_message(
-                    get_init_message('w'),
-                    connection.websocket
-                )
-            else:
-                await self.send_message(
-                    get_init_message('b'),
-                    connection.websocket
-                )
+            },
+            player.websocket
+        )
+
+    async def dispatch(self, session):
+        """
+        Последовательно обрабатывает сообщения игроков сессии.
+
+        Сообщения поступают в очередь session.inbox от задач чтения
+        соединений. Пока очередь пуста, задача спит на ней и не
+        потребляет процессорное время.
+
+        Параметры:
+            session (Session): игровая сессия
+        """
+        while True:
+            websocket, message = await session.inbox.get()
+            try:
+                if message.get('type') == 'make_move':
+                    if websocket in session.spectators:
+                        raise Exception("Spectators cannot make moves")
+                    if not session.is_active:
+                        raise Exception("The game has not started yet")
+                    player = session.players[session.current_player]
+                    if player.websocket is not websocket or (
+                        websocket is None and not player.engine
+                    ):
+                        raise Exception("Not your turn")
+                await self.handle_message(message, websocket, session)
+            except websockets.ConnectionClosed:
+                pass
+            except Exception as e:
+                if websocket is None: # ход компьютера
+                    print(f"Engine move rejected on board {session.game_id}: {e}")
+                    continue
+                try:
+                    await self.send_message(
+                        {
+                            "type": "error",
+                            "error": {
+                                "message": e.args[0]
+                            }
+                        },
+                        websocket
+                    )
+                except websockets.ConnectionClosed:
+                    pass
 
     async def handle_client(self, websocket):
         """
         Обрабатывает подключение клиента.
+
+        Клиент выбирает игру (доску) путем запроса: "/board1" или
+        "/?game=board1". Без указания игры используется доска по умолчанию.
+        Игрок, потерявший соединение, возвращается в партию с токеном
+        из init_game: "/board1?token=...". Зритель подключается с
+        параметром role: "/board1?role=spectator", он получает состояние
+        доски и все обновления, но не занимает место игрока. С параметром
+        updates=delta клиент получает после ходов сообщения move вместо FEN.
+        Игрок, подключившийся к POOL_GAME_ID ("/any") или к занятой доске,
+        ждет соперника и свободную доску в лобби (seat_from_lobby);
+        параметры color и rating задают желаемый цвет и рейтинг. С
+        параметром opponent=engine соперником становится компьютер.
+        Соединение только читает сообщения и передает их в очередь
+        сессии, обработку выполняет dispatch. Если процессов сервера
+        несколько, клиент доски другого процесса пересылается ее
+        владельцу (Cluster.relay).
         
         Параметры:
             websocket (WebSocket): соединение с клиентом
         """
-        if self.session.active_players >= 2:
-            await websocket.send(json.dumps({"message": "session is full"}))
+        game_id = get_game_id(websocket.request.path)
+        token = get_query_param(websocket.request.path, "token")
+        spectator = get_query_param(websocket.request.path, "role") == "spectator"
+        delta = get_query_param(websocket.request.path, "updates") == "delta"
+        engine = get_query_param(websocket.request.path, "opponent") == "engine"
+        seat = getattr(websocket, "seat", None)  # место, выданное лобби другого процесса
+        if (
+            self.cluster is not None
+            and game_id in self.cluster.routes
+            and not self.cluster.owns(game_id)
+        ):
+            await self.cluster.relay(websocket, game_id)
             return
-        else:
-            self.session.add_player(websocket)
+        session = None
+        if game_id != POOL_GAME_ID or spectator or token is not None:
+            session = self.sessions.get_or_create(game_id)
+            if session is None:
+                await websocket.send(json.dumps({"message": "unknown board"}))
+                return
+            try:
+                await self.load_session(session)
+            except Exception as e:
+                self.release_session(session)
+                await self.reject_client(websocket, e)
+                return
+        seated = False
+        if seat is not None and session.active_players < (1 if engine else 2):
+            await self.take_seat(session, websocket, {"w": Colors.WHITE, "b": Colors.BLACK}[seat], engine)
+            seated = True
+        elif session is None or (
+            not spectator
+            and token is None
+            and session.active_players >= (1 if engine else 2)
+        ):
+            try:
+                session = await self.seat_from_lobby(websocket, engine)
+            except Exception as e:
+                await self.reject_client(websocket, e)
+                return
+            if session is None: # игрок ушел из очереди
+                return
+            seated = True
 
-        if self.session.is_active:
-            self.robot_conn.connect()
-            self.redis_conn.connect()
-            await self.init_game()
+        if spectator:
+            session.add_spectator(websocket)
+        elif token is not None:
+            player = session.find_player(token=token)
+            if player is None or player.engine:
+                await websocket.send(json.dumps({"message": "invalid token"}))
+                return
+            await self.resume_player(session, player, websocket)
+        elif not seated:
+            color = get_query_param(websocket.request.path, "color")
+            session.add_player(
+                websocket,
+                {"w": Colors.WHITE, "b": Colors.BLACK}.get(color) if engine else None
+            )
+            if engine:
+                session.add_player(engine=True)
 
-        
-        while True:
-            if self.session.is_active:
-                try:
-                    if self.session.players[
-                        self.session.current_player
-                    ].websocket is websocket:
-                        message = json.loads(await websocket.recv())
-                        print(f"Received message from client: {message}")
-                        await self.handle_message(message, websocket)
-                except websockets.ConnectionClosed:
-                    print("Client disconnected")
-                    return_board_to_original(self.robot_conn)
-                    #asyncio.create_task(self.async_return_board())
-                    self.session.delete_player(websocket)
-                    if self.redis_conn:
-                        self.redis_conn.execute("FLUSHALL")
-                        self.redis_conn.disconnect()
-                    if self.robot_conn:
-                        self.robot_conn.close()
-                    remaining_clients = [
-                        player.websocket 
-                        for player in self.session.players 
-                        if player is not None 
-                        and player.websocket != websocket 
-                        and player.websocket.state == websockets.protocol.State.OPEN
-                    ]
-                    for client in remaining_clients:
-                        await client.close(code=1001, reason="Partner disconnected")
-                        self.session.delete_player(client)
-                    self.session.reset()
+        if delta:
+            session.delta_clients.add(websocket)
+        if session.dispatcher is None:
+            session.dispatcher = asyncio.create_task(self.dispatch(session))
 
-                except Exception as e:
+        if spectator:
+            await self.handle_board_state(websocket, session)
+        elif token is None and session.is_active:
+            if session.seat_timer is not None:
+                session.seat_timer.cancel()
+                session.seat_timer = None
+            await session.robot_conn.connect()
+            if session.shadow.differences(session.physical_board(), session.graveyard.pieces()):
+                await self.async_return_board(session) # прошлый возврат доски не закончен
+            try:
+                await self.redis_conn.connect()
+                await self.store.start_game(session)
+            except Exception as e:
+                await self.abort_start(session, e)
+                return
+            session.started = time.time()
+            session.start_clock(asyncio.get_running_loop().time())
+            self.schedule_timeouts(session)
+            await self.init_game(session)
+            self.engine_turn(session)
+
+        role = "spectator" if spectator else "player"
+        CONNECTIONS.inc(role)
+        try:
+            async for raw_message in websocket:
+                try:
+                    message = json.loads(raw_message)
+                except ValueError:
                     await self.send_message(
                         {
                             "type": "error",
                             "error": {
-                                "message": e.args[0]
+                                "message": "Invalid JSON"
                             }
                         },
                         websocket
                     )
-            await asyncio.sleep(0.1)
+                    continue
+                print(f"Received message from client: {message}")
+                session.inbox.put_nowait((websocket, message))
+        except websockets.ConnectionClosed:
+            pass
+        finally:
+            CONNECTIONS.dec(role)
+        print("Client disconnected")
+        await self.handle_disconnect(session, websocket)
+
+    async def load_session(self, session):
+        """
+        Дожидается загрузки партии доски, которая могла остаться в Redis
+        после перезапуска.
+
+        Параметры:
+            session (Session): игровая сессия
+        """
+        if session.restoring is None:
+            session.restoring = asyncio.ensure_future(self.restore_session(session))
+        try:
+            await session.restoring
+        except Exception:
+            session.restoring = None # следующий клиент повторит загрузку
+            raise
+
+    async def reject_client(self, websocket, error):
+        """
+        Закрывает соединение клиента, партию которого не удалось
+        загрузить или сохранить; остальные партии продолжаются.
+
+        Параметры:
+            websocket (WebSocket): соединение клиента
+            error (Exception): ошибка хранилища
+        """
+        print(f"Storage error: {error}")
+        await websocket.close(code=1011, reason="Storage unavailable")
+
+    async def abort_start(self, session, error):
+        """
+        Отменяет начало партии, которую не удалось сохранить в Redis:
+        доска освобождается, игроки отключаются.
 
-    async def async_return_board(self):
+        Параметры:
+            session (Session): игровая сессия
+            error (Exception): ошибка хранилища
+        """
+        clients = [
+            player.websocket
+            for player in session.players
+            if player is not None and player.websocket is not None
+        ]
+        session.reset()
+        self.release_session(session)
+        for client in clients:
+            await self.reject_client(client, error)
+
+    async def seat_from_lobby(self, websocket, engine=False):
+        """
+        Сажает игрока за доску, выбранную лобби.
+
+        Игрок ждет в лобби соперника и свободную доску, получая
+        сообщения queued с местом в очереди. Выбранная доска сообщается
+        игроку в board_assigned: по ней он переподключается к партии.
+        Если лобби или выбранная доска принадлежат другому процессу
+        сервера, игрок передается ему (Cluster.redirect).
+
+        Параметры:
+            websocket (WebSocket): соединение игрока
+            engine (bool): игрок играет с компьютером и ждет только доску
+
+        Возвращает:
+            Session | None: сессия доски или None, если игрок отключился
+                или передан другому процессу
+        """
+        color = get_query_param(websocket.request.path, "color")
+        rating = parse_rating(get_query_param(websocket.request.path, "rating"))
+        if self.cluster is not None and not self.cluster.owns(POOL_GAME_ID): # лобби ведет другой процесс
+            await self.cluster.redirect(
+                websocket, POOL_GAME_ID, route_path(websocket.request.path, POOL_GAME_ID)
+            )
+            return None
+        while True:
+            assignment = await self.lobby.join(websocket, color, rating, engine)
+            if assignment is None:
+                return None
+            game_id, figures_color = assignment
+            if self.cluster is not None and not self.cluster.owns(game_id): # доска другого процесса
+                self.lobby.seated(game_id)
+                self.sessions.remote_boards.pop(game_id, None)
+                await self.cluster.redirect(
+                    websocket,
+                    game_id,
+                    route_path(websocket.request.path, game_id),
+                    'w' if figures_color == Colors.WHITE else 'b'
+                )
+                return None
+            session = self.sessions.get_or_create(game_id)
+            try:
+                await self.load_session(session)
+            except Exception:
+                self.lobby.seated(game_id)
+                self.release_session(session)
+                raise
+            self.lobby.seated(game_id)
+            if session.active_players < (1 if engine else 2): # восстановленная партия могла занять доску
+                break
+        await self.take_seat(session, websocket, figures_color, engine)
+        return session
+
+    async def take_seat(self, session, websocket, figures_color, engine=False):
+        """
+        Сажает игрока из лобби за доску и сообщает ее в board_assigned.
+
+        Параметры:
+            session (Session): сессия доски
+            websocket (WebSocket): соединение игрока
+            figures_color (Colors): цвет, выбранный лобби
+            engine (bool): напротив садится компьютер
+        """
+        session.add_player(websocket, figures_color)
+        if engine:
+            session.add_player(engine=True)
+        if not session.is_active and session.seat_timer is None:
+            session.seat_timer = self.timers.schedule(
+                LOBBY_SEAT_TIMEOUT, self.seat_expired, session
+            )
+        try:
+            await self.send_message(
+                {"type": "board_assigned", "data": {"game_id": session.game_id}},
+                websocket
+            )
+        except websockets.ConnectionClosed: # место освободит handle_disconnect
+            pass
+
+    def seat_expired(self, session):
+        """
+        Освобождает доску, на которую за LOBBY_SEAT_TIMEOUT не сел
+        соперник из пары лобби (он отключился раньше): ждущий игрок
+        отключается с причиной "Partner disconnected" и может снова
+        встать в очередь (вызывается колесом таймеров).
+
+        Параметры:
+            session (Session): игровая сессия
+        """
+        session.seat_timer = None
+        if session.is_active:
+            return
+        clients = [
+            player.websocket for player in session.players
+            if player is not None and player.websocket is not None
+        ]
+        print(f"Partner did not take a seat at board {session.game_id}")
+        for client in clients: # место освободит handle_disconnect
+            self.spawn(client.close(code=1001, reason="Partner disconnected"))
+
+    async def restore_session(self, session):
+        """
+        Загружает незавершенную партию доски из Redis и ждет возвращения
+        ее игроков в течение RECONNECT_TIMEOUT.
+
+        Параметры:
+            session (Session): новая сессия доски
+        """
+        if not await self.store.restore(session) or not session.is_active:
+            return
+        await session.robot_conn.connect()
+        # после перезапуска фигуры стоят по сохраненной партии, датчики это проверяют
+        session.shadow.load(session.physical_board(), session.graveyard.pieces())
+        if session.robot_conn.connected:
+            await sync_boards(session.robot_conn, session.shadow, session.calibration)
+        for player in session.players:
+            if not player.engine:
+                self.start_reconnect_timer(session, player)
+        self.schedule_timeouts(session) # восстановленная партия продолжается без часов
+        self.engine_turn(session)
+
+    async def resume_player(self, session, player, websocket):
+        """
+        Возвращает отключившегося игрока в партию.
+
+        Игроку повторно отправляются init_game и состояние доски, затем
+        все сообщения, пропущенные за время отключения.
+
+        Параметры:
+            session (Session): игровая сессия
+            player (Player): игрок с этим токеном
+            websocket (WebSocket): новое соединение игрока
+        """
+        old_websocket = player.websocket
+        session.attach_player(player.token, websocket)
+        if old_websocket is not None: # вход с другого устройства вытесняет старое соединение
+            await old_websocket.close(code=1000, reason="Reconnected elsewhere")
+        timer = session.reconnect_timers.pop(player.token, None)
+        if timer is not None:
+            timer.cancel()
+
+        await self.send_init(player)
+        await self.handle_board_state(websocket, session)
+        missed, player.missed = player.missed, []
+        for data in missed:
+            await websocket.send(data)
+        await self.broadcast(
+            {
+                "type": "player_reconnected",
+                "data": {
+                    "color": 'w' if player.figures_color == Colors.WHITE else 'b'
+                }
+            },
+            session,
+            exclude=player
+        )
+
+    async def handle_disconnect(self, session, websocket):
+        """
+        Обрабатывает отключение клиента.
+
+        Зритель и игрок, ожидавший соперника, удаляются из сессии. Игрок
+        идущей партии сохраняет свое место на RECONNECT_TIMEOUT секунд;
+        если он не вернется, партия завершается.
+
+        Параметры:
+            session (Session): игровая сессия
+            websocket (WebSocket): отключившееся соединение
+        """
+        session.delta_clients.discard(websocket)
+        if session.remove_spectator(websocket):
+            self.release_session(session)
+            return
+        player = session.find_player(websocket=websocket)
+        if player is None: # соединение уже вытеснено или партия завершена
+            return
+        if not session.is_active:
+            session.delete_player(websocket)
+            if session.active_players == 0 and session.seat_timer is not None:
+                session.seat_timer.cancel()
+                session.seat_timer = None
+            self.release_session(session)
+            return
+        if RECONNECT_TIMEOUT <= 0:
+            await self.close_session(session)
+            return
+        session.detach_player(websocket)
+        self.start_reconnect_timer(session, player)
+        await self.broadcast(
+            {
+                "type": "player_disconnected",
+                "data": {
+                    "color": 'w' if player.figures_color == Colors.WHITE else 'b',
+                    "timeout": RECONNECT_TIMEOUT
+                }
+            },
+            session,
+            exclude=player
+        )
+
+    def release_session(self, session):
+        """
+        Освобождает сессию, в которой не осталось игроков и зрителей.
+
+        Параметры:
+            session (Session): игровая сессия
+        """
+        if session.active_players > 0:
+            return
+        self.sessions.pool.notify() # доска свободна для игроков из очереди
+        if session.spectators:
+            return
+        if session.dispatcher is not None:
+            session.dispatcher.cancel()
+            session.dispatcher = None
+        self.sessions.release(session.game_id)
+
+    def start_reconnect_timer(self, session, player):
+        """
+        Запускает ожидание возвращения отключившегося игрока.
+
+        Параметры:
+            session (Session): игровая сессия
+            player (Player): отключившийся игрок
+        """
+        session.reconnect_timers[player.token] = self.timers.schedule(
+            RECONNECT_TIMEOUT, self.reconnect_expired, session, player
+        )
+
+    def reconnect_expired(self, session, player):
+        """
+        Завершает партию игрока, не вернувшегося за RECONNECT_TIMEOUT
+        (вызывается колесом таймеров).
+
+        Параметры:
+            session (Session): игровая сессия
+            player (Player): отключившийся игрок
+        """
+        session.reconnect_timers.pop(player.token, None)
+        print(f"Player did not reconnect to board {session.game_id}")
+        self.spawn(self.close_session(session))
+
+    def schedule_timeouts(self, session):
+        """
+        Переставляет таймеры партии после начала игры или хода.
+
+        Таймер флажка срабатывает, когда истекает время стороны, которая
+        ходит (пока робот переставляет фигуры, часы стоят и таймера нет);
+        таймер простоя — если ходов нет IDLE_TIMEOUT секунд.
+        После окончания партии на доске таймеры не ставятся.
+
+        Параметры:
+            session (Session): игровая сессия
+        """
+        for timer in (session.flag_timer, session.idle_timer):
+            if timer is not None:
+                timer.cancel()
+        session.flag_timer = session.idle_timer = None
+        if not session.is_active or session.board.is_game_over():
+            return
+        time_left = session.time_left(asyncio.get_running_loop().time())
+        if time_left is not None and session.turn_started is not None:
+            session.flag_timer = self.timers.schedule(
+                time_left, self.flag_fall, session, session.board.turn
+            )
+        if IDLE_TIMEOUT > 0:
+            session.idle_timer = self.timers.schedule(
+                IDLE_TIMEOUT, self.idle_expired, session
+            )
+
+    def flag_fall(self, session, color):
+        """
+        Завершает партию по времени (вызывается колесом таймеров).
+
+        Проигрывает сторона, у которой истекло время; если у соперника
+        не хватает материала для мата, партия заканчивается вничью.
+
+        Параметры:
+            session (Session): игровая сессия
+            color (chess.Color): сторона, у которой упал флажок
+        """
+        session.flag_timer = None
+        if not session.is_active or session.board.turn != color:
+            return
+        if session.board.has_insufficient_material(not color):
+            result = "1/2-1/2"
+        else:
+            result = "0-1" if color == chess.WHITE else "1-0"
+        print(f"Flag fell on board {session.game_id}: {result}")
+        self.spawn(self.end_game(session, result, "timeout"))
+
+    def idle_expired(self, session):
+        """
+        Завершает брошенную партию, в которой давно нет ходов
+        (вызывается колесом таймеров). Проигрывает сторона, которая
+        должна была ходить.
+
+        Параметры:
+            session (Session): игровая сессия
+        """
+        session.idle_timer = None
+        if not session.is_active:
+            return
+        result = "0-1" if session.board.turn == chess.WHITE else "1-0"
+        print(f"Board {session.game_id} is idle, closing the game")
+        self.spawn(self.end_game(session, result, "abandoned"))
+
+    async def end_game(self, session, result, reason):
+        """
+        Сообщает результат партии и завершает ее.
+
+        Параметры:
+            session (Session): игровая сессия
+            result (str): "1-0", "0-1" или "1/2-1/2"
+            reason (str): причина окончания ("checkmate", "stalemate",
+                "timeout", "abandoned", ...)
+        """
+        if not session.is_active:
+            return
+        session.result, session.termination = result, reason
+        await self.broadcast(
+            {
+                "type": "game_over",
+                "data": {
+                    "result": result,
+                    "reason": reason
+                }
+            },
+            session
+        )
+        await self.close_session(session, reason="Game over")
+
+    def spawn(self, coroutine):
+        """
+        Запускает задачу из обратного вызова таймера и хранит ссылку на
+        нее до завершения.
+
+        Параметры:
+            coroutine (Coroutine): корутина
+        """
+        task = asyncio.create_task(coroutine)
+        self.tasks.add(task)
+        task.add_done_callback(self.tasks.discard)
+
+    async def close_session(self, session, reason="Partner disconnected"):
+        """
+        Завершает партию.
+
+        Доска возвращается в исходное состояние, соединения оставшихся
+        игроков закрываются, партия передается в архив, ее данные
+        удаляются из Redis.
+
+        Параметры:
+            session (Session): игровая сессия
+            reason (str): причина закрытия соединений игроков
+        """
+        if not session.is_active:
+            return
+        session.is_active = False
+        if session.dispatcher is not None:
+            session.dispatcher.cancel()
+            session.dispatcher = None
+        if session.engine_task is not None:
+            session.engine_task.cancel()
+            session.engine_task = None
+        for timer in session.reconnect_timers.values():
+            timer.cancel()
+        session.reconnect_timers = {}
+        for timer in (session.flag_timer, session.idle_timer):
+            if timer is not None:
+                timer.cancel()
+        session.flag_timer = session.idle_timer = None
+        if session.seq > 0:
+            await self.archive_game(session)
+        remaining_clients = [
+            player.websocket 
+            for player in session.players 
+            if player is not None 
+            and player.websocket is not None
+            and player.websocket.state == websockets.protocol.State.OPEN
+        ]
+        session.players = []
+        for client in remaining_clients:
+            await client.close(code=1001, reason=reason)
+        # доска восстанавливается в отдельном потоке, цикл событий свободен
+        try:
+            await self.async_return_board(session)
+        except Exception as e:
+            print(f"Error returning board to original: {e}")
+        await self.store.delete(session)
+        session.reset()
+        if session.spectators: # зрители остаются у доски и ждут следующую партию
+            session.dispatcher = asyncio.create_task(self.dispatch(session))
+            await self.broadcast(self.board_message(session, "update_game_state"), session)
+        self.sessions.release(session.game_id)
+        self.sessions.pool.notify() # доска свободна для игроков из очереди
+
+    async def release_board(self, game_id):
+        """
+        Отдает доску (или лобби) другому процессу сервера после потери аренды.
+
+        Партия не завершается и остается в Redis: доска не возвращается,
+        соединения закрываются с кодом 1012, и клиенты переподключаются
+        к новому владельцу доски.
+
+        Параметры:
+            game_id (str): идентификатор доски или POOL_GAME_ID
+        """
+        if game_id == POOL_GAME_ID:
+            self.sessions.remote_boards.clear()
+            clients = [entry.websocket for entry in self.lobby.waiting] + [
+                entry.websocket for pair in self.lobby.pairs for entry in pair if entry is not None
+            ]
+        else:
+            await self.sessions.pool.disown(game_id)
+            session = self.sessions.get(game_id)
+            if session is None:
+                return
+            session.is_active = False  # партию продолжит новый владелец доски
+            for task in (session.dispatcher, session.engine_task):
+                if task is not None:
+                    task.cancel()
+            session.dispatcher = session.engine_task = None
+            for timer in (
+                *session.reconnect_timers.values(),
+                session.flag_timer,
+                session.idle_timer,
+                session.seat_timer
+            ):
+                if timer is not None:
+                    timer.cancel()
+            session.reconnect_timers = {}
+            session.flag_timer = session.idle_timer = session.seat_timer = None
+            clients = [
+                player.websocket for player in session.players
+                if player is not None and player.websocket is not None
+            ] + list(session.spectators)
+            session.reset()
+            session.spectators = set()
+            self.sessions.release(game_id)
+        for client in clients:
+            try:
+                await client.close(code=1012, reason="Board moved")
+            except Exception as e:
+                print(f"Error closing client of board {game_id}: {e}")
+
+    async def archive_game(self, session):
+        """
+        Передает сделанные ходы партии в фоновую запись архива.
+
+        Ходы берутся с доски; у партии, восстановленной после
+        перезапуска, — из журнала в Redis.
+
+        Параметры:
+            session (Session): завершаемая сессия (игроки еще на местах)
+        """
+        moves = [move.uci() for move in session.board.move_stack]
+        if len(moves) < session.seq:
+            try:
+                moves = await self.store.load_moves(session)
+            except Exception as e:
+                print(f"Error loading moves of game {session.match_id}: {e}")
+                return
+        names = {
+            player.figures_color: "Computer" if player.engine else "Player"
+            for player in session.players
+            if player is not None
+        }
+        self.archive.submit(ArchivedGame(
+            match_id=session.match_id,
+            board=session.game_id,
+            started=session.started,
+            ended=time.time(),
+            white=names.get(Colors.WHITE, "?"),
+            black=names.get(Colors.BLACK, "?"),
+            result=session.result,
+            termination=session.termination,
+            time_control=(
+                f"{session.clock_base:g}+{session.increment:g}"
+                if session.clock_base else "-"
+            ),
+            moves=moves,
+            clock_times=session.clock_times,
+            robot_times=session.robot_times
+        ))
+
+    async def report_desync(self, session):
+        """
+        Сообщает игрокам и зрителям клетки, на которых фигуры стоят не
+        так, как в партии, и о том, что расхождение устранено. Пока
+        робот не подключен, его перемещения ждут подключения и
+        расхождением не считаются.
+
+        Параметры:
+            session (Session): игровая сессия
+        """
+        if not session.robot_conn.connected:
+            return
+        differences = session.shadow.differences(session.physical_board(), session.graveyard.pieces())
+        if not differences and not session.desynced:
+            return
+        session.desynced = bool(differences)
+        await self.broadcast(
+            {
+                "type": "board_desync",
+                "data": {
+                    "squares": [
+                        NAME_BY_CELL[cell] for board, cell in differences
+                        if board == MAIN_BOARD
+                    ],
+                    "graveyard": [
+                        cell for board, cell in differences
+                        if board == GRAVEYARD_BOARD
+                    ]
+                }
+            },
+            session
+        )
+
+    async def async_return_board(self, session):
+        """
+        Возвращает доску сессии в исходное состояние.
+
+        План ходов строится в пуле потоков по фактическому положению
+        фигур (session.shadow), а если на досках есть неизвестные
+        фигуры — по логической доске и содержимому 2 доски. Ходы
+        ставятся в очередь робота одной серией, неудачные повторяются
+        по одному.
+
+        Параметры:
+            session (Session): игровая сессия
+        """
+        start = time.perf_counter()
+        if session.robot_task is not None: # робот заканчивает последний ход партии
+            await asyncio.wait([session.robot_task])
         loop = asyncio.get_running_loop()
-        await loop.run_in_executor(
-            None, 
-            return_board_to_original, 
-            self.robot_conn
+        position = session.shadow.position()
+        if position is None:
+            position = (session.physical_board(), session.graveyard.pieces())
+        plan = await loop.run_in_executor(None, plan_reset, *position, session.calibration)
+        print(f"Returning board to original: {len(plan)} robot moves")
+        session.shadow.unresolved = []
+        unresolved = await execute_steps(
+            session.robot_conn, session.shadow, session.calibration, plan
         )
+        if unresolved:
+            print(f"Board {session.game_id} is not returned: {len(unresolved)} robot moves failed")
+        RESET_MOVES.observe(len(plan))
+        RESET_SECONDS.observe(time.perf_counter() - start)
 
-    async def run(self):
+    async def run(self, host="0.0.0.0", port=8765):
+        # метрики: GET /metrics на METRICS_PORT и JSON в лог раз в METRICS_LOG_INTERVAL
+        self.metrics_server = await start_metrics_server()
+        self.metrics_log = asyncio.create_task(log_metrics())
+        self.sessions.pool.start()
+        self.lobby.start()
+        self.archive.start()
+        if self.cluster is not None:
+            await self.redis_conn.connect()
+            await self.cluster.start()
+        # процессы сервера на одной машине слушают общий порт (SO_REUSEPORT)
         async with websockets.serve(
             self.handle_client,
-            "0.0.0.0",
-            8765,
+            host,
+            port,
             ping_interval=10,
-            ping_timeout=5
+            ping_timeout=5,
+            compression=None if WS_COMPRESSION == "none" else WS_COMPRESSION,
+            reuse_port=self.cluster is not None
         ):
-            print("WebSocket-сервер запущен на порту 8765")
-            await asyncio.Future()
+            print(f"WebSocket-сервер запущен на порту {port}")
+            try:
+                await asyncio.Future()
+            finally:
+                if self.cluster is not None: # аренды сразу переходят другим процессам
+                    await self.cluster.stop()
+                await self.archive.stop() # партии из очереди дописываются до выхода
+                await self.sessions.pool.stop()
@@ -0,0 +1,164 @@
+import os
+
+from dotenv import load_dotenv
+
+from game import Session
+from metrics import ACTIVE_SESSIONS
+from robot_pool import RobotPool
+from squares import get_calibration
+
+load_dotenv()
+
+DEFAULT_GAME_ID = "default"
+POOL_GAME_ID = "any"  # подключение к любой свободной доске
+
+
+def parse_robot_endpoints(value):
+    """
+    Разбирает список адресов роботов из строки окружения.
+
+    Пример:
+        "board1=10.16.0.23:10003,board2=10.16.0.24:10003"
+        → {"board1": ("10.16.0.23", 10003), "board2": ("10.16.0.24", 10003)}
+
+    Параметры:
+        value (str): строка вида "id=host:port,id=host:port"
+
+    Возвращает:
+        dict: идентификатор доски → (host, port)
+    """
+    endpoints = {}
+    for item in value.split(","):
+        item = item.strip()
+        if not item:
+            continue
+        game_id, address = item.split("=", 1)
+        host, port = address.rsplit(":", 1)
+        endpoints[game_id.strip()] = (host.strip(), int(port))
+    return endpoints
+
+
+class SessionRegistry:
+    def __init__(self, endpoints=None):
+        """
+        Инициализирует реестр игровых сессий.
+
+        Каждая доска (робот) соответствует отдельной игре. Если список
+        адресов не задан ни параметром, ни переменной ROBOT_ENDPOINTS,
+        используется одна доска DEFAULT_GAME_ID с адресом из
+        ROBOT_HOST/ROBOT_PORT.
+
+        Параметры:
+            endpoints (dict | None): идентификатор доски → (host, port)
+        """
+        if endpoints is None:
+            endpoints = parse_robot_endpoints(
+                os.getenv("ROBOT_ENDPOINTS", "")
+            )
+        if not endpoints:
+            endpoints = {
+                DEFAULT_GAME_ID: (
+                    os.getenv("ROBOT_HOST", "localhost"),
+                    int(os.getenv("ROBOT_PORT", 12345))
+                )
+            }
+        self.endpoints = endpoints
+        self.pool = RobotPool(endpoints)
+        self.sessions = {}
+        self.remote_boards = {}  # свободные доски других процессов сервера → процесс-владелец
+
+    def get_or_create(self, game_id):
+        """
+        Возвращает сессию игры, создавая ее при первом обращении.
+
+        Параметры:
+            game_id (str): идентификатор игры (доски)
+
+        Возвращает:
+            Session | None: сессия или None, если доска неизвестна
+        """
+        session = self.sessions.get(game_id)
+        if session is not None:
+            return session
+        endpoint = self.endpoints.get(game_id)
+        if endpoint is None:
+            return None
+        session = Session(game_id)
+        session.robot_conn = self.pool.get(game_id)
+        session.shadow = self.pool.shadows[game_id]
+        session.calibration = get_calibration(game_id)
+        self.sessions[game_id] = session
+        ACTIVE_SESSIONS.set(len(self.sessions))
+        return session
+
+    def pick_board(self, exclude=()):
+        """
+        Выбирает свободную доску для пары игроков из лобби.
+
+        Сначала выбираются доски этого процесса, затем свободные доски,
+        о которых сообщили другие процессы сервера (remote_boards).
+
+        Параметры:
+            exclude (Iterable[str]): доски, уже выданные другим парам
+
+        Возвращает:
+            str | None: идентификатор доски или None, если свободных нет
+        """
+        for game_id in self.endpoints:
+            if game_id not in exclude and self.is_free(game_id):
+                return game_id
+        for game_id in self.remote_boards:
+            if game_id not in exclude:
+                return game_id
+        return None
+
+    def is_free(self, game_id):
+        """
+        Проверяет, свободна ли доска этого процесса.
+
+        Свободна доска без игроков с исправным роботом. Пока доска
+        возвращается в исходное состояние, в ее сессии остаются игроки,
+        поэтому она занята.
+
+        Параметры:
+            game_id (str): идентификатор доски
+
+        Возвращает:
+            bool: True если доску можно отдать паре
+        """
+        if not self.pool.is_healthy(game_id):
+            return False
+        session = self.sessions.get(game_id)
+        return session is None or session.active_players == 0
+
+    def get(self, game_id):
+        """
+        Возвращает существующую сессию игры.
+
+        Параметры:
+            game_id (str): идентификатор игры
+
+        Возвращает:
+            Session | None: сессия или None, если игра не создана
+        """
+        return self.sessions.get(game_id)
+
+    def release(self, game_id):
+        """
+        Удаляет сессию из реестра, если в ней не осталось игроков и зрителей.
+
+        Параметры:
+            game_id (str): идентификатор игры
+
+        Возвращает:
+            bool: True если сессия была удалена
+        """
+        session = self.sessions.get(game_id)
+        if session is None or session.active_players > 0 or session.spectators:
+            return False
+        del self.sessions[game_id]
+        ACTIVE_SESSIONS.set(len(self.sessions))
+        return True
+
+    def __len__(self):
+        return len(self.sessions)
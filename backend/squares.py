@@ -0,0 +1,165 @@
+import json
+import os
+
+import chess
+from dotenv import load_dotenv
+
+load_dotenv()
+
+MAIN_BOARD = 2  # номер игровой доски в командах робота
+GRAVEYARD_BOARD = 1  # номер доски для съеденных фигур
+BOARDS = (GRAVEYARD_BOARD, MAIN_BOARD)
+
+CELLS = range(1, 65)  # клетки досок в командах робота
+
+# таблицы соответствия: название клетки ("e4"), клетка chess (0-63),
+# клетка робота (1-64); индекс 0 таблиц по клеткам робота не используется
+SQUARE_BY_NAME = {name: square for square, name in enumerate(chess.SQUARE_NAMES)}
+CELL_BY_SQUARE = [square + 1 for square in chess.SQUARES]
+CELL_BY_NAME = {name: CELL_BY_SQUARE[square] for name, square in SQUARE_BY_NAME.items()}
+SQUARE_BY_CELL = [None] + list(chess.SQUARES)
+NAME_BY_CELL = [None] + list(chess.SQUARE_NAMES)
+FILE_BY_CELL = [None] + [chess.square_file(square) for square in chess.SQUARES]
+RANK_BY_CELL = [None] + [chess.square_rank(square) for square in chess.SQUARES]
+
+
+def board_index(board, cell):
+    """Индекс клетки доски в плоских таблицах (0-127)."""
+    return (board - 1) * 64 + cell - 1
+
+
+class Calibration:
+    def __init__(self, pitch=1.0, origins=None, rotated=False):
+        """
+        Расположение досок робота.
+
+        Координаты клеток обеих досок, номера клеток в командах робота и
+        расстояния между клетками вычисляются один раз при создании.
+
+        Параметры:
+            pitch (float): шаг клеток (например, в мм)
+            origins (dict | None): доска → (x, y) центра клетки 1 в шагах pitch;
+                по умолчанию 2 доска стоит справа от игровой через одну клетку
+            rotated (bool): робот стоит со стороны черных, клетки игровой
+                доски в его командах нумеруются с h8
+        """
+        self.pitch = pitch
+        self.origins = origins or {MAIN_BOARD: (0, 0), GRAVEYARD_BOARD: (9, 0)}
+        self.rotated = rotated
+
+        self.xy = {  # доска → [None, (x, y) клетки 1, ..., (x, y) клетки 64]
+            board: [None] + [
+                (
+                    (self.origins[board][0] + FILE_BY_CELL[cell]) * pitch,
+                    (self.origins[board][1] + RANK_BY_CELL[cell]) * pitch
+                )
+                for cell in CELLS
+            ]
+            for board in BOARDS
+        }
+        self.robot_cells = {  # доска → [None, номер клетки 1 у робота, ...]
+            board: [None] + [
+                65 - cell if rotated and board == MAIN_BOARD else cell
+                for cell in CELLS
+            ]
+            for board in BOARDS
+        }
+        self.logical_cells = {  # доска → {номер клетки у робота: клетка 1-64}
+            board: {robot_cell: cell for cell, robot_cell in enumerate(cells) if cell}
+            for board, cells in self.robot_cells.items()
+        }
+        points = [
+            self.xy[board][cell]
+            for board in sorted(BOARDS)
+            for cell in CELLS
+        ]
+        self.distances = [  # board_index откуда * 128 + board_index куда → расстояние
+            abs(x_from - x_to) + abs(y_from - y_to)
+            for x_from, y_from in points
+            for x_to, y_to in points
+        ]
+
+    def distance(self, board_from, cell_from, board_to, cell_to):
+        """
+        Возвращает путь захвата между клетками.
+
+        Параметры:
+            board_from (int): доска откуда
+            cell_from (int): клетка откуда (1-64)
+            board_to (int): доска куда
+            cell_to (int): клетка куда (1-64)
+
+        Возвращает:
+            float: расстояние в единицах pitch
+        """
+        return self.distances[
+            board_index(board_from, cell_from) * 128 + board_index(board_to, cell_to)
+        ]
+
+    def robot_step(self, board_from, cell_from, board_to, cell_to):
+        """
+        Переводит перемещение в нумерацию клеток робота.
+
+        Параметры:
+            board_from (int): доска откуда
+            cell_from (int): клетка откуда (1-64)
+            board_to (int): доска куда
+            cell_to (int): клетка куда (1-64)
+
+        Возвращает:
+            tuple[int, int, int, int]: (доска, клетка, доска, клетка) для robot_request
+        """
+        return (
+            board_from,
+            self.robot_cells[board_from][cell_from],
+            board_to,
+            self.robot_cells[board_to][cell_to]
+        )
+
+
+def parse_calibrations(value):
+    """
+    Разбирает калибровку роботов из строки окружения (JSON).
+
+    Пример:
+        '{"board1": {"pitch": 40, "main": [0, 0], "graveyard": [9, 0], "rotated": true}}'
+
+    Параметры:
+        value (str): JSON: идентификатор доски → параметры Calibration
+
+    Возвращает:
+        dict: идентификатор доски → Calibration
+    """
+    if not value.strip():
+        return {}
+    calibrations = {}
+    for game_id, params in json.loads(value).items():
+        origins = None
+        if "main" in params or "graveyard" in params:
+            origins = {
+                MAIN_BOARD: tuple(params.get("main", (0, 0))),
+                GRAVEYARD_BOARD: tuple(params.get("graveyard", (9, 0)))
+            }
+        calibrations[game_id] = Calibration(
+            pitch=float(params.get("pitch", 1.0)),
+            origins=origins,
+            rotated=bool(params.get("rotated", False))
+        )
+    return calibrations
+
+
+DEFAULT_CALIBRATION = Calibration()
+CALIBRATIONS = parse_calibrations(os.getenv("ROBOT_CALIBRATION", ""))
+
+
+def get_calibration(game_id):
+    """
+    Возвращает калибровку робота доски.
+
+    Параметры:
+        game_id (str): идентификатор доски
+
+    Возвращает:
+        Calibration: калибровка из ROBOT_CALIBRATION или по умолчанию
+    """
+    return CALIBRATIONS.get(game_id, DEFAULT_CALIBRATION)
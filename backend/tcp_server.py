@@ -1,41 +1,246 @@
-import socket
-
-
-def handle_client(client_socket, address):
-    print(f"Подключение от {address}")
-
-    while True:
-        data = client_socket.recv(1024).decode('utf-8')
-        if not data:
-            break
-
-        print(f"Получено сообщение: {data}")
-
-        response = input("Введите ответ: ")
-
-        client_socket.send(response.encode('utf-8'))
-
-    client_socket.close()
-    print(f"Клиент {address} отключился")
-
-
-def start_server():
-    host = '127.0.0.1'
-    port = 12345
-
-    server_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-
-    server_socket.bind((host, port))
-
-    server_socket.listen(1)
-    print(f"Сервер запущен на {host}:{port}")
-
-    while True:
-        client_socket, address = server_socket.accept()
-        print(f"Новое подключение от {address}")
-
-        handle_client(client_socket, address)
+"""
+Симулятор робота для тестов и замеров без оборудования.
+
+Понимает команды robot_request ("Move,доска,клетка,доска,клетка\r\n"),
+выполняет их по одной с задержкой физического перемещения и отвечает
+"OK" или "ERROR,код". Следит за занятостью клеток обеих досок,
+отклоняет невозможные перемещения и сообщает занятость по команде
+"Occupancy,доска". С --fail-rate захват иногда не берет фигуру
+(ERROR,5). Один процесс обслуживает несколько роботов на разных портах.
+
+Запуск:
+    python tcp_server.py --ports 12345,12346 --latency uniform:0.5,2 --per-cell 0.05
+    python tcp_server.py --fail-rate 0.05
+"""
+import argparse
+import asyncio
+import random
+
+from robot_conn import (
+    DELIMITER,
+    ERROR_FORMAT,
+    ERROR_CELL,
+    ERROR_EMPTY,
+    ERROR_OCCUPIED,
+    ERROR_PICKUP
+)
+from squares import MAIN_BOARD, GRAVEYARD_BOARD, DEFAULT_CALIBRATION
+
+# клетки 1-64, занятые фигурами в начальной позиции
+START_CELLS = set(range(1, 17)) | set(range(49, 65))
+
+
+def parse_latency(spec):
+    """
+    Разбирает распределение задержки перемещения.
+
+    Пример:
+        "const:1" → всегда 1 с
+        "uniform:0.5,2" → равномерно от 0.5 до 2 с
+        "normal:1.5,0.3" → нормальное (среднее, отклонение), не меньше 0
+        "lognormal:0,0.5" → логнормальное (mu, sigma)
+        "exp:1" → экспоненциальное со средним 1 с
+
+    Параметры:
+        spec (str): строка вида "распределение:параметры"
+
+    Возвращает:
+        Callable[[], float]: функция, возвращающая задержку в секундах
+    """
+    name, _, params = spec.partition(":")
+    args = [float(value) for value in params.split(",") if value]
+    if name == "const":
+        return lambda: args[0]
+    if name == "uniform":
+        return lambda: random.uniform(args[0], args[1])
+    if name == "normal":
+        return lambda: max(0.0, random.gauss(args[0], args[1]))
+    if name == "lognormal":
+        return lambda: random.lognormvariate(args[0], args[1])
+    if name == "exp":
+        return lambda: random.expovariate(1 / args[0])
+    raise ValueError(f"Unknown latency distribution: {spec}")
+
+
+class RobotSimulator:
+    def __init__(self, port, latency="const:0", per_cell=0.0, host="127.0.0.1", fail_rate=0.0):
+        """
+        Параметры:
+            port (int): порт робота (0 — любой свободный)
+            latency (str): распределение задержки перемещения (см. parse_latency)
+            per_cell (float): дополнительные секунды на клетку пути захвата
+            host (str): адрес для подключения
+            fail_rate (float): доля перемещений, при которых захват не берет фигуру
+        """
+        self.host = host
+        self.port = port
+        self.latency = parse_latency(latency)
+        self.per_cell = per_cell
+        self.fail_rate = fail_rate
+        self.server = None
+        self.arm = asyncio.Lock()  # у робота один захват, команды выполняются по одной
+        self.moves = 0
+        self.errors = 0
+        self.reset()
+
+    def reset(self):
+        """Расставляет фигуры в начальную позицию и очищает 2 доску."""
+        self.occupied = {
+            MAIN_BOARD: set(START_CELLS),
+            GRAVEYARD_BOARD: set()
+        }
+
+    def check_move(self, board_from, cell_from, board_to, cell_to):
+        """
+        Проверяет, возможно ли перемещение.
+
+        Параметры:
+            board_from (int): доска откуда
+            cell_from (int): клетка откуда (1-64)
+            board_to (int): доска куда
+            cell_to (int): клетка куда (1-64)
+
+        Возвращает:
+            int | None: код ошибки или None, если перемещение возможно
+        """
+        if board_from not in self.occupied or board_to not in self.occupied:
+            return ERROR_CELL
+        if not (1 <= cell_from <= 64 and 1 <= cell_to <= 64):
+            return ERROR_CELL
+        if cell_from not in self.occupied[board_from]:
+            return ERROR_EMPTY
+        if cell_to in self.occupied[board_to]:
+            return ERROR_OCCUPIED
+        return None
+
+    async def execute(self, line):
+        """
+        Выполняет одну команду.
+
+        Параметры:
+            line (str): команда без разделителя (например, "Move,2,13,2,29")
+
+        Возвращает:
+            str: ответ робота ("OK" или "ERROR,код")
+        """
+        command, *args = line.split(",")
+        if command == "Ping":
+            return "OK"
+        if command == "Reset":
+            self.reset()
+            return "OK"
+        if command == "Occupancy":
+            board = int(args[0]) if len(args) == 1 and args[0].isdigit() else None
+            if board not in self.occupied:
+                self.errors += 1
+                return f"ERROR,{ERROR_CELL}"
+            mask = sum(1 << (cell - 1) for cell in self.occupied[board])
+            return f"OK,{mask:016x}"
+        if command != "Move" or len(args) != 4:
+            self.errors += 1
+            return f"ERROR,{ERROR_FORMAT}"
+        try:
+            board_from, cell_from, board_to, cell_to = map(int, args)
+        except ValueError:
+            self.errors += 1
+            return f"ERROR,{ERROR_FORMAT}"
+
+        async with self.arm:
+            error = self.check_move(board_from, cell_from, board_to, cell_to)
+            if error is not None:
+                self.errors += 1
+                return f"ERROR,{error}"
+            await asyncio.sleep(
+                self.latency()
+                + self.per_cell * DEFAULT_CALIBRATION.distance(board_from, cell_from, board_to, cell_to)
+            )
+            if random.random() < self.fail_rate:
+                self.errors += 1
+                return f"ERROR,{ERROR_PICKUP}"
+            self.occupied[board_from].discard(cell_from)
+            self.occupied[board_to].add(cell_to)
+            self.moves += 1
+            return "OK"
+
+    async def handle_client(self, reader, writer):
+        """
+        Обслуживает подключение сервера к роботу.
+
+        Команды выполняются в порядке поступления, ответ на каждую
+        отправляется после ее выполнения.
+
+        Параметры:
+            reader (asyncio.StreamReader): поток чтения
+            writer (asyncio.StreamWriter): поток записи
+        """
+        address = writer.get_extra_info("peername")
+        print(f"Подключение к роботу {self.port} от {address}")
+        try:
+            while True:
+                try:
+                    line = await reader.readuntil(DELIMITER)
+                except asyncio.IncompleteReadError:
+                    break
+                response = await self.execute(line[:-len(DELIMITER)].decode().strip())
+                writer.write(response.encode() + DELIMITER)
+                await writer.drain()
+        except (ConnectionError, asyncio.CancelledError):
+            pass
+        finally:
+            writer.close()
+            print(f"Клиент {address} отключился от робота {self.port}")
+
+    async def start(self):
+        """Начинает принимать подключения, при port=0 сохраняет выбранный порт."""
+        self.server = await asyncio.start_server(self.handle_client, self.host, self.port)
+        self.port = self.server.sockets[0].getsockname()[1]
+        print(f"Симулятор робота запущен на {self.host}:{self.port}")
+
+    async def stop(self):
+        """Прекращает прием подключений."""
+        if self.server is not None:
+            self.server.close()
+            await self.server.wait_closed()
+            self.server = None
+
+
+async def serve(ports, latency="const:0", per_cell=0.0, host="127.0.0.1", fail_rate=0.0):
+    """
+    Запускает симуляторы роботов на нескольких портах.
+
+    Параметры:
+        ports (list[int]): порты роботов
+        latency (str): распределение задержки перемещения
+        per_cell (float): секунды на клетку пути захвата
+        host (str): адрес для подключения
+        fail_rate (float): доля неудачных захватов
+
+    Возвращает:
+        list[RobotSimulator]: запущенные симуляторы
+    """
+    robots = [RobotSimulator(port, latency, per_cell, host, fail_rate) for port in ports]
+    for robot in robots:
+        await robot.start()
+    return robots
+
+
+async def main(ports, latency, per_cell, host, fail_rate):
+    await serve(ports, latency, per_cell, host, fail_rate)
+    await asyncio.Future()
 
 
 if __name__ == "__main__":
-    start_server()
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--ports", default="12345", help="порты через запятую")
+    parser.add_argument("--latency", default="const:0", help="например, uniform:0.5,2")
+    parser.add_argument("--per-cell", type=float, default=0.0)
+    parser.add_argument("--fail-rate", type=float, default=0.0, help="доля неудачных захватов")
+    args = parser.parse_args()
+    asyncio.run(main(
+        [int(port) for port in args.ports.split(",")],
+        args.latency,
+        args.per_cell,
+        args.host,
+        args.fail_rate
+    ))
@@ -0,0 +1,5 @@
+import os
+import sys
+
+# модули сервера лежат плоско в backend, тесты импортируют их напрямую
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,62 @@
+import chess
+import pytest
+
+from graveyard import Graveyard, preferred_cells
+from squares import CELLS, CELL_BY_SQUARE, CELL_BY_NAME, DEFAULT_CALIBRATION
+
+
+def test_preferred_cells_start_with_home_cells():
+    """Первыми идут клетки 2 доски, совпадающие с начальными клетками фигуры."""
+    cells = preferred_cells(DEFAULT_CALIBRATION)
+    assert cells["q"][0] == CELL_BY_NAME["d8"]
+    assert set(cells["N"][:2]) == {CELL_BY_NAME["b1"], CELL_BY_NAME["g1"]}
+    assert sorted(cells["p"][:8]) == [CELL_BY_SQUARE[square] for square in chess.SquareSet(chess.BB_RANK_7)]
+    assert all(sorted(order) == list(CELLS) for order in cells.values())
+
+
+def test_preferred_cells_are_cached_per_calibration():
+    assert preferred_cells(DEFAULT_CALIBRATION) is preferred_cells(DEFAULT_CALIBRATION)
+
+
+def test_allocate_does_not_take_the_cell():
+    graveyard = Graveyard()
+    slot = graveyard.allocate("q")
+    assert slot == CELL_BY_NAME["d8"]
+    assert graveyard.allocate("q") == slot
+    assert slot not in graveyard
+
+
+def test_allocate_skips_taken_and_excluded_cells():
+    graveyard = Graveyard()
+    first = graveyard.allocate("N")
+    graveyard.place(first, "N")
+    second = graveyard.allocate("N")
+    assert second != first
+    assert {first, second} == {CELL_BY_NAME["b1"], CELL_BY_NAME["g1"]}
+    third = graveyard.allocate("N", exclude=[second])
+    assert third not in (first, second)
+
+
+def test_take_frees_the_cell():
+    graveyard = Graveyard({CELL_BY_NAME["d8"]: "q"})
+    assert graveyard.allocate("q") != CELL_BY_NAME["d8"]
+    assert graveyard.take(CELL_BY_NAME["d8"]) == "q"
+    assert graveyard.take(CELL_BY_NAME["d8"]) is None
+    assert graveyard.allocate("q") == CELL_BY_NAME["d8"]
+    assert len(graveyard) == 0
+
+
+def test_allocate_fails_on_full_board():
+    graveyard = Graveyard({cell: "p" for cell in CELLS})
+    with pytest.raises(Exception):
+        graveyard.allocate("Q")
+
+
+def test_find_returns_nearest_piece():
+    # 2 доска стоит справа от игровой: ее вертикаль a ближе всего к вертикали h
+    graveyard = Graveyard({CELL_BY_NAME["a1"]: "Q", CELL_BY_NAME["a8"]: "Q", CELL_BY_NAME["b8"]: "q"})
+    assert graveyard.find("Q", CELL_BY_NAME["h8"]) == CELL_BY_NAME["a8"]
+    assert graveyard.find("Q", CELL_BY_NAME["h1"]) == CELL_BY_NAME["a1"]
+    assert graveyard.find("R", CELL_BY_NAME["a1"]) is None
+    assert graveyard.pieces() == graveyard.slots
+    assert graveyard.pieces() is not graveyard.slots
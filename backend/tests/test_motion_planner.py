@@ -0,0 +1,91 @@
+import chess
+
+from graveyard import Graveyard
+from motion_planner import plan_move, order_steps
+from move_record import MoveRecord, FLAG_CAPTURE, FLAG_EN_PASSANT, FLAG_CASTLING, NO_SQUARE
+from squares import MAIN_BOARD, GRAVEYARD_BOARD, CELL_BY_NAME, SQUARE_BY_NAME
+
+
+def step(cell_from, cell_to, board_from=MAIN_BOARD, board_to=MAIN_BOARD):
+    return (board_from, CELL_BY_NAME[cell_from], board_to, CELL_BY_NAME[cell_to])
+
+
+def test_quiet_move():
+    plan = plan_move(chess.Board(), chess.Move.from_uci("g1f3"), Graveyard())
+    assert plan.steps == [step("g1", "f3")]
+    assert plan.records == [
+        MoveRecord(0, 0, SQUARE_BY_NAME["g1"], SQUARE_BY_NAME["f3"], chess.KNIGHT, 0, 0)
+    ]
+
+
+def test_capture_clears_target_first():
+    board = chess.Board("rnbqkbnr/ppp1pppp/8/3p4/4P3/8/PPPP1PPP/RNBQKBNR w KQkq - 0 2")
+    graveyard = Graveyard()
+    plan = plan_move(board, chess.Move.from_uci("e4d5"), graveyard)
+    slot = graveyard.allocate("p")
+    assert plan.steps == [
+        (MAIN_BOARD, CELL_BY_NAME["d5"], GRAVEYARD_BOARD, slot),
+        step("e4", "d5")
+    ]
+    assert plan.records[0] == MoveRecord(FLAG_CAPTURE, 1, SQUARE_BY_NAME["d5"], NO_SQUARE, chess.PAWN, slot, 0)
+    assert len(graveyard) == 0  # клетку занимает только запись журнала
+
+
+def test_en_passant_takes_pawn_beside():
+    board = chess.Board("rnbqkbnr/ppp1p1pp/8/3pPp2/8/8/PPPP1PPP/RNBQKBNR w KQkq f6 0 3")
+    plan = plan_move(board, chess.Move.from_uci("e5f6"), Graveyard())
+    capture = plan.records[0]
+    assert capture.flags == FLAG_CAPTURE | FLAG_EN_PASSANT
+    assert capture.from_square == SQUARE_BY_NAME["f5"]
+    assert sorted(plan.steps) == sorted([
+        (MAIN_BOARD, CELL_BY_NAME["f5"], GRAVEYARD_BOARD, capture.slot),
+        step("e5", "f6")
+    ])
+
+
+def test_castling_moves_rook():
+    board = chess.Board("r3k2r/8/8/8/8/8/8/R3K2R w KQkq - 0 1")
+    plan = plan_move(board, chess.Move.from_uci("e1c1"), Graveyard())
+    assert sorted(plan.steps) == sorted([step("e1", "c1"), step("a1", "d1")])
+    assert plan.records[-1].flags == FLAG_CASTLING
+
+
+def test_promotion_takes_piece_from_graveyard():
+    board = chess.Board("8/4P3/8/8/8/8/k7/7K w - - 0 1")
+    queen = CELL_BY_NAME["d1"]
+    graveyard = Graveyard({queen: "Q"})
+    plan = plan_move(board, chess.Move.from_uci("e7e8q"), graveyard)
+    pawn_slot = graveyard.allocate("P")
+    assert sorted(plan.steps) == sorted([
+        (MAIN_BOARD, CELL_BY_NAME["e7"], GRAVEYARD_BOARD, pawn_slot),
+        (GRAVEYARD_BOARD, queen, MAIN_BOARD, CELL_BY_NAME["e8"])
+    ])
+    assert plan.records[-1].slot == queen
+    assert plan.records[-1].promotion == chess.QUEEN
+
+
+def test_promotion_without_piece_keeps_pawn():
+    board = chess.Board("8/4P3/8/8/8/8/k7/7K w - - 0 1")
+    plan = plan_move(board, chess.Move.from_uci("e7e8n"), Graveyard({CELL_BY_NAME["d1"]: "Q"}))
+    assert plan.steps == [step("e7", "e8")]
+    assert plan.records[-1].slot == 0
+
+
+def test_captured_stand_in_is_recorded_as_pawn():
+    board = chess.Board("4Q3/8/8/8/8/8/k7/4r2K b - - 0 1")
+    plan = plan_move(
+        board, chess.Move.from_uci("e1e8"), Graveyard(), stand_ins={SQUARE_BY_NAME["e8"]}
+    )
+    assert plan.records[0].piece == chess.PAWN
+    assert plan.records[0].color == 0
+
+
+def test_order_steps_waits_for_occupied_cell():
+    steps = [step("d5", "e6"), step("e6", "a1", MAIN_BOARD, GRAVEYARD_BOARD)]
+    assert order_steps(steps) == [steps[1], steps[0]]
+
+
+def test_order_steps_minimizes_idle_path():
+    far, near = step("a8", "a7"), step("h1", "h2")
+    assert order_steps([far, near], arm=(MAIN_BOARD, CELL_BY_NAME["h3"])) == [near, far]
+    assert order_steps([far, near], arm=(MAIN_BOARD, CELL_BY_NAME["a6"])) == [far, near]
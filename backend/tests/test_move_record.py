@@ -0,0 +1,88 @@
+import random
+
+import pytest
+
+from move_record import (
+    MoveRecord,
+    FLAG_CAPTURE,
+    FLAG_EN_PASSANT,
+    FLAG_CASTLING,
+    NO_SQUARE,
+    RECORD,
+    encode_record,
+    decode_record,
+    decode_records,
+    decode_legacy,
+    merge_legacy_lists,
+    record_symbol,
+    record_uci
+)
+from squares import SQUARE_BY_NAME, CELL_BY_NAME
+
+
+def random_record(rng):
+    flags = rng.choice([0, FLAG_CAPTURE, FLAG_CAPTURE | FLAG_EN_PASSANT, FLAG_CASTLING])
+    return MoveRecord(
+        flags,
+        rng.randint(0, 1),
+        rng.randint(0, 63),
+        NO_SQUARE if flags & FLAG_CAPTURE else rng.randint(0, 63),
+        rng.randint(1, 6),
+        rng.randint(0, 64),
+        rng.choice([0, 2, 3, 4, 5])
+    )
+
+
+def test_round_trip():
+    rng = random.Random(0)
+    for _ in range(1000):
+        record = random_record(rng)
+        data = encode_record(record)
+        assert len(data) == RECORD.size
+        assert decode_record(data) == record
+
+
+def test_decode_records_round_trip():
+    rng = random.Random(1)
+    records = [random_record(rng) for _ in range(200)]
+    assert decode_records([encode_record(record) for record in records]) == records
+    assert decode_records([]) == []
+
+
+def test_decode_records_with_legacy_entries():
+    record = MoveRecord(0, 1, SQUARE_BY_NAME["e7"], SQUARE_BY_NAME["e5"], 1, 0, 0)
+    items = [b"e2-e4-WHITE-P-0", encode_record(record)]
+    assert decode_records(items) == [
+        MoveRecord(0, 0, SQUARE_BY_NAME["e2"], SQUARE_BY_NAME["e4"], 1, 0, 0),
+        record
+    ]
+
+
+def test_decode_legacy_capture():
+    record = decode_legacy("d5-a1-BLACK-p-1")
+    assert record == MoveRecord(FLAG_CAPTURE, 1, SQUARE_BY_NAME["d5"], NO_SQUARE, 1, CELL_BY_NAME["a1"], 0)
+    assert record_symbol(record) == "p"
+
+
+def test_decode_unknown_format():
+    with pytest.raises(ValueError):
+        decode_record(b"\x09" * RECORD.size)
+
+
+def test_record_uci():
+    record = MoveRecord(0, 0, SQUARE_BY_NAME["e7"], SQUARE_BY_NAME["e8"], 1, 0, 5)
+    assert record_uci(record) == "e7e8q"
+    assert record_symbol(record) == "P"
+
+
+def test_merge_legacy_lists_puts_capture_before_move():
+    white = [b"e2-e4-WHITE-P-0", b"e4-d5-WHITE-P-0"]
+    black = [b"d7-d5-BLACK-p-0", b"d5-a1-BLACK-p-1", b"g8-f6-BLACK-n-0"]
+    journal = merge_legacy_lists(white, black)
+    assert [(record.flags, record.color, record.from_square) for record in journal] == [
+        (0, 0, SQUARE_BY_NAME["e2"]),
+        (0, 1, SQUARE_BY_NAME["d7"]),
+        (FLAG_CAPTURE, 1, SQUARE_BY_NAME["d5"]),
+        (0, 0, SQUARE_BY_NAME["e4"]),
+        (0, 1, SQUARE_BY_NAME["g8"])
+    ]
@@ -0,0 +1,107 @@
+import random
+
+import chess
+
+from game import Session
+from motion_planner import plan_move
+from reconcile import BoardShadow, expected_cells
+from reset_planner import plan_reset, match_nearest
+from squares import MAIN_BOARD, GRAVEYARD_BOARD, CELL_BY_NAME, SQUARE_BY_NAME
+
+START = expected_cells(chess.Board(), {})
+
+
+def reset(cells, board, graveyard):
+    """Выполняет план возврата на копии модели досок и возвращает ее."""
+    shadow = BoardShadow()
+    shadow.cells = dict(cells)
+    for step in plan_reset(board, graveyard):
+        assert step[:2] in shadow.cells, step  # фигура берется с занятой клетки
+        assert step[2:] not in shadow.cells, step  # и ставится на свободную
+        shadow.apply(step)
+    return shadow
+
+
+def main_board(shadow):
+    return {key: symbol for key, symbol in shadow.cells.items() if key[0] == MAIN_BOARD}
+
+
+def test_start_position_needs_no_moves():
+    assert plan_reset(chess.Board(), {}) == []
+
+
+def test_each_piece_moves_once():
+    board = chess.Board()
+    for uci in ("e2e4", "e7e5", "g1f3", "b8c6"):
+        board.push_uci(uci)
+    plan = plan_reset(board, {})
+    assert sorted(plan) == sorted([
+        (MAIN_BOARD, CELL_BY_NAME[to], MAIN_BOARD, CELL_BY_NAME[home])
+        for home, to in (("e2", "e4"), ("e7", "e5"), ("g1", "f3"), ("b8", "c6"))
+    ])
+
+
+def test_cycle_goes_through_graveyard():
+    board = chess.Board()
+    board.set_piece_at(SQUARE_BY_NAME["a1"], chess.Piece.from_symbol("N"))
+    board.set_piece_at(SQUARE_BY_NAME["b1"], chess.Piece.from_symbol("R"))
+    plan = plan_reset(board, {})
+    assert len(plan) == 3
+    assert sum(step[2] == GRAVEYARD_BOARD for step in plan) == 1
+    assert main_board(reset(expected_cells(board, {}), board, {})) == START
+
+
+def test_captured_pieces_return_and_extra_leave():
+    board = chess.Board("rnbqkbnr/pppppppp/8/8/8/8/1PPPPPPP/QNBQKBNR w Kkq - 0 1")
+    graveyard = {CELL_BY_NAME["a2"]: "P", CELL_BY_NAME["a1"]: "R"}
+    shadow = reset(expected_cells(board, graveyard), board, graveyard)
+    assert main_board(shadow) == START
+    graveyard_pieces = [symbol for key, symbol in shadow.cells.items() if key[0] == GRAVEYARD_BOARD]
+    assert graveyard_pieces == ["Q"]  # лишний ферзь ушел на 2 доску
+
+
+def test_match_nearest():
+    matched, sources, targets = match_nearest(
+        [SQUARE_BY_NAME["a3"], SQUARE_BY_NAME["h3"]],
+        [SQUARE_BY_NAME["h1"], SQUARE_BY_NAME["a1"], SQUARE_BY_NAME["d1"]]
+    )
+    assert sorted(matched) == sorted([
+        (SQUARE_BY_NAME["a3"], SQUARE_BY_NAME["a1"]),
+        (SQUARE_BY_NAME["h3"], SQUARE_BY_NAME["h1"])
+    ])
+    assert sources == [] and targets == [SQUARE_BY_NAME["d1"]]
+
+
+def play(seed):
+    """
+    Играет случайную партию с частыми взятиями и превращениями, выполняя
+    планы ходов на модели досок, и проверяет возврат доски.
+    """
+    rng = random.Random(seed)
+    session = Session("test")
+    shadow = BoardShadow()
+    for _ in range(rng.randint(1, 300)):
+        if session.board.is_game_over():
+            break
+        moves = list(session.board.legal_moves)
+        promotions = [move for move in moves if move.promotion]
+        captures = [move for move in moves if session.board.is_capture(move)]
+        move = rng.choice(promotions or (captures if captures and rng.random() < 0.5 else moves))
+        plan = plan_move(
+            session.board, move, session.graveyard, session.arm_position,
+            session.calibration, session.stand_ins
+        )
+        for step in plan.steps:
+            assert step[:2] in shadow.cells and step[2:] not in shadow.cells, (seed, step)
+            shadow.apply(step)
+        session.make_move(move)
+        for record in plan.records:
+            session.update_graveyard(record)
+        assert not shadow.differences(session.physical_board(), session.graveyard.pieces()), seed
+    board, graveyard = shadow.position()
+    assert main_board(reset(shadow.cells, board, graveyard)) == START, seed
+
+
+def test_random_games_return_to_start():
+    for seed in range(300):
+        play(seed)
@@ -0,0 +1,81 @@
+import asyncio
+
+from timer_wheel import TimerWheel
+
+
+def run(coroutine):
+    return asyncio.run(coroutine)
+
+
+def test_timer_fires_after_delay():
+    async def main():
+        wheel = TimerWheel(tick=0.01, size=8)
+        loop = asyncio.get_running_loop()
+        start = loop.time()
+        fired = loop.create_future()
+        wheel.schedule(0.05, lambda value: fired.set_result((value, loop.time())), "done")
+        value, when = await asyncio.wait_for(fired, 1)
+        assert value == "done"
+        assert 0.05 <= when - start < 0.05 + 0.05
+        await asyncio.sleep(0.03)
+        assert len(wheel) == 0
+        assert wheel.handle is None  # без таймеров колесо не поворачивается
+
+    run(main())
+
+
+def test_timer_longer_than_one_revolution():
+    async def main():
+        wheel = TimerWheel(tick=0.01, size=4)
+        loop = asyncio.get_running_loop()
+        start = loop.time()
+        fired = []
+        wheel.schedule(0.15, lambda: fired.append(loop.time()))
+        await asyncio.sleep(0.1)
+        assert fired == []
+        await asyncio.sleep(0.1)
+        assert len(fired) == 1
+        assert fired[0] - start >= 0.15
+
+    run(main())
+
+
+def test_cancelled_timer_does_not_fire():
+    async def main():
+        wheel = TimerWheel(tick=0.01, size=8)
+        fired = []
+        timer = wheel.schedule(0.03, fired.append, "cancelled")
+        wheel.schedule(0.03, fired.append, "kept")
+        timer.cancel()
+        timer.cancel()
+        assert len(wheel) == 1
+        await asyncio.sleep(0.1)
+        assert fired == ["kept"]
+        assert len(wheel) == 0
+
+    run(main())
+
+
+def test_failing_callback_does_not_stop_wheel():
+    async def main():
+        wheel = TimerWheel(tick=0.01, size=8)
+        fired = []
+        wheel.schedule(0.02, lambda: 1 / 0)
+        wheel.schedule(0.02, fired.append, 1)
+        wheel.schedule(0.05, fired.append, 2)
+        await asyncio.sleep(0.1)
+        assert sorted(fired) == [1, 2]
+
+    run(main())
+
+
+def test_timers_fire_in_order():
+    async def main():
+        wheel = TimerWheel(tick=0.01, size=16)
+        fired = []
+        for delay in (0.08, 0.02, 0.05, 0.3):
+            wheel.schedule(delay, fired.append, delay)
+        await asyncio.sleep(0.4)
+        assert fired == [0.02, 0.05, 0.08, 0.3]
+
+    run(main())
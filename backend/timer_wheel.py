@@ -0,0 +1,115 @@
+import asyncio
+import math
+import os
+
+from dotenv import load_dotenv
+load_dotenv()
+
+TIMER_TICK = float(os.getenv("TIMER_TICK", 0.1))  # секунды, точность срабатывания таймеров
+TIMER_SLOTS = int(os.getenv("TIMER_SLOTS", 1024))  # ячеек в одном обороте колеса
+
+
+class Timer:
+    def __init__(self, wheel, slot, rounds, callback, args):
+        """
+        Отложенный вызов в колесе таймеров.
+
+        Параметры:
+            wheel (TimerWheel): колесо
+            slot (int): ячейка колеса
+            rounds (int): сколько полных оборотов пропустить
+            callback (Callable): функция, вызываемая при срабатывании
+            args (tuple): ее аргументы
+        """
+        self.wheel = wheel
+        self.slot = slot
+        self.rounds = rounds
+        self.callback = callback
+        self.args = args
+
+    def cancel(self):
+        """Отменяет таймер (повторная отмена и отмена сработавшего ничего не делают)."""
+        if self.slot is not None:
+            self.wheel.slots[self.slot].discard(self)
+            self.wheel.count -= 1
+            self.slot = None
+
+
+class TimerWheel:
+    def __init__(self, tick=TIMER_TICK, size=TIMER_SLOTS):
+        """
+        Общий планировщик таймеров сервера (хешированное колесо таймеров).
+
+        Таймер попадает в ячейку колеса по времени срабатывания; колесо
+        поворачивается на одну ячейку раз в tick секунд одним вызовом
+        loop.call_at, поэтому постановка и отмена таймера стоят O(1), а
+        тысячи часов и таймаутов не требуют отдельной задачи каждый.
+        Пока таймеров нет, колесо не поворачивается и не тратит
+        процессорное время.
+
+        Параметры:
+            tick (float): длительность одной ячейки в секундах
+            size (int): число ячеек
+        """
+        self.tick = tick
+        self.size = size
+        self.slots = [set() for _ in range(size)]
+        self.position = 0  # последняя обработанная ячейка
+        self.count = 0  # запланированных таймеров
+        self.next_tick = None  # время цикла событий следующего поворота
+        self.handle = None  # loop.call_at следующего поворота
+
+    def schedule(self, delay, callback, *args):
+        """
+        Планирует вызов callback(*args) через delay секунд.
+
+        Таймер срабатывает не раньше срока и не позже чем через tick
+        после него. Исключения callback печатаются и не останавливают
+        колесо; для асинхронной работы callback создает задачу.
+
+        Параметры:
+            delay (float): задержка в секундах
+            callback (Callable): функция
+            *args: ее аргументы
+
+        Возвращает:
+            Timer: таймер, который можно отменить
+        """
+        loop = asyncio.get_running_loop()
+        now = loop.time()
+        if self.handle is None:
+            self.next_tick = now + self.tick
+            self.handle = loop.call_at(self.next_tick, self.advance)
+        ticks = max(1, math.ceil((now + delay - self.next_tick) / self.tick) + 1)
+        slot = (self.position + ticks) % self.size
+        timer = Timer(self, slot, (ticks - 1) // self.size, callback, args)
+        self.slots[slot].add(timer)
+        self.count += 1
+        return timer
+
+    def advance(self):
+        """Поворачивает колесо до текущего времени и вызывает наступившие таймеры."""
+        loop = asyncio.get_running_loop()
+        now = loop.time()
+        due = []
+        while self.next_tick <= now: # после задержки цикла событий ячейки догоняются
+            self.position = (self.position + 1) % self.size
+            slot = self.slots[self.position]
+            for timer in list(slot):
+                if timer.rounds > 0:
+                    timer.rounds -= 1
+                    continue
+                slot.discard(timer)
+                timer.slot = None
+                self.count -= 1
+                due.append(timer)
+            self.next_tick += self.tick
+        self.handle = loop.call_at(self.next_tick, self.advance) if self.count else None
+        for timer in due:
+            try:
+                timer.callback(*timer.args)
+            except Exception as e:
+                print(f"Timer callback failed: {e}")
+
+    def __len__(self):
+        return self.count